@@ -1,4 +1,9 @@
 from django.contrib import admin
 
-# No models to register yet - all data is currently static or sent to Firebase
-# If you add models in the future, register them here
+from .models import BookVolume
+
+
+@admin.register(BookVolume)
+class BookVolumeAdmin(admin.ModelAdmin):
+    list_display = ('title', 'publisher', 'published_date', 'updated_at')
+    search_fields = ('title', 'volume_id')
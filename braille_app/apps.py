@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BrailleAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'braille_app'
+
+    def ready(self):
+        # Chunk the curated books once instead of on every selection
+        from .popular_books import prepare_popular_books
+        prepare_popular_books()
+
+        # Keep news digests warm in the background (one worker fetches per round)
+        if settings.NEWS_PREFETCH_AUTOSTART:
+            from .news_prefetch import get_news_prefetcher
+            get_news_prefetcher().start()
@@ -0,0 +1,91 @@
+"""
+Book Catalog Module for Braille Display Website
+
+Local catalog of book metadata built from the Google Books results we already
+receive. Searches run against an SQLite FTS5 index (bm25 ranking, prefix
+matching), so they take a few milliseconds and keep working while the API is
+down or over quota.
+"""
+
+import re
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import BookVolume
+
+
+FTS_TABLE = 'braille_app_bookvolume_fts'
+
+# bm25 column weights: title, authors, description
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def save_volumes(books):
+    """
+    Add or update volumes in the catalog.
+
+    Args:
+        books (list): Book dictionaries as returned by BooksService.search_books
+    """
+    with transaction.atomic():
+        for book in books:
+            if not book.get('id'):
+                continue
+            BookVolume.objects.update_or_create(
+                volume_id=book['id'],
+                defaults={
+                    'title': (book.get('title') or '')[:500],
+                    'authors': book.get('authors') or [],
+                    'description': book.get('description') or '',
+                    'publisher': (book.get('publisher') or '')[:255],
+                    'published_date': (book.get('published_date') or '')[:32],
+                    'page_count': book.get('page_count') or 0,
+                    'preview_link': book.get('preview_link') or '',
+                    'thumbnail': book.get('thumbnail') or '',
+                }
+            )
+
+
+def _fts_query(query):
+    """
+    Build an FTS5 query: every word must match, the last one as a prefix.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    if not terms:
+        return None
+    parts = [f'"{term}"' for term in terms[:-1]]
+    parts.append(f'"{terms[-1]}"*')
+    return ' '.join(parts)
+
+
+def search_catalog(query, max_results=10):
+    """
+    Search the local catalog.
+
+    Args:
+        query (str): Title, author or keyword search
+        max_results (int): Maximum number of results
+
+    Returns:
+        list: Book dictionaries, best match first
+    """
+    match = _fts_query(query or '')
+    if match is None:
+        return []
+
+    if connection.vendor != 'sqlite':
+        volumes = BookVolume.objects.filter(
+            Q(title__icontains=query) | Q(description__icontains=query)
+        )[:max_results]
+        return [volume.to_dict() for volume in volumes]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s, %s) LIMIT %s',
+            [match, *BM25_WEIGHTS, max_results]
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+
+    volumes = BookVolume.objects.in_bulk(ids)
+    return [volumes[pk].to_dict() for pk in ids if pk in volumes]
@@ -5,8 +5,30 @@ This module integrates with Google Books API to search and fetch book content.
 """
 
 from django.conf import settings
+import logging
 import requests
 from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+from .rate_limiter import get_rate_limiter, is_throttle_error
+from .metrics import counter, histogram
+from .tracing import traced
+from .book_catalog import save_volumes, search_catalog
+from .volume_cache import VolumeCache
+from .library import get_library_book
+
+logger = logging.getLogger(__name__)
+
+
+UPSTREAM_SECONDS = histogram(
+    'braille_upstream_request_seconds', 'External API call latency', ['api', 'operation']
+)
+UPSTREAM_ERRORS = counter(
+    'braille_upstream_errors_total', 'External API calls that failed', ['api', 'operation']
+)
+BOOK_SEARCHES = counter(
+    'braille_book_searches_total', 'Book searches by where the results came from', ['source']
+)
 
 
 class BooksService:
@@ -19,16 +41,27 @@ class BooksService:
         self.max_results = settings.BOOKS_SEARCH_MAX_RESULTS
         self.base_url = 'https://www.googleapis.com/books/v1/volumes'
         self.api_available = self.api_key and self.api_key != 'YOUR_GOOGLE_BOOKS_API_KEY_HERE'
+        self.volume_cache = VolumeCache()
+        
+        # Shared keep-alive session for volume lookups (sized for the fetch pool)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.BOOKS_FETCH_WORKERS)
+        self.session.mount('https://', adapter)
         
         if self.api_available:
-            print("Google Books API configured")
+            logger.info("Google Books API configured")
         else:
-            print("Google Books API not configured - using placeholder content")
+            logger.info("Google Books API not configured - using placeholder content")
     
+    @traced('books.search')
     def search_books(self, query, max_results=None):
         """
         Search for books by title, author, or keyword.
         
+        The local catalog is searched first; Google Books is only called when
+        the catalog cannot fill the page, and its results are added to the
+        catalog. If the API fails, local matches are returned instead.
+        
         Args:
             query: search query
             max_results: maximum number of results to return
@@ -39,6 +72,11 @@ class BooksService:
         if not max_results:
             max_results = self.max_results
         
+        local_books = self._search_local(query, max_results)
+        if len(local_books) >= max_results:
+            BOOK_SEARCHES.labels('catalog').inc()
+            return local_books
+        
         if self.api_available:
             try:
                 params = {
@@ -52,7 +90,9 @@ class BooksService:
                 if self.api_key:
                     params['key'] = self.api_key
                 
-                response = requests.get(self.base_url, params=params, timeout=10)
+                get_rate_limiter().acquire('google_books')
+                with UPSTREAM_SECONDS.labels('google_books', 'search').time():
+                    response = requests.get(self.base_url, params=params, timeout=10)
                 response.raise_for_status()
                 data = response.json()
                 
@@ -72,50 +112,121 @@ class BooksService:
                             'thumbnail': volume_info.get('imageLinks', {}).get('thumbnail', '')
                         })
                 
+                try:
+                    save_volumes(books)
+                except Exception as e:
+                    logger.warning("Error saving books to catalog: %s", e)
+                
+                BOOK_SEARCHES.labels('api').inc()
                 return books
             except Exception as e:
-                print(f"Error searching books: {e}")
+                logger.warning("Error searching books: %s", e)
+                UPSTREAM_ERRORS.labels('google_books', 'search').inc()
+                if is_throttle_error(e):
+                    get_rate_limiter().report_throttled('google_books')
+        
+        if local_books:
+            BOOK_SEARCHES.labels('catalog').inc()
+            return local_books
         
         # Fallback to placeholder
+        BOOK_SEARCHES.labels('placeholder').inc()
         return self._get_placeholder_books(query)
     
+    def _search_local(self, query, max_results):
+        """
+        Search the local FTS5 catalog, ignoring database errors.
+        """
+        try:
+            return search_catalog(query, max_results)
+        except Exception as e:
+            logger.warning("Error searching local catalog: %s", e)
+            return []
+    
     def get_book_details(self, book_id):
         """
         Get detailed information about a specific book.
         
+        Volume JSON is served from the read-through volume cache and only
+        revalidated with Google Books after settings.BOOKS_VOLUME_CACHE_TTL.
+        
         Args:
             book_id: Google Books volume ID
         
         Returns:
             dict: Book details
         """
-        if self.api_available:
-            try:
-                url = f"{self.base_url}/{book_id}"
-                params = {}
-                if self.api_key:
-                    params['key'] = self.api_key
-                
-                response = requests.get(url, params=params, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-                
-                volume_info = data.get('volumeInfo', {})
-                return {
-                    'id': data.get('id'),
-                    'title': volume_info.get('title', 'Unknown Title'),
-                    'authors': volume_info.get('authors', ['Unknown Author']),
-                    'description': volume_info.get('description', 'No description available.'),
-                    'publisher': volume_info.get('publisher', 'Unknown'),
-                    'published_date': volume_info.get('publishedDate', 'Unknown'),
-                    'page_count': volume_info.get('pageCount', 0),
-                    'content': self._extract_content(data),
-                    'preview_link': volume_info.get('previewLink', ''),
-                }
-            except Exception as e:
-                print(f"Error getting book details: {e}")
+        if not self.api_available:
+            return None
+        
+        data = self.volume_cache.get(book_id, lambda etag: self._fetch_volume(book_id, etag))
+        if not data:
+            return None
         
-        return None
+        volume_info = data.get('volumeInfo', {})
+        return {
+            'id': data.get('id'),
+            'title': volume_info.get('title', 'Unknown Title'),
+            'authors': volume_info.get('authors', ['Unknown Author']),
+            'description': volume_info.get('description', 'No description available.'),
+            'publisher': volume_info.get('publisher', 'Unknown'),
+            'published_date': volume_info.get('publishedDate', 'Unknown'),
+            'page_count': volume_info.get('pageCount', 0),
+            'content': self._extract_content(data),
+            'preview_link': volume_info.get('previewLink', ''),
+        }
+    
+    def get_books_details(self, book_ids):
+        """
+        Get details for several books concurrently.
+        
+        Lookups run on a small thread pool, so a result page needs about one
+        round-trip instead of one per book.
+        
+        Args:
+            book_ids: list of Google Books volume IDs
+        
+        Returns:
+            list: Book details in the same order (None for books that failed)
+        """
+        if not book_ids:
+            return []
+        
+        workers = min(len(book_ids), settings.BOOKS_FETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='books-fetch') as pool:
+            return list(pool.map(self.get_book_details, book_ids))
+    
+    @traced('books.volume')
+    def _fetch_volume(self, book_id, etag=None):
+        """
+        Fetch volume JSON from Google Books, revalidating with If-None-Match.
+        
+        Returns:
+            tuple: (status code, volume JSON or None, ETag)
+        """
+        url = f"{self.base_url}/{book_id}"
+        params = {}
+        if self.api_key:
+            params['key'] = self.api_key
+        
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        
+        try:
+            get_rate_limiter().acquire('google_books')
+            with UPSTREAM_SECONDS.labels('google_books', 'volume').time():
+                response = self.session.get(url, params=params, headers=headers, timeout=10)
+            if response.status_code == 304:
+                return 304, None, etag
+            response.raise_for_status()
+            return response.status_code, response.json(), response.headers.get('ETag')
+        except Exception as e:
+            logger.warning("Error getting book details: %s", e, extra={'book_id': book_id})
+            UPSTREAM_ERRORS.labels('google_books', 'volume').inc()
+            if is_throttle_error(e):
+                get_rate_limiter().report_throttled('google_books')
+            raise
     
     def _extract_content(self, book_data):
         """
@@ -187,11 +298,16 @@ class BooksService:
             }
         ]
     
-    def get_book_content_for_reading(self, book_id):
+    def get_book_content_for_reading(self, book_id, device_id=None):
         """
         Get book content formatted for chapter-by-chapter reading.
         Note: Full text access is limited by Google Books API.
         """
+        # Books imported into the local library have full text, windowed for the device
+        library_book = get_library_book(book_id)
+        if library_book:
+            return library_book.as_reading_content(device_id)
+        
         # For actual reading, we'll use our placeholder content
         # Real implementation would need full text access via publishers
         
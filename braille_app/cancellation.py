@@ -0,0 +1,87 @@
+"""
+Delivery Cancellation Module for Braille Display Website
+
+Latest-wins delivery sessions per device. Each device has a generation counter
+in the shared state database; starting a delivery bumps it and hands the sender
+a CancelToken for the new generation. When a newer delivery starts, or the user
+says "stop", the counter moves on and every older token reports cancelled, in
+whichever worker it lives. Senders check their token before each write, so
+abandoned content stops costing upstream writes after at most one chunk.
+"""
+
+from .shared_state import ensure_table, get_connection, transaction
+
+
+GENERATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS device_generations (
+        device_id TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL
+    )
+"""
+
+
+class CancelToken:
+    """
+    Handle on one delivery session of a device.
+    """
+
+    def __init__(self, device_id, generation):
+        self.device_id = device_id
+        self.generation = generation
+
+    @property
+    def cancelled(self):
+        """
+        True once a newer delivery started or the device was stopped.
+        """
+        return current_generation(self.device_id) != self.generation
+
+
+def _bump(device_id):
+    ensure_table('device_generations', GENERATIONS_DDL)
+    with transaction() as conn:
+        conn.execute(
+            'INSERT INTO device_generations (device_id, generation) VALUES (?, 1) '
+            'ON CONFLICT(device_id) DO UPDATE SET generation = generation + 1',
+            (device_id,)
+        )
+        (generation,) = conn.execute(
+            'SELECT generation FROM device_generations WHERE device_id = ?', (device_id,)
+        ).fetchone()
+    return generation
+
+
+def current_generation(device_id):
+    """
+    Current delivery generation of a device (0 if it never had one).
+    """
+    ensure_table('device_generations', GENERATIONS_DDL)
+    row = get_connection().execute(
+        'SELECT generation FROM device_generations WHERE device_id = ?', (device_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def begin_delivery(device_id, supersede=True):
+    """
+    Start a delivery session on a device.
+
+    Args:
+        device_id (str): Device id
+        supersede (bool): Cancel any delivery in progress (latest wins). With
+            False the new session joins the current generation; call this
+            after waiting for the device so earlier sessions have finished.
+
+    Returns:
+        CancelToken: Token for the new session
+    """
+    if supersede:
+        return CancelToken(device_id, _bump(device_id))
+    return CancelToken(device_id, current_generation(device_id))
+
+
+def cancel_delivery(device_id):
+    """
+    Cancel whatever is being delivered to a device.
+    """
+    _bump(device_id)
@@ -0,0 +1,231 @@
+"""
+Near-Duplicate Detection Module for Braille Display Website
+
+The same story is often listed under several news categories. Reading it twice
+costs minutes of tactile reading, so articles already delivered to a reader are
+skipped. Articles are compared with MinHash signatures over character shingles
+and looked up through LSH bands, so a check touches only a handful of buckets
+instead of every delivered article.
+
+The index keeps only the band hashes of the most recent articles and is small
+enough to live in the reader's session.
+"""
+
+import hashlib
+import re
+import struct
+from collections import deque
+from datetime import date
+from django.conf import settings
+
+from .shared_state import ensure_table, get_connection, transaction
+
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 5
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed permutation parameters so signatures are stable across processes
+_PERMUTATIONS = [
+    struct.unpack('<QQ', hashlib.blake2b(f'minhash-{i}'.encode(), digest_size=16).digest())
+    for i in range(NUM_PERMUTATIONS)
+]
+_PERMUTATIONS = [(a % _MERSENNE_PRIME or 1, b % _MERSENNE_PRIME) for a, b in _PERMUTATIONS]
+
+STATS_DDL = """
+    CREATE TABLE IF NOT EXISTS dedup_stats (
+        day TEXT PRIMARY KEY,
+        articles_skipped INTEGER NOT NULL,
+        cells_saved INTEGER NOT NULL
+    )
+"""
+
+
+def _shingles(text):
+    normalized = ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(text):
+    """
+    Compute the MinHash signature of a text.
+
+    Args:
+        text (str): Article title and description
+
+    Returns:
+        list: NUM_PERMUTATIONS minimum hash values
+    """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'little')
+        for s in _shingles(text)
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(signature):
+    """
+    Split a signature into LSH band keys.
+
+    Texts whose Jaccard similarity is about 0.5 or higher almost always share
+    at least one band.
+
+    Returns:
+        list: One integer key per band (band index mixed in)
+    """
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'<I{ROWS_PER_BAND}I', band, *rows), digest_size=6).digest()
+        keys.append(int.from_bytes(digest, 'little'))
+    return keys
+
+
+def article_text(article):
+    """Text used to compare articles (title plus description)."""
+    return f"{article.get('title') or ''} {article.get('content') or ''}"
+
+
+class DeliveredIndex:
+    """
+    LSH index of recently delivered articles with a bounded window.
+
+    Only band keys are stored. When the window is full the oldest article's
+    keys are removed from the buckets.
+    """
+
+    def __init__(self, window=None):
+        self.window = window or settings.NEWS_DEDUP_WINDOW
+        self._entries = deque()
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def contains(self, text):
+        """
+        Check whether a near-duplicate of `text` was delivered.
+
+        Returns:
+            bool: True if any LSH band matches a delivered article
+        """
+        return self.matches(band_keys(minhash_signature(text)))
+
+    def matches(self, keys):
+        """Check precomputed band keys against the index."""
+        return any(key in self._buckets for key in keys)
+
+    def add(self, text):
+        """
+        Record a delivered article, evicting the oldest one if the window is full.
+        """
+        self.add_keys(band_keys(minhash_signature(text)))
+
+    def add_keys(self, keys):
+        """Record precomputed band keys."""
+        self._entries.append(keys)
+        for key in keys:
+            self._buckets[key] = self._buckets.get(key, 0) + 1
+
+        while len(self._entries) > self.window:
+            for key in self._entries.popleft():
+                if self._buckets[key] <= 1:
+                    del self._buckets[key]
+                else:
+                    self._buckets[key] -= 1
+
+    def to_list(self):
+        """Serialise for storage in the session."""
+        return [list(keys) for keys in self._entries]
+
+    @classmethod
+    def from_list(cls, entries, window=None):
+        """Rebuild an index stored with to_list()."""
+        index = cls(window)
+        for keys in entries or []:
+            index.add_keys(keys)
+        return index
+
+
+def filter_delivered(session, articles):
+    """
+    Drop articles the reader has already received (and repeats within the
+    batch). Nothing is recorded; call mark_delivered() once the send succeeded.
+
+    Args:
+        session: request.session (the index is stored under 'delivered_articles')
+        articles (list): Article dictionaries about to be delivered
+
+    Returns:
+        list: Articles that are new to this reader
+    """
+    index = DeliveredIndex.from_list(session.get('delivered_articles'))
+    # Extra capacity so repeats within this batch are caught as well
+    index.window += len(articles)
+
+    fresh = []
+    skipped_cells = 0
+    for article in articles:
+        text = article_text(article)
+        keys = band_keys(minhash_signature(text))
+        if index.matches(keys):
+            skipped_cells += len(text)
+            continue
+        fresh.append(article)
+        index.add_keys(keys)
+
+    if skipped_cells:
+        record_skipped(len(articles) - len(fresh), skipped_cells)
+
+    return fresh
+
+
+def mark_delivered(session, articles):
+    """
+    Record articles that reached the reader's device.
+
+    Args:
+        session: request.session (the index is stored under 'delivered_articles')
+        articles (list): Article dictionaries that were delivered
+    """
+    index = DeliveredIndex.from_list(session.get('delivered_articles'))
+    for article in articles:
+        index.add(article_text(article))
+    session['delivered_articles'] = index.to_list()
+
+
+def record_skipped(articles, cells):
+    """
+    Add suppressed articles to today's totals (one braille cell per character).
+    """
+    ensure_table('dedup_stats', STATS_DDL)
+    with transaction() as conn:
+        conn.execute(
+            'INSERT INTO dedup_stats (day, articles_skipped, cells_saved) VALUES (?, ?, ?) '
+            'ON CONFLICT(day) DO UPDATE SET articles_skipped = articles_skipped + excluded.articles_skipped, '
+            'cells_saved = cells_saved + excluded.cells_saved',
+            (date.today().isoformat(), articles, cells)
+        )
+
+
+def get_dedup_stats(days=30):
+    """
+    Get articles skipped and braille cells saved per day.
+
+    Returns:
+        list: Dictionaries with day, articles_skipped and cells_saved (newest first)
+    """
+    ensure_table('dedup_stats', STATS_DDL)
+    rows = get_connection().execute(
+        'SELECT day, articles_skipped, cells_saved FROM dedup_stats ORDER BY day DESC LIMIT ?', (days,)
+    ).fetchall()
+    return [{'day': d, 'articles_skipped': a, 'cells_saved': c} for d, a, c in rows]
@@ -0,0 +1,125 @@
+"""
+Delivery Events Module for Braille Display Website
+
+Server-sent events with the live progress of a delivery job, so the helper
+pages can show each chunk as it reaches the device instead of waiting for the
+whole delivery. The stream polls the job row and emits:
+
+    state    the job's status changed (queued, running, done, failed, cancelled)
+    acked    Firebase accepted a chunk (the event id is the chunk number)
+    error    an attempt failed (retrying: true) or the job gave up
+
+The stream ends once the job is finished. A browser that reconnects sends the
+last event id it saw, and the stream continues after that chunk.
+
+Under ASGI (the deployed setup, see the Procfile) the stream is an async
+generator polled from the event loop, so an open stream does not tie up a
+worker. A sync WSGI worker must never be held by a stream: there each request
+answers with what changed and ends, and the browser polls by reconnecting
+after DELIVERY_EVENTS_WSGI_RETRY_MS.
+"""
+
+import asyncio
+import json
+import time
+from django.conf import settings
+
+from .models import DeliveryJob
+
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+KEEPALIVE_SECONDS = 15
+
+_FIELDS = ('status', 'acked_chunks', 'chunks', 'error')
+
+
+def _event(name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _changes(row, seen):
+    """
+    Events for what changed since the last poll; updates `seen`.
+    """
+    total = len(row['chunks'])
+    events = []
+
+    for chunk in range(seen['acked'] + 1, row['acked_chunks'] + 1):
+        events.append(_event('acked', {'chunk': chunk, 'total': total}, event_id=chunk))
+    seen['acked'] = max(seen['acked'], row['acked_chunks'])
+
+    if row['status'] != seen['status']:
+        seen['status'] = row['status']
+        state = {'status': row['status'], 'acked': seen['acked'], 'total': total}
+        if row['status'] == 'failed':
+            state['error'] = row['error']
+        events.append(_event('state', state))
+        if row['status'] == 'failed':
+            events.append(_event('error', {'message': row['error'], 'retrying': False}))
+    if row['error'] and row['error'] != seen['error'] and row['status'] != 'failed':
+        events.append(_event('error', {'message': row['error'], 'retrying': True}))
+    seen['error'] = row['error']
+
+    return events
+
+
+def _start(last_event_id):
+    try:
+        acked = int(last_event_id or 0)
+    except ValueError:
+        acked = 0
+    return {'acked': acked, 'status': None, 'error': ''}
+
+
+def _missing(job_id):
+    return _event('error', {'message': f"Unknown delivery job: {job_id}", 'retrying': False})
+
+
+def job_events(job_id, last_event_id=None):
+    """
+    Events for a job since `last_event_id`, in one short response (for WSGI).
+    """
+    seen = _start(last_event_id)
+
+    yield f'retry: {settings.DELIVERY_EVENTS_WSGI_RETRY_MS}\n\n'
+    row = DeliveryJob.objects.filter(pk=job_id).values(*_FIELDS).first()
+    if row is None:
+        yield _missing(job_id)
+        return
+
+    events = _changes(row, seen)
+    if events:
+        yield ''.join(events)
+
+
+async def ajob_events(job_id, last_event_id=None):
+    """
+    Event stream for a job (async generator, for ASGI).
+    """
+    seen = _start(last_event_id)
+    deadline = time.monotonic() + settings.DELIVERY_EVENTS_MAX_SECONDS
+    quiet_since = time.monotonic()
+
+    yield f'retry: {settings.DELIVERY_EVENTS_RETRY_MS}\n\n'
+    while time.monotonic() < deadline:
+        row = await DeliveryJob.objects.filter(pk=job_id).values(*_FIELDS).afirst()
+        if row is None:
+            yield _missing(job_id)
+            return
+
+        events = _changes(row, seen)
+        if events:
+            yield ''.join(events)
+            quiet_since = time.monotonic()
+        elif time.monotonic() - quiet_since >= KEEPALIVE_SECONDS:
+            yield ': keep-alive\n\n'
+            quiet_since = time.monotonic()
+
+        if row['status'] in FINISHED_STATUSES:
+            return
+        await asyncio.sleep(settings.DELIVERY_EVENTS_POLL_INTERVAL)
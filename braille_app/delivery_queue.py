@@ -0,0 +1,581 @@
+"""
+Delivery Queue Module for Braille Display Website
+
+Durable delivery jobs. A send endpoint inserts a DeliveryJob row and returns
+at once; delivery workers claim jobs and write them to the device chunk by
+chunk, recording each acknowledged chunk. Because jobs live in the database,
+a restart (Render recycling the free-plan instance, a deploy) only pauses a
+delivery: once the dead worker's lease runs out, another worker resumes at
+the last acknowledged chunk.
+
+Workers claim jobs in a `BEGIN IMMEDIATE` transaction (see the DATABASES
+transaction_mode), so two workers never take the same job, and a device
+never has two running jobs. Each worker runs up to `concurrency` jobs at a
+time; throughput scales with the number of worker processes:
+
+    python manage.py run_delivery_worker --concurrency 8
+
+A web process starts a worker thread of its own when no worker has checked
+in recently (DELIVERY_WORKER_AUTOSTART None, the default), so `runserver`
+and single-process deployments deliver without extra setup; True always
+starts one, False never does. Workers delete finished jobs older than
+DELIVERY_JOB_RETENTION_DAYS as they go.
+
+Jobs go in one of three priority lanes: 'interactive' (answers to what the
+user just asked for), 'notification' (short notices) and 'bulk' (long
+content such as news digests). Workers claim the most urgent lane first. A
+job queued for a device that is streaming a less urgent job preempts it:
+the stream stops after the chunk being written, the new job runs, and the
+preempted job resumes at the chunk the reader was on.
+
+Repeated sends are cheap: a send whose content is already on the device (or
+on its way there), or that carries the `Idempotency-Key` of an earlier send,
+gets the existing job back instead of rewriting every chunk. A key is stored
+with a hash of the request it came with; reusing it for a different request
+raises IdempotencyConflict.
+"""
+
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DeliveryJob
+from .devices import DeviceError, get_device_profile
+from .device_lock import DeviceBusy, DeviceLock
+from .cancellation import begin_delivery, cancel_delivery, current_generation
+from .firebase_service import FirebaseService, send_text_to_braille_device
+from .metrics import counter, gauge
+from .resilience import deadline_scope
+from .shared_state import ensure_table, get_connection
+
+logger = logging.getLogger(__name__)
+
+
+JOBS_FINISHED = counter('braille_delivery_jobs_total', 'Delivery jobs finished by outcome', ['status'])
+JOBS_RUNNING = gauge('braille_delivery_jobs_running', 'Delivery jobs being run by workers')
+JOBS_PREEMPTED = counter('braille_delivery_jobs_preempted_total', 'Delivery jobs paused for a more urgent one')
+DUPLICATE_SENDS = counter(
+    'braille_delivery_duplicates_total', 'Sends answered with an existing delivery job', ['reason']
+)
+
+PRIORITIES = {'interactive': 0, 'notification': 1, 'bulk': 2}
+
+WORKERS_DDL = """
+    CREATE TABLE IF NOT EXISTS delivery_workers (
+        owner TEXT PRIMARY KEY,
+        seen_at REAL NOT NULL
+    )
+"""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an Idempotency-Key is reused for a different request."""
+
+
+def request_hash(content):
+    """
+    Hash of a request's content, stored with its Idempotency-Key.
+
+    Args:
+        content: Text, bytes, or an iterable of byte chunks (e.g. UploadedFile.chunks())
+    """
+    digest = hashlib.sha1()
+    for part in [content] if isinstance(content, (str, bytes)) else content:
+        digest.update(part.encode('utf-8') if isinstance(part, str) else part)
+    return digest.hexdigest()[:16]
+
+
+def _keyed_job(device_id, idempotency_key, fingerprint):
+    job = DeliveryJob.objects.filter(device_id=device_id, idempotency_key=idempotency_key).first()
+    if job is not None and job.request_hash != fingerprint:
+        raise IdempotencyConflict(f"Idempotency-Key {idempotency_key} was used for a different request")
+    return job
+
+
+def idempotent_job(idempotency_key, device_id=None, fingerprint=''):
+    """
+    Job created earlier for a device with this Idempotency-Key, or None.
+
+    Args:
+        idempotency_key (str): Client key identifying the request
+        device_id (str): Target device (defaults to settings.DEFAULT_DEVICE_ID)
+        fingerprint (str): request_hash() of the request
+
+    Raises:
+        IdempotencyConflict: If the key came with a different request
+    """
+    if not idempotency_key:
+        return None
+    device_id = get_device_profile(device_id).device_id
+    return _keyed_job(device_id, idempotency_key, fingerprint)
+
+
+def _duplicate_of(device_id, content_hash):
+    """
+    Job that already carries this content to the device, or None.
+    """
+    latest = (
+        DeliveryJob.objects
+        .filter(device_id=device_id)
+        .exclude(status__in=('cancelled', 'failed'))
+        .order_by('-created_at', '-id')
+        .first()
+    )
+    if latest is not None and latest.content_hash == content_hash:
+        # A delivered job still shows unless something was written since
+        if latest.status != 'done' or latest.generation == current_generation(device_id):
+            return latest
+        return None
+    # Preempted behind a more urgent job, but still on its way
+    return DeliveryJob.objects.filter(
+        device_id=device_id, content_hash=content_hash, status__in=('queued', 'running')
+    ).first()
+
+
+def enqueue_delivery(text, device_id=None, chunks=None, priority='interactive', idempotency_key='',
+                     fingerprint=''):
+    """
+    Queue text for delivery to a device. Latest wins within a lane: jobs of
+    the same priority still queued or running for the device are cancelled.
+    A running job of a less urgent lane is preempted.
+
+    A repeated send gets the existing job back: one with the same
+    idempotency key, or one whose identical content is on the device or on
+    its way there.
+
+    Args:
+        text (str): Text to deliver
+        device_id (str): Target device (defaults to settings.DEFAULT_DEVICE_ID)
+        chunks (list): Pre-chunked text (reused if it fits the device)
+        priority (str): 'interactive', 'notification' or 'bulk'
+        idempotency_key (str): Client key identifying this send
+        fingerprint (str): request_hash() of the request (defaults to the hash of `text`)
+
+    Returns:
+        tuple: (DeliveryJob, created) - created is False for a repeated send
+
+    Raises:
+        DeviceError: If the device is unknown
+        ValueError: If the priority is unknown
+        IdempotencyConflict: If the key came with a different request
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown delivery priority: {priority}")
+    lane = PRIORITIES[priority]
+    profile = get_device_profile(device_id)
+    content_hash = FirebaseService.content_version(text)
+    fingerprint = fingerprint or request_hash(text)
+
+    # The IMMEDIATE transaction serialises concurrent sends, so a double
+    # click cannot slip two jobs past the duplicate check
+    with transaction.atomic():
+        existing = None
+        if idempotency_key:
+            existing = _keyed_job(profile.device_id, idempotency_key, fingerprint)
+            reason = 'idempotency_key'
+        if existing is None:
+            existing = _duplicate_of(profile.device_id, content_hash)
+            reason = 'content'
+        if existing is not None:
+            DUPLICATE_SENDS.labels(reason).inc()
+            return existing, False
+
+        chunks = FirebaseService._chunks_for(profile, text, chunks)
+        pending = DeliveryJob.objects.filter(device_id=profile.device_id, status__in=('queued', 'running'))
+        pending.filter(priority=lane).update(status='cancelled', finished_at=timezone.now())
+        # Leave a more urgent job on the device alone; anything else stops
+        urgent_running = pending.filter(status='running', priority__lt=lane).exists()
+        job = DeliveryJob.objects.create(
+            device_id=profile.device_id, text=text, chunks=chunks, priority=lane,
+            content_hash=content_hash, idempotency_key=idempotency_key,
+            request_hash=fingerprint if idempotency_key else '',
+        )
+    if not urgent_running:
+        # Stops (or preempts) a running job or inline stream within one chunk
+        cancel_delivery(profile.device_id)
+
+    autostart = settings.DELIVERY_WORKER_AUTOSTART
+    if autostart or (autostart is None and not worker_alive()):
+        get_delivery_worker().start()
+    get_delivery_worker().wake()
+    return job, True
+
+
+def stop_jobs(device_id=None):
+    """
+    Cancel every queued, running or preempted job of a device and stop the
+    stream in progress within one chunk (voice "stop").
+
+    Returns:
+        int: Jobs cancelled
+    """
+    device_id = get_device_profile(device_id).device_id
+    cancelled = DeliveryJob.objects.filter(device_id=device_id, status__in=('queued', 'running')).update(
+        status='cancelled', owner='', lease_expires_at=None, finished_at=timezone.now()
+    )
+    # After the rows: a worker that notices the new generation finds nothing to resume
+    cancel_delivery(device_id)
+    return cancelled
+
+
+def deliver_text(text, device_id=None, chunks=None, priority='interactive', idempotency_key='', fingerprint=''):
+    """
+    Send text to a device through the job queue, or inline when
+    settings.DELIVERY_QUEUE is off.
+
+    Args:
+        text (str): Text to deliver
+        device_id (str): Target device (defaults to settings.DEFAULT_DEVICE_ID)
+        chunks (list): Pre-chunked text (reused if it fits the device)
+        priority (str): Delivery lane (see enqueue_delivery)
+        idempotency_key (str): Client key identifying this send
+        fingerprint (str): request_hash() of the request (defaults to the hash of `text`)
+
+    Returns:
+        dict: Result with status and, for queued sends, the job id
+        (status 'conflict' if the key came with a different request)
+    """
+    if not settings.DELIVERY_QUEUE:
+        return send_text_to_braille_device(text, chunks=chunks, device_id=device_id)
+    if not text:
+        return {'status': 'error', 'message': 'No text provided'}
+
+    try:
+        job, created = enqueue_delivery(text, device_id, chunks, priority, idempotency_key, fingerprint)
+    except DeviceError as e:
+        return {'status': 'error', 'message': str(e)}
+    except IdempotencyConflict as e:
+        return {'status': 'conflict', 'message': str(e)}
+
+    result = job.to_dict()
+    result['status'] = 'success'
+    result['duplicate'] = not created
+    name = get_device_profile(job.device_id).name
+    if created:
+        result['message'] = f"Queued {job.total_chunks} chunk(s) for {name}"
+    elif job.status == 'done':
+        result['message'] = f"Already on {name}"
+    else:
+        result['message'] = f"Already being sent to {name}"
+    return result
+
+
+def worker_alive():
+    """
+    True if a delivery worker, in any process, checked in within a lease.
+    """
+    ensure_table('delivery_workers', WORKERS_DDL)
+    row = get_connection().execute(
+        'SELECT 1 FROM delivery_workers WHERE seen_at > ? LIMIT 1',
+        (time.time() - settings.DELIVERY_LEASE_SECONDS,)
+    ).fetchone()
+    return row is not None
+
+
+def _check_in(owner, alive=True):
+    ensure_table('delivery_workers', WORKERS_DDL)
+    if alive:
+        get_connection().execute(
+            'INSERT INTO delivery_workers (owner, seen_at) VALUES (?, ?) '
+            'ON CONFLICT(owner) DO UPDATE SET seen_at = excluded.seen_at',
+            (owner, time.time())
+        )
+    else:
+        get_connection().execute('DELETE FROM delivery_workers WHERE owner = ?', (owner,))
+
+
+def prune_jobs(days=None):
+    """
+    Delete done, failed and cancelled jobs that finished more than `days`
+    (settings.DELIVERY_JOB_RETENTION_DAYS) ago.
+
+    Returns:
+        int: Jobs deleted
+    """
+    days = settings.DELIVERY_JOB_RETENTION_DAYS if days is None else days
+    deleted, _ = DeliveryJob.objects.filter(
+        status__in=('done', 'failed', 'cancelled'),
+        finished_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
+
+
+def claim_job(owner, lease_seconds=None):
+    """
+    Claim the most urgent, then oldest, runnable job: queued (and due), or
+    running with an expired lease, on a device with no other running job.
+
+    Returns:
+        DeliveryJob: The claimed job, or None
+    """
+    lease_seconds = lease_seconds or settings.DELIVERY_LEASE_SECONDS
+    now = timezone.now()
+
+    with transaction.atomic():
+        busy_devices = DeliveryJob.objects.filter(status='running', lease_expires_at__gt=now).values('device_id')
+        job = (
+            DeliveryJob.objects
+            .filter(Q(status='queued') | Q(status='running', lease_expires_at__lte=now))
+            .filter(Q(run_after__isnull=True) | Q(run_after__lte=now))
+            .exclude(device_id__in=busy_devices)
+            .order_by('priority', 'created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        DeliveryJob.objects.filter(pk=job.pk).update(
+            status='running',
+            owner=owner,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+    job.refresh_from_db()
+    return job
+
+
+class DeliveryWorker:
+    """
+    Claims delivery jobs and runs up to `concurrency` of them at a time.
+    """
+
+    def __init__(self, concurrency=None, lease_seconds=None, poll_interval=None):
+        self.concurrency = concurrency or settings.DELIVERY_WORKER_CONCURRENCY
+        self.lease_seconds = lease_seconds or settings.DELIVERY_LEASE_SECONDS
+        self.poll_interval = settings.DELIVERY_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.owner = f'{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # ---- job execution ----
+
+    def _ack(self, job, acked):
+        """
+        Record acknowledged chunks and renew the lease in one update.
+
+        Returns:
+            bool: False if the job is no longer ours (lease lost or cancelled)
+        """
+        renewed = DeliveryJob.objects.filter(pk=job.pk, owner=self.owner, status='running').update(
+            acked_chunks=acked,
+            preempted=False,
+            lease_expires_at=timezone.now() + timedelta(seconds=self.lease_seconds),
+            updated_at=timezone.now(),
+        )
+        job.acked_chunks = acked
+        job.preempted = False
+        return renewed == 1
+
+    def _finish(self, job, status, error=''):
+        # A finished delivery is what the device shows until its generation moves on
+        generation = current_generation(job.device_id) if status == 'done' else None
+        DeliveryJob.objects.filter(pk=job.pk, owner=self.owner, status='running').update(
+            status=status, error=error, owner='', lease_expires_at=None, finished_at=timezone.now(),
+            generation=generation,
+        )
+        job.status = status
+        JOBS_FINISHED.labels(status).inc()
+
+    def _requeue(self, job, error='', preempted=False):
+        """
+        Hand a job back to the queue; it resumes at its last acknowledged chunk
+        (or, when preempted, at the chunk that was interrupted on the display).
+        """
+        if error and job.attempts >= settings.DELIVERY_MAX_ATTEMPTS:
+            self._finish(job, 'failed', error)
+            return
+        run_after = timezone.now() + timedelta(seconds=min(60, 2 ** job.attempts)) if error else None
+        DeliveryJob.objects.filter(pk=job.pk, owner=self.owner, status='running').update(
+            status='queued', owner='', lease_expires_at=None, run_after=run_after, error=error,
+            preempted=preempted or job.preempted,
+        )
+        job.status = 'queued'
+
+    def _stop_stream(self, job):
+        """
+        The device's delivery generation moved on: give way to a more urgent
+        job if one is queued for the device, otherwise the job was replaced
+        or stopped.
+        """
+        urgent = DeliveryJob.objects.filter(
+            device_id=job.device_id, status='queued', priority__lt=job.priority
+        ).exists()
+        if urgent:
+            JOBS_PREEMPTED.inc()
+            self._requeue(job, preempted=True)
+        else:
+            self._finish(job, 'cancelled')
+
+    def run_job(self, job):
+        """
+        Deliver a claimed job, from its last acknowledged chunk.
+        """
+        try:
+            profile = get_device_profile(job.device_id)
+        except DeviceError as e:
+            self._finish(job, 'failed', str(e))
+            return
+
+        # Writes must finish while the lease holds; after that another worker
+        # may resume the job and repeat them
+        leased_at = time.monotonic()
+        if profile.format != 'stream':
+            # One write: the device pages through the content itself
+            with deadline_scope(self.lease_seconds):
+                result = FirebaseService.send_text_to_device(job.text, chunks=job.chunks, device_id=job.device_id)
+            if result['status'] == 'success':
+                self._ack(job, job.total_chunks)
+                self._finish(job, 'done')
+            else:
+                self._requeue(job, result.get('message', 'Delivery failed'))
+            return
+
+        try:
+            with DeviceLock(profile.device_id) as lock:
+                token = begin_delivery(profile.device_id, supersede=False)
+                # A preempting job replaced the chunk on the display; show it again
+                start = job.acked_chunks - 1 if job.preempted and job.acked_chunks else job.acked_chunks
+                for i in range(start, job.total_chunks):
+                    if token.cancelled:
+                        self._stop_stream(job)
+                        return
+                    if not lock.renew():
+                        self._finish(job, 'cancelled')
+                        return
+                    if self._stop.is_set():
+                        self._requeue(job)
+                        return
+
+                    with deadline_scope(self.lease_seconds - (time.monotonic() - leased_at)):
+                        FirebaseService._write(
+                            profile.path, FirebaseService.stream_payload(job.chunks[i], i, job.total_chunks, lock.token)
+                        )
+                    if not self._ack(job, i + 1):
+                        return  # cancelled in the database or taken over
+                    leased_at = time.monotonic()
+
+                    if i < job.total_chunks - 1 and profile.refresh_seconds > 0:
+                        FirebaseService._pause(profile.refresh_seconds, token)
+            self._finish(job, 'done')
+        except DeviceBusy as e:
+            self._requeue(job, str(e))
+        except Exception as e:
+            logger.warning("Delivery job %s failed at chunk %d: %s", job.pk, job.acked_chunks, e,
+                           extra={'device_id': job.device_id})
+            self._requeue(job, str(e))
+
+    def _run_claimed(self, job):
+        JOBS_RUNNING.labels().inc()
+        try:
+            self.run_job(job)
+        finally:
+            JOBS_RUNNING.labels().dec()
+            close_old_connections()
+            self.wake()  # a slot is free
+
+    # ---- scheduling ----
+
+    def run_once(self):
+        """
+        Run jobs until none is runnable, then return (for tests and cron).
+
+        Returns:
+            int: Jobs run
+        """
+        ran = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='delivery') as pool:
+            while True:
+                futures = []
+                while len(futures) < self.concurrency:
+                    job = claim_job(self.owner, self.lease_seconds)
+                    if job is None:
+                        break
+                    futures.append(pool.submit(self._run_claimed, job))
+                if not futures:
+                    return ran
+                for future in futures:
+                    future.result()
+                ran += len(futures)
+
+    def run_forever(self):
+        """
+        Claim and run jobs until stop() is called, checking in every third of
+        a lease and pruning old jobs every DELIVERY_PRUNE_INTERVAL seconds.
+        """
+        running = set()
+        checked_in = pruned = 0.0
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='delivery') as pool:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                try:
+                    if now - checked_in >= self.lease_seconds / 3:
+                        _check_in(self.owner)
+                        checked_in = now
+                    if now - pruned >= settings.DELIVERY_PRUNE_INTERVAL:
+                        pruned = now
+                        prune_jobs()
+                except Exception as e:
+                    logger.warning("Delivery worker housekeeping failed: %s", e)
+                running = {future for future in running if not future.done()}
+                job = None
+                if len(running) < self.concurrency:
+                    try:
+                        job = claim_job(self.owner, self.lease_seconds)
+                    except Exception as e:
+                        logger.exception("Could not claim delivery job: %s", e)
+                if job is not None:
+                    running.add(pool.submit(self._run_claimed, job))
+                    continue
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        try:
+            _check_in(self.owner, alive=False)
+        except Exception as e:
+            logger.warning("Delivery worker could not check out: %s", e)
+        close_old_connections()
+
+    def wake(self):
+        """
+        Check for new jobs now instead of at the next poll.
+        """
+        self._wake.set()
+
+    def start(self):
+        """
+        Start the worker in a daemon thread.
+        """
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='delivery-worker', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop claiming jobs; running jobs are handed back at their next chunk.
+        """
+        self._stop.set()
+        self.wake()
+
+
+# Singleton instance
+_delivery_worker = None
+
+def get_delivery_worker():
+    """Get or create the DeliveryWorker of this process."""
+    global _delivery_worker
+    if _delivery_worker is None:
+        _delivery_worker = DeliveryWorker()
+    return _delivery_worker
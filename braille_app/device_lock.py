@@ -0,0 +1,137 @@
+"""
+Device Lock Module for Braille Display Website
+
+Cross-process mutual exclusion per device, so two sends to the same display
+(from different gunicorn workers) cannot interleave their chunk writes.
+
+Locks are leases in the shared state database: a lease expires after
+DEVICE_LOCK_TTL seconds unless renewed, so a crashed worker never blocks a
+device for long. Every acquisition gets a new, increasing fencing token. A
+holder checks its token (renew()) before each write; once its lease has been
+taken over, the check fails and it stops writing instead of corrupting the
+newer stream. The token is also written with each chunk, so a reader can
+ignore anything older than the newest token it has seen.
+"""
+
+import os
+import threading
+import time
+import uuid
+from django.conf import settings
+
+from .shared_state import ensure_table, get_connection, transaction
+
+
+LEASES_DDL = """
+    CREATE TABLE IF NOT EXISTS device_leases (
+        device_id TEXT PRIMARY KEY,
+        owner TEXT,
+        token INTEGER NOT NULL DEFAULT 0,
+        expires_at REAL NOT NULL DEFAULT 0
+    )
+"""
+
+
+class DeviceBusy(Exception):
+    """Raised when a device lock cannot be acquired in time."""
+
+    def __init__(self, device_id, timeout):
+        self.device_id = device_id
+        self.timeout = timeout
+        super().__init__(f"Device {device_id} is busy with another delivery (waited {timeout:.1f}s)")
+
+
+class DeviceLock:
+    """
+    Lease-based lock on one device.
+
+    Usage:
+        with DeviceLock('default') as lock:
+            for chunk in chunks:
+                if not lock.renew():
+                    break  # lease lost to a newer delivery
+                write(chunk, fence=lock.token)
+    """
+
+    def __init__(self, device_id, ttl=None, timeout=None):
+        self.device_id = device_id
+        self.ttl = settings.DEVICE_LOCK_TTL if ttl is None else ttl
+        self.timeout = settings.DEVICE_LOCK_TIMEOUT if timeout is None else timeout
+        self.owner = f'{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}'
+        self.token = None
+
+    def _try_acquire(self):
+        ensure_table('device_leases', LEASES_DDL)
+        now = time.time()
+        with transaction() as conn:
+            row = conn.execute(
+                'SELECT owner, token, expires_at FROM device_leases WHERE device_id = ?',
+                (self.device_id,)
+            ).fetchone()
+            if row is not None and row[0] is not None and row[2] > now:
+                return False
+
+            token = (row[1] if row else 0) + 1
+            conn.execute(
+                'INSERT OR REPLACE INTO device_leases (device_id, owner, token, expires_at) VALUES (?, ?, ?, ?)',
+                (self.device_id, self.owner, token, now + self.ttl)
+            )
+        self.token = token
+        return True
+
+    def acquire(self):
+        """
+        Wait up to `timeout` seconds for the device.
+
+        Returns:
+            int: Fencing token of the new lease
+
+        Raises:
+            DeviceBusy: If another holder keeps the device for the whole timeout
+        """
+        deadline = time.monotonic() + self.timeout
+        pause = 0.005
+        while not self._try_acquire():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeviceBusy(self.device_id, self.timeout)
+            time.sleep(min(pause, remaining))
+            pause = min(pause * 2, 0.2)
+        return self.token
+
+    def renew(self):
+        """
+        Check the lease is still ours and extend it.
+
+        Returns:
+            bool: False if the lease expired and was taken by someone else
+        """
+        if self.token is None:
+            return False
+        ensure_table('device_leases', LEASES_DDL)
+        cursor = get_connection().execute(
+            'UPDATE device_leases SET expires_at = ? WHERE device_id = ? AND owner = ? AND token = ?',
+            (time.time() + self.ttl, self.device_id, self.owner, self.token)
+        )
+        return cursor.rowcount == 1
+
+    def release(self):
+        """
+        Give the device up (no-op if the lease was already lost).
+        """
+        if self.token is None:
+            return
+        ensure_table('device_leases', LEASES_DDL)
+        get_connection().execute(
+            'UPDATE device_leases SET owner = NULL, expires_at = 0 WHERE device_id = ? AND owner = ? AND token = ?',
+            (self.device_id, self.owner, self.token)
+        )
+        self.token = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -0,0 +1,113 @@
+"""
+Device Registry Module for Braille Display Website
+
+Capability profiles for the braille displays the server sends to, configured
+in settings.BRAILLE_DEVICES. A profile says how many cells the device shows at
+once, how long it needs per window, which payload format it understands and
+where in Firebase it reads, so every device gets payloads it can actually show.
+
+Payload formats:
+    slot    Pre-rendered slot plus a `current` pointer at `path` (ESP32 firmware)
+    text    The whole text as one string at `path` (web simulator)
+    stream  One chunk at a time at `path`, paced by refresh_seconds
+"""
+
+from django.conf import settings
+
+
+PAYLOAD_FORMATS = ('slot', 'text', 'stream')
+
+
+class DeviceError(Exception):
+    """Raised for unknown devices or invalid profiles."""
+
+
+class DeviceProfile:
+    """
+    Capabilities of one braille display.
+    """
+
+    def __init__(self, device_id, cells=None, refresh_seconds=None, format='slot', path=None,
+                 slots_path=None, name='', chunk_mode=None):
+        if format not in PAYLOAD_FORMATS:
+            raise DeviceError(f"Unknown payload format for {device_id}: {format}")
+        if chunk_mode not in (None, 'greedy', 'optimal'):
+            raise DeviceError(f"Unknown chunk mode for {device_id}: {chunk_mode}")
+
+        self.device_id = device_id
+        self.name = name or device_id
+        self.cells = cells or settings.DEVICE_CHAR_LIMIT
+        self.refresh_seconds = settings.CHUNK_SEND_DELAY if refresh_seconds is None else refresh_seconds
+        self.format = format
+        self.path = path or (settings.FIREBASE_CURRENT_PATH if format == 'slot' else settings.FIREBASE_TEXT_PATH)
+        self.slots_path = slots_path or settings.FIREBASE_SLOTS_PATH
+        self.chunk_mode = chunk_mode or settings.CHUNK_MODE
+
+    def to_dict(self):
+        return {
+            'device_id': self.device_id,
+            'name': self.name,
+            'cells': self.cells,
+            'refresh_seconds': self.refresh_seconds,
+            'format': self.format,
+            'path': self.path,
+            'chunk_mode': self.chunk_mode,
+        }
+
+
+_profiles = {}
+
+
+def get_device_profile(device_id=None):
+    """
+    Get a device's profile.
+
+    Args:
+        device_id (str): Device id (defaults to settings.DEFAULT_DEVICE_ID)
+
+    Returns:
+        DeviceProfile: The profile
+
+    Raises:
+        DeviceError: If the device is not in settings.BRAILLE_DEVICES
+    """
+    device_id = device_id or settings.DEFAULT_DEVICE_ID
+    config = settings.BRAILLE_DEVICES.get(device_id)
+    if config is None:
+        raise DeviceError(f"Unknown device: {device_id}")
+
+    # Rebuild when settings change (e.g. in tests)
+    cached = _profiles.get(device_id)
+    if cached is None or cached[0] is not config:
+        cached = (config, DeviceProfile(device_id, **config))
+        _profiles[device_id] = cached
+    return cached[1]
+
+
+def list_devices():
+    """
+    List every configured device.
+
+    Returns:
+        list: DeviceProfile for each entry in settings.BRAILLE_DEVICES
+    """
+    return [get_device_profile(device_id) for device_id in settings.BRAILLE_DEVICES]
+
+
+def get_device_group(group):
+    """
+    Device ids in a named group.
+
+    Args:
+        group (str): Key of settings.BRAILLE_DEVICE_GROUPS
+
+    Returns:
+        list: Device ids
+
+    Raises:
+        DeviceError: If the group does not exist
+    """
+    device_ids = settings.BRAILLE_DEVICE_GROUPS.get(group)
+    if device_ids is None:
+        raise DeviceError(f"Unknown device group: {group}")
+    return list(device_ids)
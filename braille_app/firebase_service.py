@@ -2,20 +2,37 @@
 Firebase Service Module for Braille Display Integration
 
 This module handles all Firebase communication for sending text to the braille device.
-It splits text into chunks based on device capacity and sends them sequentially.
+It splits text into chunks sized by each device's profile and writes them in the
+format that device reads (see devices.py).
 """
 
 import time
 import json
+import logging
+import hashlib
+import posixpath
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 
+from .devices import DeviceError, get_device_group, get_device_profile
+from .device_lock import DeviceBusy, DeviceLock
+from .cancellation import begin_delivery
+from .slot_versions import is_staged, record_pointer, record_staged, stale_versions
+from .metrics import counter, histogram
+from .tracing import span, traced
+from .resilience import RetryPolicy, call_with_retry
+from .line_breaking import optimal_chunks
+
+logger = logging.getLogger(__name__)
+
 # Import requests for REST API
 try:
     import requests
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
-    print("Warning: requests not installed. Install with: pip install requests")
+    logger.warning("requests not installed. Install with: pip install requests")
 
 # Import Firebase Admin SDK
 try:
@@ -24,7 +41,34 @@ try:
     FIREBASE_AVAILABLE = True
 except ImportError:
     FIREBASE_AVAILABLE = False
-    print("Warning: firebase-admin not installed. Using REST API mode")
+    logger.warning("firebase-admin not installed. Using REST API mode")
+
+
+def _retryable(error):
+    """
+    Timeouts, connection errors, 5xx and 429 are worth retrying; other HTTP
+    errors (bad auth, bad path) will fail again.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is None or status >= 500 or status == 429
+
+
+FIREBASE_WRITE_SECONDS = histogram(
+    'braille_firebase_write_seconds', 'Firebase write latency', ['operation', 'transport']
+)
+FIREBASE_WRITE_ERRORS = counter(
+    'braille_firebase_write_errors_total', 'Firebase writes that failed after retries', ['operation']
+)
+FIREBASE_FALLBACKS = counter(
+    'braille_firebase_sdk_fallbacks_total', 'Admin SDK writes retried over REST', ['operation']
+)
+DEVICE_DELIVERIES = counter(
+    'braille_device_deliveries_total', 'Deliveries to devices by payload format and outcome', ['format', 'status']
+)
+DEVICE_CHUNKS = counter(
+    'braille_device_chunks_sent_total', 'Windows written to devices by payload format', ['format']
+)
 
 
 class FirebaseService:
@@ -45,7 +89,7 @@ class FirebaseService:
             return
         
         if not FIREBASE_AVAILABLE:
-            print("Firebase Admin SDK not installed - using REST API mode")
+            logger.info("Firebase Admin SDK not installed - using REST API mode")
             cls._initialized = True
             return
         
@@ -55,29 +99,39 @@ class FirebaseService:
             if cred_path and hasattr(credentials, 'Certificate'):
                 cred = credentials.Certificate(cred_path)
                 firebase_admin.initialize_app(cred, {
-                    'databaseURL': settings.FIREBASE_CONFIG.get('databaseURL')
+                    'databaseURL': settings.FIREBASE_CONFIG.get('databaseURL'),
+                    # The SDK takes one timeout for the app, not one per call
+                    'httpTimeout': cls._retry_policy().attempt_timeout,
                 })
                 cls._initialized = True
-                print("Firebase Admin SDK initialized successfully")
+                logger.info("Firebase Admin SDK initialized successfully")
         except Exception as e:
-            print(f"Firebase Admin SDK initialization skipped: {e}")
-            print("Using REST API mode with auth token")
+            logger.info("Firebase Admin SDK initialization skipped, using REST API mode with auth token: %s", e)
             cls._initialized = True
     
     @staticmethod
-    def chunk_text(text, chunk_size=None):
+    def chunk_text(text, chunk_size=None, mode=None, hyphenate=None):
         """
         Split text into chunks based on device character limit.
         
         Args:
             text (str): The text to split
             chunk_size (int): Maximum characters per chunk (defaults to settings.DEVICE_CHAR_LIMIT)
+            mode (str): 'greedy' or 'optimal' (defaults to settings.CHUNK_MODE)
+            hyphenate (bool): Let 'optimal' mode hyphenate words (defaults to settings.CHUNK_HYPHENATE)
         
         Returns:
             list: List of text chunks
         """
         if chunk_size is None:
             chunk_size = settings.DEVICE_CHAR_LIMIT
+        if mode is None:
+            mode = settings.CHUNK_MODE
+        
+        if mode == 'optimal':
+            if hyphenate is None:
+                hyphenate = settings.CHUNK_HYPHENATE
+            return optimal_chunks(text, chunk_size, hyphenate=hyphenate)
         
         # Split text into chunks without breaking words
         words = text.split()
@@ -91,13 +145,12 @@ class FirebaseService:
             if current_length + word_length > chunk_size:
                 if current_chunk:
                     chunks.append(' '.join(current_chunk))
-                    current_chunk = [word]
-                    current_length = word_length
-                else:
-                    # Single word is longer than chunk_size, split it
+                # A word longer than chunk_size is cut into full windows
+                while len(word) > chunk_size:
                     chunks.append(word[:chunk_size])
-                    current_chunk = [word[chunk_size:]] if len(word) > chunk_size else []
-                    current_length = len(current_chunk[0]) if current_chunk else 0
+                    word = word[chunk_size:]
+                current_chunk = [word]
+                current_length = len(word) + 1
             else:
                 current_chunk.append(word)
                 current_length += word_length
@@ -108,182 +161,556 @@ class FirebaseService:
         return chunks
     
     @classmethod
-    def send_text_to_device(cls, text, delay=None):
+    @traced('device.send')
+    def send_text_to_device(cls, text, delay=None, chunks=None, device_id=None, wait=False):
         """
-        Main function to send text to the braille device.
+        Main function to send text to a braille device.
         
         This function:
-        1. Splits text into appropriate chunks
-        2. Sends each chunk sequentially to Firebase
-        3. Includes delays between chunks if specified
+        1. Looks up the device profile (cells, pacing, payload format, path)
+        2. Splits text into windows the device can show
+        3. Encodes and writes them in the device's payload format
         
         Args:
             text (str): The text to send to the braille device
-            delay (float): Delay between chunks in seconds (defaults to settings.CHUNK_SEND_DELAY)
+            delay (float): Delay between streamed chunks in seconds (defaults to the profile's refresh_seconds)
+            chunks (list): Pre-chunked text, e.g. from a prefetched digest (reused if it fits the device)
+            device_id (str): Target device (defaults to settings.DEFAULT_DEVICE_ID)
+            wait (bool): Queue behind a delivery in progress instead of cancelling it
         
         Returns:
-            dict: Result with status and details
+            dict: Result with status ('success', 'error' or 'cancelled') and details
         """
         if not text:
             return {'status': 'error', 'message': 'No text provided'}
         
-        if delay is None:
-            delay = settings.CHUNK_SEND_DELAY
+        try:
+            profile = get_device_profile(device_id)
+        except DeviceError as e:
+            return {'status': 'error', 'message': str(e)}
+        
+        if profile.format == 'slot':
+            return cls.publish('message', text, chunks, device_id=profile.device_id)
         
-        # Chunk the text
-        chunks = cls.chunk_text(text)
+        mode = 'firebase' if cls._initialized and FIREBASE_AVAILABLE else 'mock'
+        
+        if profile.format == 'text':
+            # The device scrolls through the whole string itself
+            try:
+                begin_delivery(profile.device_id)
+                cls._write(profile.path, text)
+            except Exception as e:
+                return cls._delivered('text', {'status': 'error', 'message': f"Error sending text: {str(e)}"})
+            return cls._delivered('text', {
+                'status': 'success',
+                'device_id': profile.device_id,
+                'total_chunks': 1,
+                'chunks_sent': 1,
+                'mode': mode,
+                'message': f"Successfully sent text to {profile.name}",
+            })
+        
+        if delay is None:
+            delay = profile.refresh_seconds
+        chunks = cls._chunks_for(profile, text, chunks)
         
         result = {
             'status': 'success',
+            'device_id': profile.device_id,
             'total_chunks': len(chunks),
             'chunks_sent': 0,
-            'mode': 'firebase' if cls._initialized and FIREBASE_AVAILABLE else 'mock'
+            'mode': mode,
         }
         
+        # Latest wins: starting now cancels the stream in progress, which
+        # then gives up the device lock within one chunk
+        token = None if wait else begin_delivery(profile.device_id)
+        
         try:
-            for i, chunk in enumerate(chunks):
-                if cls._initialized and FIREBASE_AVAILABLE:
-                    # Try Admin SDK first
-                    try:
-                        ref = db.reference(settings.FIREBASE_TEXT_PATH)
-                        ref.set({
-                            'text': chunk,
-                            'chunk_number': i + 1,
-                            'total_chunks': len(chunks),
-                            'timestamp': time.time()
-                        })
-                    except:
-                        # Fallback to REST API
-                        cls._send_via_rest_api(chunk, i + 1, len(chunks))
-                else:
-                    # Use REST API directly
-                    cls._send_via_rest_api(chunk, i + 1, len(chunks))
+            # One stream per device at a time, across all workers
+            with DeviceLock(profile.device_id) as lock:
+                if token is None:
+                    token = begin_delivery(profile.device_id, supersede=False)
                 
-                result['chunks_sent'] += 1
-                
-                # Add delay between chunks (except after last chunk)
-                if i < len(chunks) - 1 and delay > 0:
-                    time.sleep(delay)
+                for i, chunk in enumerate(chunks):
+                    if token.cancelled:
+                        result['status'] = 'cancelled'
+                        result['message'] = f"Delivery to {profile.name} was replaced or stopped after {i} chunk(s)"
+                        return cls._delivered('stream', result)
+                    if not lock.renew():
+                        result['status'] = 'error'
+                        result['message'] = f"Delivery to {profile.name} was taken over by a newer send"
+                        return cls._delivered('stream', result)
+                    
+                    cls._write(profile.path, cls.stream_payload(chunk, i, len(chunks), lock.token))
+                    result['chunks_sent'] += 1
+                    
+                    # Add delay between chunks (except after last chunk)
+                    if i < len(chunks) - 1 and delay > 0:
+                        cls._pause(delay, token)
             
-            result['message'] = f"Successfully sent {len(chunks)} chunk(s) to braille device"
+            result['message'] = f"Successfully sent {len(chunks)} chunk(s) to {profile.name}"
             
+        except DeviceBusy as e:
+            result['status'] = 'error'
+            result['message'] = str(e)
         except Exception as e:
             result['status'] = 'error'
             result['message'] = f"Error sending text: {str(e)}"
         
+        return cls._delivered('stream', result)
+    
+    @staticmethod
+    def stream_payload(chunk, index, total, fence):
+        """
+        Payload of one chunk for a 'stream' device.
+        """
+        return {
+            'text': chunk,
+            'chunk_number': index + 1,
+            'total_chunks': total,
+            'fence': fence,
+            'timestamp': time.time()
+        }
+    
+    @staticmethod
+    def _delivered(payload_format, result):
+        """
+        Record a finished delivery in the metrics and return its result.
+        """
+        DEVICE_DELIVERIES.labels(payload_format, result['status']).inc()
+        if result.get('chunks_sent'):
+            DEVICE_CHUNKS.labels(payload_format).inc(result['chunks_sent'])
         return result
     
+    @staticmethod
+    def _pause(delay, token):
+        """
+        Sleep between chunks, waking early if the delivery is cancelled.
+        """
+        deadline = time.monotonic() + delay
+        while not token.cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.1))
+    
     @classmethod
-    def _send_via_rest_api(cls, text, chunk_num, total_chunks, retry_count=0):
+    def stop_delivery(cls, device_id=None):
         """
-        Send data to Firebase using REST API with retry logic and SSL error handling.
-        Used when Admin SDK is not available.
+        Cancel whatever is being delivered to a device (voice "stop"),
+        including its queued and preempted delivery jobs.
+        
+        Returns:
+            dict: Result with status
         """
-        if not REQUESTS_AVAILABLE:
-            print(f"[MOCK] Chunk {chunk_num}/{total_chunks}: {text[:50]}...")
-            print("Install 'requests' library: pip install requests")
-            return
+        try:
+            profile = get_device_profile(device_id)
+            from .delivery_queue import stop_jobs  # the queue builds on this module
+            stop_jobs(profile.device_id)
+        except Exception as e:
+            return {'status': 'error', 'message': f"Error stopping delivery: {str(e)}"}
+        return {'status': 'success', 'device_id': profile.device_id, 'message': f"Stopped delivery to {profile.name}"}
+    
+    @classmethod
+    def _chunks_for(cls, profile, text, chunks=None):
+        """
+        Windows sized for a device, reusing pre-chunked text when it fits.
+        """
+        if chunks and all(len(chunk) <= profile.cells for chunk in chunks):
+            return chunks
+        return cls.chunk_text(text, profile.cells, mode=profile.chunk_mode)
+    
+    @classmethod
+    def _write(cls, path, data):
+        """
+        Write a value at a database path in one request (Admin SDK or REST API).
+        
+        Args:
+            path (str): Database path, e.g. '/braille_display/current'
+            data: JSON-serialisable value
+        """
+        cls._send('set', path, data)
+    
+    @classmethod
+    def _update(cls, path, data):
+        """
+        Update several children of a database path in one request (multi-path PATCH).
+        
+        Args:
+            path (str): Parent path
+            data (dict): Relative child paths -> values
+        """
+        cls._send('update', path, data)
+    
+    @classmethod
+    def _send(cls, operation, path, data):
+        """
+        Perform a 'set' or 'update' with the Admin SDK, falling back to REST.
+        
+        Writes follow settings.FIREBASE_RETRY: retried with backoff within a
+        deadline and a retry budget, and failed fast while Firebase is down.
+        REST attempts time out when the deadline runs out; an Admin SDK
+        attempt can only use the app-wide attempt_timeout, so it may overrun
+        the deadline by up to that much.
+        """
+        with span(f'firebase.{operation}', path=path):
+            start = time.perf_counter()
+            database_url = settings.FIREBASE_CONFIG.get('databaseURL')
+            auth_token = settings.FIREBASE_CONFIG.get('authToken')
+            use_sdk = cls._initialized and FIREBASE_AVAILABLE
+            
+            if not use_sdk and (not REQUESTS_AVAILABLE or not database_url or not auth_token):
+                if operation == 'set':
+                    logger.info("[MOCK] Write %s: %.50s...", path, data)
+                else:
+                    logger.info("[MOCK] Update %s: %d field(s)", path, len(data))
+                FIREBASE_WRITE_SECONDS.labels(operation, 'mock').observe(time.perf_counter() - start)
+                return
+            
+            transport = 'rest'
+            
+            def attempt(timeout):
+                nonlocal transport
+                if use_sdk:
+                    try:
+                        ref = db.reference(path)
+                        ref.set(data) if operation == 'set' else ref.update(data)
+                        transport = 'sdk'
+                        return
+                    except Exception:
+                        FIREBASE_FALLBACKS.labels(operation).inc()
+                        if not REQUESTS_AVAILABLE or not database_url or not auth_token:
+                            raise
+                
+                url = f"{database_url}/{path.strip('/')}.json?auth={auth_token}"
+                method = requests.put if operation == 'set' else requests.patch
+                response = method(url, json=data, timeout=timeout)
+                response.raise_for_status()
+            
+            try:
+                call_with_retry(attempt, 'firebase', cls._retry_policy(), _retryable)
+            except Exception:
+                FIREBASE_WRITE_ERRORS.labels(operation).inc()
+                raise
+            finally:
+                FIREBASE_WRITE_SECONDS.labels(operation, transport).observe(time.perf_counter() - start)
+    
+    @staticmethod
+    def _retry_policy():
+        return RetryPolicy.from_settings(settings.FIREBASE_RETRY)
+    
+    @staticmethod
+    def content_version(text):
+        """
+        Short content hash used as a slot version and device ETag.
+        """
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+    
+    @classmethod
+    def stage_slot(cls, slot_name, text, chunks=None, device_id=None):
+        """
+        Write pre-rendered content to a versioned slot ahead of time.
+        
+        The slot is not visible to the device until activate_slot() points
+        the `current` pointer at it. Staging the same content twice is a no-op,
+        in any worker, until the version is pruned.
         
-        database_url = settings.FIREBASE_CONFIG.get('databaseURL')
-        auth_token = settings.FIREBASE_CONFIG.get('authToken')
+        Args:
+            slot_name (str): Slot name, e.g. 'news_technology'
+            text (str): Full text for the device
+            chunks (list): Pre-chunked text (re-chunked if it does not fit the device)
+            device_id (str): Device whose profile sizes the windows (defaults to settings.DEFAULT_DEVICE_ID)
         
-        if not database_url or not auth_token:
-            print(f"[MOCK] Chunk {chunk_num}/{total_chunks}: {text[:50]}...")
+        Returns:
+            dict: slot, version, path and total_chunks
+        """
+        profile = get_device_profile(device_id)
+        slot, payload = cls._render_slot(profile, slot_name, text, chunks)
+        
+        if not is_staged(posixpath.dirname(slot['path']), slot['version']):
+            cls._write(slot['path'], payload)
+            cls._mark_staged(slot)
+        
+        return slot
+    
+    @classmethod
+    def _render_slot(cls, profile, slot_name, text, chunks=None):
+        """
+        Slot description and slot payload for a device profile.
+        """
+        chunks = cls._chunks_for(profile, text, chunks)
+        version = cls.content_version(text)
+        path = f"{profile.slots_path.rstrip('/')}/{slot_name}/v{version}"
+        slot = {
+            'slot': slot_name,
+            'version': version,
+            'path': path,
+            'total_chunks': len(chunks),
+        }
+        payload = {
+            'text': text,
+            'chunks': chunks,
+            'total_chunks': len(chunks),
+            'version': version,
+        }
+        return slot, payload
+    
+    @classmethod
+    def _mark_staged(cls, slot):
+        record_staged(posixpath.dirname(slot['path']), slot['version'])
+        cls._prune_slot(posixpath.dirname(slot['path']))
+    
+    @classmethod
+    def _mark_active(cls, device_id, slot):
+        try:
+            record_pointer(device_id, posixpath.dirname(slot['path']), slot['version'])
+        except Exception as e:
+            logger.warning("Could not record slot pointer for %s: %s", device_id, e)
             return
+        cls._prune_slot(posixpath.dirname(slot['path']))
+    
+    @classmethod
+    def _prune_slot(cls, slot_path):
+        """
+        Delete the versions of a slot that are neither recent nor pointed at,
+        with one multi-path update.
+        """
+        try:
+            stale = stale_versions(slot_path)
+            if stale:
+                cls._update(slot_path, {f'v{version}': None for version in stale})
+        except Exception as e:
+            logger.warning("Could not prune old versions of %s: %s", slot_path, e)
+    
+    @staticmethod
+    def _pointer(slot):
+        """
+        Value written at a device's `current` pointer for a slot.
+        """
+        return {
+            'path': slot['path'],
+            'version': slot['version'],
+            'total_chunks': slot['total_chunks'],
+            'timestamp': time.time(),
+        }
+    
+    @classmethod
+    def activate_slot(cls, slot, device_id=None):
+        """
+        Point the device at a staged slot with one small atomic write.
         
-        max_retries = 3
-        retry_delay = 1  # seconds
+        The device only polls `current/version`, so switching content costs a
+        single write and idle polling transfers a few bytes. Older versions of
+        the slot are deleted afterwards, keeping the current and previous one.
+        
+        Args:
+            slot (dict): Slot description returned by stage_slot()
+            device_id (str): Device to switch (defaults to settings.DEFAULT_DEVICE_ID)
+        
+        Returns:
+            dict: Result with status and details (same shape as send_text_to_device)
+        """
+        try:
+            profile = get_device_profile(device_id)
+            begin_delivery(profile.device_id)
+            cls._write(profile.path, cls._pointer(slot))
+        except Exception as e:
+            DEVICE_DELIVERIES.labels('slot', 'error').inc()
+            return {'status': 'error', 'message': f"Error switching content: {str(e)}"}
+        
+        cls._mark_active(profile.device_id, slot)
+        DEVICE_DELIVERIES.labels('slot', 'success').inc()
+        return {
+            'status': 'success',
+            'device_id': profile.device_id,
+            'total_chunks': slot['total_chunks'],
+            'chunks_sent': slot['total_chunks'],
+            'version': slot['version'],
+            'message': f"Switched {profile.name} to {slot['slot']} ({slot['total_chunks']} chunk(s))",
+        }
+    
+    @classmethod
+    def publish(cls, slot_name, text, chunks=None, device_id=None):
+        """
+        Stage content (if not already staged) and switch the device to it.
+        
+        Devices that do not read slots get the text in their own format.
+        
+        Returns:
+            dict: Result with status and details
+        """
+        if not text:
+            return {'status': 'error', 'message': 'No text provided'}
+        
+        try:
+            profile = get_device_profile(device_id)
+        except DeviceError as e:
+            return {'status': 'error', 'message': str(e)}
+        
+        if profile.format != 'slot':
+            return cls.send_text_to_device(text, chunks=chunks, device_id=profile.device_id)
+        
+        try:
+            slot = cls.stage_slot(slot_name, text, chunks, device_id=profile.device_id)
+        except Exception as e:
+            return {'status': 'error', 'message': f"Error staging content: {str(e)}"}
+        
+        return cls.activate_slot(slot, device_id=profile.device_id)
+    
+    @classmethod
+    @traced('device.fan_out')
+    def send_to_devices(cls, text, device_ids, slot_name='message', chunks=None):
+        """
+        Send the same text to several devices at once.
         
-        for attempt in range(max_retries):
+        The text is chunked once per distinct cell count. Slot and text devices
+        are written with one multi-path PATCH at the deepest path their targets
+        share, so new slots and every pointer land together in one request.
+        Stream devices, which need paced writes, are sent concurrently on a
+        thread pool.
+        
+        Args:
+            text (str): Text to send
+            device_ids (list): Target device ids
+            slot_name (str): Slot name for slot devices
+            chunks (list): Optional pre-chunked text (reused where it fits)
+        
+        Returns:
+            dict: Overall status plus a result per device under 'devices'
+        """
+        if not text:
+            return {'status': 'error', 'message': 'No text provided'}
+        
+        results = {}
+        profiles = []
+        for device_id in dict.fromkeys(device_ids):
             try:
-                # Firebase REST API endpoint
-                path = settings.FIREBASE_TEXT_PATH.strip('/')
-                url = f"{database_url}/{path}.json?auth={auth_token}"
-                
-                data = {
-                    'text': text,
-                    'chunk_number': chunk_num,
-                    'total_chunks': total_chunks,
-                    'timestamp': time.time()
+                profiles.append(get_device_profile(device_id))
+            except DeviceError as e:
+                results[device_id] = {'status': 'error', 'message': str(e)}
+        
+        windows = {}
+        def chunks_for(profile):
+            if profile.cells not in windows:
+                windows[profile.cells] = cls._chunks_for(profile, text, chunks)
+            return windows[profile.cells]
+        
+        # Slot and text devices: one multi-path update
+        update = {}
+        batched = {}
+        staged = []
+        switched = []
+        for profile in profiles:
+            if profile.format in ('slot', 'text'):
+                begin_delivery(profile.device_id)
+            if profile.format == 'slot':
+                slot, payload = cls._render_slot(profile, slot_name, text, chunks_for(profile))
+                if slot['path'] not in update and not is_staged(posixpath.dirname(slot['path']), slot['version']):
+                    update[slot['path']] = payload
+                    staged.append(slot)
+                update[profile.path] = cls._pointer(slot)
+                switched.append((profile.device_id, slot))
+                batched[profile.device_id] = {
+                    'status': 'success',
+                    'device_id': profile.device_id,
+                    'total_chunks': slot['total_chunks'],
+                    'chunks_sent': slot['total_chunks'],
+                    'version': slot['version'],
+                    'message': f"Switched {profile.name} to {slot_name} ({slot['total_chunks']} chunk(s))",
                 }
-                
-                # Create a session with retry adapter for better SSL handling
-                session = requests.Session()
-                adapter = requests.adapters.HTTPAdapter(
-                    max_retries=requests.adapters.Retry(
-                        total=3,
-                        backoff_factor=0.5,
-                        status_forcelist=[500, 502, 503, 504]
-                    )
-                )
-                session.mount('https://', adapter)
-                
-                # Send request with extended timeout and keep-alive disabled
-                response = session.put(
-                    url, 
-                    json=data, 
-                    timeout=15,
-                    headers={'Connection': 'close'}  # Disable keep-alive to avoid SSL EOF errors
-                )
-                response.raise_for_status()
-                session.close()
-                print(f"✓ Sent chunk {chunk_num}/{total_chunks} to Firebase via REST API")
-                return
-                
-            except requests.exceptions.SSLError as ssl_err:
-                print(f"⚠ SSL Error on attempt {attempt + 1}/{max_retries}: {ssl_err}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-                    continue
-                else:
-                    print(f"✗ Failed after {max_retries} attempts due to SSL error")
-                    raise
-                    
-            except requests.exceptions.ConnectionError as conn_err:
-                print(f"⚠ Connection Error on attempt {attempt + 1}/{max_retries}: {conn_err}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
-                    continue
-                else:
-                    raise
-                    
+            elif profile.format == 'text':
+                update[profile.path] = text
+                batched[profile.device_id] = {
+                    'status': 'success',
+                    'device_id': profile.device_id,
+                    'total_chunks': 1,
+                    'chunks_sent': 1,
+                    'message': f"Successfully sent text to {profile.name}",
+                }
+        
+        if update:
+            root = posixpath.commonpath(['/' + path.strip('/') for path in update])
+            if root in update:
+                # A target is the shared root itself; PATCH from its parent
+                root = posixpath.dirname(root)
+            try:
+                cls._update(root, {path.strip('/')[len(root.strip('/')):].strip('/'): value
+                                   for path, value in update.items()})
+                for slot in staged:
+                    record_staged(posixpath.dirname(slot['path']), slot['version'])
+                for device_id, slot in switched:
+                    cls._mark_active(device_id, slot)
             except Exception as e:
-                print(f"✗ Error sending to Firebase: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-                else:
-                    raise
+                batched = {
+                    device_id: {'status': 'error', 'device_id': device_id, 'message': f"Error sending text: {str(e)}"}
+                    for device_id in batched
+                }
+            results.update(batched)
+            for profile in profiles:
+                if profile.device_id in batched:
+                    DEVICE_DELIVERIES.labels(profile.format, batched[profile.device_id]['status']).inc()
+        
+        # Stream devices: paced writes, concurrently
+        streamed = [profile for profile in profiles if profile.format == 'stream']
+        if streamed:
+            with ThreadPoolExecutor(max_workers=min(len(streamed), settings.FANOUT_WORKERS)) as pool:
+                # Each thread gets a copy of the context so its spans join this trace
+                futures = {
+                    profile.device_id: pool.submit(
+                        contextvars.copy_context().run,
+                        cls.send_text_to_device, text, chunks=chunks_for(profile), device_id=profile.device_id
+                    )
+                    for profile in streamed
+                }
+                for device_id, future in futures.items():
+                    results[device_id] = future.result()
+        
+        sent = sum(1 for result in results.values() if result['status'] == 'success')
+        if sent == len(results):
+            status = 'success'
+        elif sent:
+            status = 'partial'
+        else:
+            status = 'error'
+        return {
+            'status': status,
+            'devices': results,
+            'devices_sent': sent,
+            'devices_failed': len(results) - sent,
+            'message': f"Sent to {sent} of {len(results)} device(s)",
+        }
     
     @classmethod
-    def send_single_message(cls, message):
+    def send_single_message(cls, message, device_id=None):
         """
-        Send a single short message without chunking.
+        Send a single short message.
         Use for quick notifications or short responses.
         
+        On devices without slots the message is queued in the notification
+        lane, so it interrupts a long stream instead of waiting for (or
+        cancelling) it; the stream resumes afterwards.
+        
         Args:
             message (str): Short message to send
+            device_id (str): Target device (defaults to settings.DEFAULT_DEVICE_ID)
         
         Returns:
             dict: Result with status
         """
         try:
-            if cls._initialized and FIREBASE_AVAILABLE:
-                try:
-                    ref = db.reference(settings.FIREBASE_TEXT_PATH)
-                    ref.set({
-                        'text': message,
-                        'timestamp': time.time(),
-                        'type': 'notification'
-                    })
-                except:
-                    cls._send_via_rest_api(message, 1, 1)
-            else:
-                cls._send_via_rest_api(message, 1, 1)
-            
-            return {'status': 'success', 'message': 'Message sent'}
-        except Exception as e:
+            profile = get_device_profile(device_id)
+        except DeviceError as e:
             return {'status': 'error', 'message': str(e)}
+        
+        if profile.format != 'slot' and settings.DELIVERY_QUEUE:
+            from .delivery_queue import deliver_text  # the queue builds on this module
+            return deliver_text(message, device_id=profile.device_id, priority='notification')
+        
+        result = cls.publish('notice', message, device_id=device_id)
+        if result['status'] == 'success':
+            return {'status': 'success', 'message': 'Message sent'}
+        return {'status': 'error', 'message': result['message']}
 
 
 # Initialize Firebase when module is imported
@@ -291,9 +718,9 @@ FirebaseService.initialize()
 
 
 # Convenience function for easy import
-def send_text_to_braille_device(text, delay=None):
+def send_text_to_braille_device(text, delay=None, chunks=None, device_id=None):
     """
-    Convenience function to send text to braille device.
+    Convenience function to send text to a braille device.
     
     Usage:
         from braille_app.firebase_service import send_text_to_braille_device
@@ -302,8 +729,33 @@ def send_text_to_braille_device(text, delay=None):
     Args:
         text (str): Text to send
         delay (float): Optional delay between chunks
+        chunks (list): Optional pre-chunked text
+        device_id (str): Optional target device (defaults to settings.DEFAULT_DEVICE_ID)
     
     Returns:
         dict: Result dictionary with status and details
     """
-    return FirebaseService.send_text_to_device(text, delay)
+    return FirebaseService.send_text_to_device(text, delay, chunks=chunks, device_id=device_id)
+
+
+def send_text_to_device_group(text, group, chunks=None):
+    """
+    Convenience function to send the same text to every device in a group.
+    
+    Usage:
+        from braille_app.firebase_service import send_text_to_device_group
+        result = send_text_to_device_group("Today's handout", 'classroom')
+    
+    Args:
+        text (str): Text to send
+        group (str): Group name from settings.BRAILLE_DEVICE_GROUPS
+        chunks (list): Optional pre-chunked text
+    
+    Returns:
+        dict: Overall status plus a result per device under 'devices'
+    """
+    try:
+        device_ids = get_device_group(group)
+    except DeviceError as e:
+        return {'status': 'error', 'message': str(e)}
+    return FirebaseService.send_to_devices(text, device_ids, chunks=chunks)
@@ -10,6 +10,13 @@ This module integrates with Google Gemini API for:
 from django.conf import settings
 import base64
 import json
+import logging
+
+from .rate_limiter import get_rate_limiter, estimate_tokens, is_throttle_error, RateLimitExceeded
+from .metrics import counter, histogram
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
 
 # Try to import google-genai (new package)
 try:
@@ -17,7 +24,24 @@ try:
     GEMINI_AVAILABLE = True
 except ImportError:
     GEMINI_AVAILABLE = False
-    print("Warning: google-genai not installed. Install with: pip install google-genai")
+    logger.warning("google-genai not installed. Install with: pip install google-genai")
+
+
+GEMINI_SECONDS = histogram(
+    'braille_gemini_request_seconds', 'Gemini call latency', ['operation'],
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+)
+GEMINI_REQUESTS = counter(
+    'braille_gemini_requests_total', 'Gemini calls by outcome', ['operation', 'status']
+)
+
+
+def _failure_status(error):
+    if isinstance(error, RateLimitExceeded):
+        return 'rate_limited'
+    if is_throttle_error(error):
+        return 'throttled'
+    return 'error'
 
 
 class GeminiService:
@@ -31,10 +55,11 @@ class GeminiService:
         
         if self.api_available:
             self.client = genai.Client(api_key=self.api_key)
-            print("✓ Gemini AI configured successfully with google-genai")
+            logger.info("Gemini AI configured with google-genai")
         else:
-            print("✗ Gemini AI not configured - using placeholder responses")
+            logger.info("Gemini AI not configured - using placeholder responses")
     
+    @traced('gemini.chat')
     def chat(self, message, conversation_history=None):
         """
         Send a message to Gemini and get AI response.
@@ -47,27 +72,35 @@ class GeminiService:
             dict: Response with AI answer
         """
         if not self.api_available:
+            GEMINI_REQUESTS.labels('chat', 'placeholder').inc()
             return self._get_placeholder_response(message)
         
         try:
-            response = self.client.models.generate_content(
-                model='gemini-1.5-flash',
-                contents=message
-            )
+            get_rate_limiter().acquire('gemini', tokens=estimate_tokens(message))
+            with GEMINI_SECONDS.labels('chat').time():
+                response = self.client.models.generate_content(
+                    model='gemini-1.5-flash',
+                    contents=message
+                )
             
+            GEMINI_REQUESTS.labels('chat', 'success').inc()
             return {
                 'status': 'success',
                 'response': response.text,
                 'source': 'gemini'
             }
         except Exception as e:
-            print(f"Gemini API error: {e}")
+            logger.warning("Gemini API error: %s", e)
+            GEMINI_REQUESTS.labels('chat', _failure_status(e)).inc()
+            if is_throttle_error(e):
+                get_rate_limiter().report_throttled('gemini')
             return {
                 'status': 'error',
                 'response': f"I'm having trouble connecting right now. Error: {str(e)}",
                 'source': 'error'
             }
     
+    @traced('gemini.describe_image')
     def describe_image(self, image_path, prompt="Describe this image in detail for a visually impaired person."):
         """
         Generate description of an image using Gemini Vision.
@@ -80,6 +113,7 @@ class GeminiService:
             dict: Image description
         """
         if not self.api_available:
+            GEMINI_REQUESTS.labels('image', 'placeholder').inc()
             return {
                 'status': 'success',
                 'description': 'This is a placeholder image description. The actual description would be generated by Gemini Vision API.',
@@ -98,12 +132,15 @@ class GeminiService:
                 mime_type='image/jpeg'
             )
             
-            # Generate description
-            response = self.client.models.generate_content(
-                model='gemini-1.5-flash',
-                contents=[image_part, prompt]
-            )
+            # Generate description (an image costs roughly 258 tokens)
+            get_rate_limiter().acquire('gemini', tokens=258 + estimate_tokens(prompt))
+            with GEMINI_SECONDS.labels('image').time():
+                response = self.client.models.generate_content(
+                    model='gemini-1.5-flash',
+                    contents=[image_part, prompt]
+                )
             
+            GEMINI_REQUESTS.labels('image', 'success').inc()
             return {
                 'status': 'success',
                 'description': response.text,
@@ -111,7 +148,10 @@ class GeminiService:
             }
         except Exception as e:
             error_msg = str(e)
-            print(f"Gemini Vision error: {error_msg}")
+            logger.warning("Gemini Vision error: %s", error_msg)
+            GEMINI_REQUESTS.labels('image', _failure_status(e)).inc()
+            if is_throttle_error(e):
+                get_rate_limiter().report_throttled('gemini')
             
             # Provide user-friendly error messages
             if "quota" in error_msg.lower():
@@ -0,0 +1,541 @@
+"""
+Local Library Module for Braille Display Website
+
+Imports public-domain books (plain text or EPUB) into a library directory and
+reads them back through mmap. Each book is stored as:
+
+    <book_id>.txt   normalised UTF-8 text, paragraphs separated by blank lines
+    <book_id>.win   device windows as little-endian (start, end) byte offsets
+    <book_id>.par   paragraph start byte offsets
+    <book_id>.json  title, author, window size and chapter table
+    <book_id>.w<n>  windows for devices with n cells, built on first use
+
+Opening a book only reads the small JSON file and maps the others, so even a
+large novel opens in constant time and a reader touches only the pages holding
+the window they are on.
+"""
+
+import json
+import mmap
+import os
+import re
+import glob
+import struct
+import threading
+import zipfile
+import posixpath
+from collections import OrderedDict
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+from django.conf import settings
+
+from .devices import get_device_profile
+from .firebase_service import FirebaseService
+
+
+WINDOW_RECORD = struct.Struct('<QQ')
+OFFSET_RECORD = struct.Struct('<Q')
+
+CHAPTER_HEADING = re.compile(
+    r'^\s*((chapter|book|part)\s+(\d+|[ivxlcdm]+)\b.{0,80}|(prologue|epilogue|preface|introduction)\W{0,3})$',
+    re.IGNORECASE
+)
+GUTENBERG_START = re.compile(r'^\*\*\*\s*START OF (THE|THIS) PROJECT GUTENBERG.*$', re.IGNORECASE | re.MULTILINE)
+GUTENBERG_END = re.compile(r'^\*\*\*\s*END OF (THE|THIS) PROJECT GUTENBERG.*$', re.IGNORECASE | re.MULTILINE)
+BOOK_ID = re.compile(r'^[a-z0-9_\-]+$')
+
+
+class LibraryError(Exception):
+    """Raised when a book cannot be imported or found."""
+
+
+# ============================================
+# IMPORT
+# ============================================
+
+class _XhtmlText(HTMLParser):
+    """Collects block-level text and the first heading from an XHTML document."""
+
+    BLOCKS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'li', 'blockquote', 'br', 'tr'}
+    HEADINGS = {'h1', 'h2', 'h3'}
+    SKIP = {'script', 'style', 'head'}
+
+    def __init__(self):
+        super().__init__()
+        self.paragraphs = []
+        self.heading = None
+        self._current = []
+        self._in_heading = False
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = ' '.join(''.join(self._current).split())
+        if text:
+            self.paragraphs.append(text)
+            if self._in_heading and self.heading is None:
+                self.heading = text
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip_depth += 1
+        elif tag in self.BLOCKS:
+            self._flush()
+            self._in_heading = tag in self.HEADINGS
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCKS:
+            self._flush()
+            self._in_heading = False
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _read_epub(path):
+    """
+    Read an EPUB in spine order.
+
+    Returns:
+        tuple: (title, author, [(chapter title, [paragraphs])])
+    """
+    with zipfile.ZipFile(path) as epub:
+        container = ElementTree.fromstring(epub.read('META-INF/container.xml'))
+        rootfile = container.find('.//{*}rootfile').get('full-path')
+        opf = ElementTree.fromstring(epub.read(rootfile))
+        base = posixpath.dirname(rootfile)
+
+        title = opf.findtext('.//{*}metadata/{*}title') or ''
+        author = opf.findtext('.//{*}metadata/{*}creator') or ''
+        manifest = {item.get('id'): item.get('href') for item in opf.find('{*}manifest')}
+
+        chapters = []
+        for itemref in opf.find('{*}spine'):
+            href = manifest.get(itemref.get('idref'))
+            if not href:
+                continue
+            parser = _XhtmlText()
+            parser.feed(epub.read(posixpath.join(base, href)).decode('utf-8', errors='replace'))
+            parser.close()
+            if parser.paragraphs:
+                chapters.append((parser.heading or f'Section {len(chapters) + 1}', parser.paragraphs))
+
+    return title.strip(), author.strip(), chapters
+
+
+def _read_text(path):
+    """
+    Read a plain-text book, splitting chapters on "Chapter ..." style headings.
+
+    Returns:
+        tuple: (title, author, [(chapter title, [paragraphs])])
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+
+    # Drop Project Gutenberg licence header and footer
+    start = GUTENBERG_START.search(text)
+    if start:
+        text = text[start.end():]
+    end = GUTENBERG_END.search(text)
+    if end:
+        text = text[:end.start()]
+
+    chapters = [('Beginning', [])]
+    for block in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(block.split())
+        if not paragraph:
+            continue
+        if CHAPTER_HEADING.match(paragraph):
+            chapters.append((paragraph, [paragraph]))
+        else:
+            chapters[-1][1].append(paragraph)
+
+    chapters = [chapter for chapter in chapters if chapter[1]]
+    return '', '', chapters
+
+
+def import_book(path, book_id=None, title=None, author=None, window_size=None):
+    """
+    Import a plain-text or EPUB book into the library.
+
+    Args:
+        path (str): Path to a .txt or .epub file
+        book_id (str): Library id (defaults to the file name)
+        title (str): Title override
+        author (str): Author override
+        window_size (int): Characters per device window (defaults to the default device's cells)
+
+    Returns:
+        dict: Metadata of the imported book
+    """
+    if window_size is None:
+        window_size = get_device_profile().cells
+
+    if book_id is None:
+        book_id = re.sub(r'[^a-z0-9_\-]+', '_', os.path.splitext(os.path.basename(path))[0].lower())
+    if not BOOK_ID.match(book_id):
+        raise LibraryError(f"Invalid book id: {book_id}")
+
+    if path.lower().endswith('.epub'):
+        found_title, found_author, chapters = _read_epub(path)
+    else:
+        found_title, found_author, chapters = _read_text(path)
+
+    if not chapters:
+        raise LibraryError(f"No text found in {path}")
+
+    return _write_book(
+        book_id,
+        title or found_title or book_id.replace('_', ' ').title(),
+        author or found_author or 'Unknown Author',
+        chapters,
+        window_size,
+    )
+
+
+def import_text(text, book_id, title, author='', window_size=None, section_title='Page'):
+    """
+    Add already extracted text (e.g. from a PDF) to the library.
+
+    Args:
+        text (str or list): Full text, or a list of sections (e.g. PDF pages)
+        book_id (str): Library id
+        title (str): Document title
+        author (str): Document author
+        window_size (int): Characters per device window (defaults to the default device's cells)
+        section_title (str): Chapter title prefix used for list sections
+
+    Returns:
+        dict: Metadata of the imported document
+    """
+    if window_size is None:
+        window_size = get_device_profile().cells
+    if not BOOK_ID.match(book_id):
+        raise LibraryError(f"Invalid book id: {book_id}")
+
+    sections = [text] if isinstance(text, str) else text
+    chapters = []
+    for i, section in enumerate(sections, 1):
+        paragraphs = [' '.join(block.split()) for block in re.split(r'\n\s*\n', section or '')]
+        paragraphs = [p for p in paragraphs if p]
+        if paragraphs:
+            chapters.append((f'{section_title} {i}', paragraphs))
+
+    if not chapters:
+        raise LibraryError("No text to import")
+
+    return _write_book(book_id, title, author or 'Unknown Author', chapters, window_size)
+
+
+def _paragraph_windows(paragraph, offset, window_size):
+    """
+    (start, end) byte offsets of the windows of a paragraph stored at `offset`.
+    """
+    data = paragraph.encode('utf-8')
+    cursor = 0
+    # No hyphens: every window must be a slice of the stored text. Windows are
+    # built once per width, so the slower optimal breaking is worth it here
+    for chunk in FirebaseService.chunk_text(paragraph, window_size, mode='optimal', hyphenate=False):
+        chunk_data = chunk.encode('utf-8')
+        start = data.find(chunk_data, cursor)
+        if start < 0:
+            start = cursor
+        cursor = start + len(chunk_data)
+        yield offset + start, offset + cursor
+
+
+def _write_book(book_id, title, author, chapters, window_size):
+    """
+    Write the text and offset index files for a book.
+    """
+    directory = str(settings.BOOK_LIBRARY_DIR)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, book_id)
+
+    chapter_table = []
+    window_count = 0
+    offset = 0
+
+    with open(f'{base}.txt.tmp', 'wb') as text_file, \
+            open(f'{base}.win.tmp', 'wb') as window_file, \
+            open(f'{base}.par.tmp', 'wb') as paragraph_file:
+        for chapter_title, paragraphs in chapters:
+            chapter_start = None
+            first_window = window_count
+
+            for paragraph in paragraphs:
+                if offset:
+                    text_file.write(b'\n\n')
+                    offset += 2
+                if chapter_start is None:
+                    chapter_start = offset
+                data = paragraph.encode('utf-8')
+                paragraph_file.write(OFFSET_RECORD.pack(offset))
+
+                for start, end in _paragraph_windows(paragraph, offset, window_size):
+                    window_file.write(WINDOW_RECORD.pack(start, end))
+                    window_count += 1
+
+                text_file.write(data)
+                offset += len(data)
+
+            chapter_table.append({
+                'title': chapter_title[:200],
+                'start': chapter_start,
+                'end': offset,
+                'first_window': first_window,
+                'window_count': window_count - first_window,
+            })
+
+    meta = {
+        'id': book_id,
+        'title': title,
+        'author': author,
+        'window_size': window_size,
+        'window_count': window_count,
+        'size': offset,
+        'chapters': chapter_table,
+    }
+
+    for extension in ('txt', 'win', 'par'):
+        os.replace(f'{base}.{extension}.tmp', f'{base}.{extension}')
+    # Windows for other device widths are rebuilt from the new text
+    for path in glob.glob(f'{glob.escape(base)}.w[0-9]*'):
+        os.remove(path)
+    with open(f'{base}.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    _open_books.pop(book_id, None)
+    return meta
+
+
+# ============================================
+# READING
+# ============================================
+
+def _map(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LibraryBook:
+    """
+    Read-only, memory-mapped view of an imported book.
+    """
+
+    def __init__(self, book_id):
+        if not BOOK_ID.match(book_id):
+            raise LibraryError(f"Invalid book id: {book_id}")
+
+        base = os.path.join(str(settings.BOOK_LIBRARY_DIR), book_id)
+        try:
+            with open(f'{base}.json', 'r', encoding='utf-8') as f:
+                self.meta = json.load(f)
+        except OSError:
+            raise LibraryError(f"Book not in library: {book_id}")
+
+        self.id = book_id
+        self._base = base
+        self.title = self.meta['title']
+        self.author = self.meta['author']
+        self.chapters = self.meta['chapters']
+        self.window_count = self.meta['window_count']
+        self._text = _map(f'{base}.txt')
+        self._windows = _map(f'{base}.win')
+        self._paragraphs = _map(f'{base}.par')
+        self._sized_windows = {self.meta['window_size']: self._windows}
+        self._sized_lock = threading.Lock()
+
+    def _slice(self, start, end):
+        return self._text[start:end].decode('utf-8', errors='replace')
+
+    def _window_map(self, cells=None):
+        """
+        Window offsets for devices with `cells` cells (the import size if None).
+
+        The index for a new width is built once from the paragraphs and kept
+        next to the book, so later readers only map it.
+        """
+        if cells is None:
+            return self._windows
+        windows = self._sized_windows.get(cells)
+        if windows is not None:
+            return windows
+
+        with self._sized_lock:
+            windows = self._sized_windows.get(cells)
+            if windows is None:
+                path = f'{self._base}.w{cells}'
+                if not os.path.exists(path):
+                    with open(f'{path}.tmp', 'wb') as window_file:
+                        for index in range(self.paragraph_count):
+                            (offset,) = OFFSET_RECORD.unpack_from(self._paragraphs, index * OFFSET_RECORD.size)
+                            for start, end in _paragraph_windows(self.paragraph(index), offset, cells):
+                                window_file.write(WINDOW_RECORD.pack(start, end))
+                    os.replace(f'{path}.tmp', path)
+                windows = self._sized_windows[cells] = _map(path)
+        return windows
+
+    def window_total(self, cells=None):
+        """
+        Number of windows for devices with `cells` cells (the import size if None).
+        """
+        return len(self._window_map(cells)) // WINDOW_RECORD.size
+
+    def window(self, index, cells=None):
+        """
+        Get the text of one device window.
+
+        Args:
+            index (int): Window number (0-based)
+            cells (int): Window width (defaults to the width the book was imported with)
+
+        Returns:
+            str: Window text
+        """
+        windows = self._window_map(cells)
+        if not 0 <= index < len(windows) // WINDOW_RECORD.size:
+            raise IndexError(f"Window {index} out of range")
+        start, end = WINDOW_RECORD.unpack_from(windows, index * WINDOW_RECORD.size)
+        return self._slice(start, end)
+
+    def windows(self, start, count, cells=None):
+        """
+        Get `count` consecutive windows starting at `start` (fewer at the end).
+        """
+        end = min(self.window_total(cells), start + count)
+        return [self.window(i, cells) for i in range(max(0, start), end)]
+
+    def window_at(self, offset, cells=None):
+        """
+        Number of the first window starting at or after byte `offset`.
+        """
+        windows = self._window_map(cells)
+        low, high = 0, len(windows) // WINDOW_RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            start, _ = WINDOW_RECORD.unpack_from(windows, middle * WINDOW_RECORD.size)
+            if start < offset:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @property
+    def paragraph_count(self):
+        return len(self._paragraphs) // OFFSET_RECORD.size
+
+    def paragraph(self, index):
+        """
+        Get the text of one paragraph.
+        """
+        if not 0 <= index < self.paragraph_count:
+            raise IndexError(f"Paragraph {index} out of range")
+        (start,) = OFFSET_RECORD.unpack_from(self._paragraphs, index * OFFSET_RECORD.size)
+        if index + 1 < self.paragraph_count:
+            (end,) = OFFSET_RECORD.unpack_from(self._paragraphs, (index + 1) * OFFSET_RECORD.size)
+            end -= 2  # paragraph separator
+        else:
+            end = self.meta['size']
+        return self._slice(start, end)
+
+    def chapter_text(self, index):
+        """
+        Get the full text of one chapter.
+        """
+        chapter = self.chapters[index]
+        return self._slice(chapter['start'], chapter['end'])
+
+    def as_reading_content(self, device_id=None):
+        """
+        Book in the format of BooksService.get_book_content_for_reading,
+        sized for a device.
+
+        Chapters are not decoded: each one carries its window range and, as
+        `content`, only its first window. Read on with windows(..., cells).
+
+        Args:
+            device_id (str): Device whose cells size the windows (defaults to settings.DEFAULT_DEVICE_ID)
+        """
+        cells = get_device_profile(device_id).cells
+        chapters = []
+        for i, chapter in enumerate(self.chapters):
+            first_window = self.window_at(chapter['start'], cells)
+            window_count = self.window_at(chapter['end'], cells) - first_window
+            chapters.append({
+                'number': i + 1,
+                'title': chapter['title'],
+                'first_window': first_window,
+                'window_count': window_count,
+                'content': self.window(first_window, cells) if window_count else '',
+            })
+        return {
+            'title': self.title,
+            'cells': cells,
+            'window_count': self.window_total(cells),
+            'chapters': chapters,
+        }
+
+
+_open_books = OrderedDict()
+_open_books_lock = threading.Lock()
+
+
+def get_library_book(book_id):
+    """
+    Get an open LibraryBook, reusing mappings for recently read books.
+
+    Returns:
+        LibraryBook: The book, or None if it is not in the library
+    """
+    with _open_books_lock:
+        book = _open_books.get(book_id)
+        if book is not None:
+            _open_books.move_to_end(book_id)
+            return book
+
+    try:
+        book = LibraryBook(book_id)
+    except LibraryError:
+        return None
+
+    with _open_books_lock:
+        _open_books[book_id] = book
+        while len(_open_books) > 32:
+            _open_books.popitem(last=False)
+    return book
+
+
+def list_library():
+    """
+    List the books in the library.
+
+    Returns:
+        list: Metadata dictionaries (without the chapter table)
+    """
+    directory = str(settings.BOOK_LIBRARY_DIR)
+    if not os.path.isdir(directory):
+        return []
+
+    books = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop('chapters', None)
+        books.append(meta)
+    return books
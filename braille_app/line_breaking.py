@@ -0,0 +1,171 @@
+"""
+Line Breaking Module for Braille Display Website
+
+Knuth-Plass style optimal breaking of text into device windows. Greedy packing
+(FirebaseService.chunk_text in 'greedy' mode) always starts a word that does not
+fit on a new window and cuts words longer than the window at fixed positions,
+which strands empty cells at the end of windows on small displays.
+
+Here every way of breaking the text is scored and the cheapest one is chosen
+with dynamic programming:
+
+    cost = WINDOW_COST per window
+         + BADNESS_COST * (empty cells / width)^2 for every window but the last
+         + CUT_COST per cut inside a word longer than a window
+         + SPLIT_COST per hyphenated word
+
+Words longer than a window must be cut; the optimiser decides where, so a
+long word can start in the empty cells of the previous window. A cut costs
+more than the two windows a badly placed one can save, so long words are cut
+no more often than greedy packing cuts them. With hyphenation enabled,
+shorter words may also be split (a hyphen takes one cell).
+
+A window holds at most `width` cells, so each break point only has O(width)
+successors. That bounded lookahead makes the algorithm linear in the length of
+the text for a fixed device width.
+"""
+
+WINDOW_COST = 1000
+BADNESS_COST = 100
+CUT_COST = 2500
+SPLIT_COST = 150
+
+# Shortest word fragment allowed on either side of an optional hyphenation
+MIN_FRAGMENT = 2
+
+
+def optimal_chunks(text, width, hyphenate=False):
+    """
+    Break text into device windows with minimum total cost.
+
+    Args:
+        text (str): Text to break (whitespace is normalised)
+        width (int): Cells per window
+        hyphenate (bool): Allow splitting words that would fit on a window
+
+    Returns:
+        list: Window strings, each at most `width` characters
+    """
+    words = text.split()
+    if not words or width < 1:
+        return []
+
+    # Global character position of the start of each word (separators excluded)
+    starts = []
+    total = 0
+    for word in words:
+        starts.append(total)
+        total += len(word)
+
+    INF = float('inf')
+    best = [INF] * (total + 1)
+    back = [None] * (total + 1)
+    best[0] = 0.0
+
+    position_word = 0
+    for position in range(total):
+        if best[position] == INF:
+            continue
+
+        # Word index and offset inside it for this position
+        while position_word + 1 < len(words) and starts[position_word + 1] <= position:
+            position_word += 1
+        i, k = position_word, position - starts[position_word]
+
+        for end, used, split, hyphen in _lines_from(words, starts, i, k, width, hyphenate):
+            cost = best[position] + WINDOW_COST
+            if end < total:
+                slack = (width - used) / width
+                cost += BADNESS_COST * slack * slack
+            if split:
+                cost += SPLIT_COST if hyphen else CUT_COST
+            if cost < best[end]:
+                best[end] = cost
+                back[end] = (position, hyphen)
+
+    # Windows are slices of the normalised text; a position p inside word i
+    # is at index p + i there (one separator before each word)
+    normalized = ' '.join(words)
+    word_at = _word_index(starts, total)
+    chunks = []
+    position = total
+    while position > 0:
+        previous, hyphen = back[position]
+        line = normalized[previous + word_at[previous]:position + word_at[position]].strip()
+        chunks.append(line + '-' if hyphen else line)
+        position = previous
+    chunks.reverse()
+    return chunks
+
+
+def _word_index(starts, total):
+    """
+    Word index for every break position (positions at a word start belong to
+    that word; the end of the text belongs to the last word).
+    """
+    index = [0] * (total + 1)
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else total + 1
+        index[start:end] = [i] * (end - start)
+    return index
+
+
+def _lines_from(words, starts, i, k, width, hyphenate):
+    """
+    Candidate windows starting at word `i`, character `k`.
+
+    Yields:
+        tuple: (end position, cells used, ends mid-word, ends with a hyphen)
+    """
+    used = 0
+    j, offset = i, k
+
+    while j < len(words):
+        word = words[j]
+        remaining = len(word) - offset
+        separator = 1 if used else 0
+
+        if used + separator + remaining <= width:
+            used += separator + remaining
+            j, offset = j + 1, 0
+            end = starts[j] if j < len(words) else starts[-1] + len(words[-1])
+            yield end, used, False, False
+            continue
+
+        available = width - used - separator
+        # A word that cannot fit on any window has to be cut somewhere
+        forced = len(word) > width
+        if forced and available >= 1:
+            yield starts[j] + offset + available, width, True, False
+        elif hyphenate and not forced:
+            take = available - 1  # one cell for the hyphen
+            if take >= MIN_FRAGMENT and remaining - take >= MIN_FRAGMENT:
+                yield starts[j] + offset + take, width, True, True
+        break
+
+
+def count_split_words(chunks, text):
+    """
+    Count how many words are split across windows.
+
+    Args:
+        chunks (list): Windows produced from `text`
+        text (str): Original text
+
+    Returns:
+        int: Number of window boundaries that fall inside a word
+    """
+    normalized = ' '.join(text.split())
+    cursor = 0
+    splits = 0
+
+    for chunk in chunks[:-1]:
+        if normalized.startswith(' ', cursor):
+            cursor += 1
+        if chunk.endswith('-') and not normalized.startswith(chunk, cursor):
+            chunk = chunk[:-1]  # hyphen added by the line breaker
+        cursor += len(chunk)
+        if cursor < len(normalized) and normalized[cursor] != ' ':
+            splits += 1
+
+    return splits
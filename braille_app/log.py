@@ -0,0 +1,225 @@
+"""
+Logging Module for Braille Display Website
+
+Non-blocking log output for the request path. Records are handed to a bounded
+in-memory queue by a QueueHandler; a QueueListener thread formats them and
+writes to stdout. A request thread therefore never waits on a slow or blocked
+stdout, and when the queue is full, records are dropped (and counted) instead
+of stalling the worker.
+
+Repeated warnings and errors with the same message template are rate limited:
+after LOG_REPEAT_LIMIT copies in LOG_REPEAT_WINDOW seconds the rest are
+suppressed, and the next copy that gets through reports how many were skipped.
+
+Output is plain text or one JSON object per line (LOG_FORMAT = 'json'); extra
+fields passed with `extra={...}` and the current trace id are included.
+
+Configured from settings.LOGGING:
+    'handlers': {'queue': {'()': 'braille_app.log.queue_handler', 'fmt': 'json'}}
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+from .metrics import counter
+from .tracing import current_trace_id
+
+
+LOG_RECORDS_DROPPED = counter(
+    'braille_log_records_dropped_total', 'Log records dropped because the log queue was full'
+)
+LOG_RECORDS_SUPPRESSED = counter(
+    'braille_log_records_suppressed_total', 'Repeated log records suppressed', ['logger']
+)
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'trace_id', 'suppressed'}
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Human-readable lines with any extra fields appended as key=value.
+    """
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, 'trace_id', None):
+            fields['trace_id'] = record.trace_id
+        if getattr(record, 'suppressed', 0):
+            fields['suppressed'] = record.suppressed
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'trace_id', None):
+            entry['trace_id'] = record.trace_id
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Let through at most `limit` warnings/errors per message template per
+    `window` seconds.
+    """
+
+    def __init__(self, limit=5, window=60):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.limit <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is None or now - seen[0] >= self.window:
+                # New window; report what the last one swallowed
+                record.suppressed = max(0, seen[1] - self.limit) if seen else 0
+                self._seen[key] = [now, 1]
+                if len(self._seen) > 1000:
+                    self._prune(now)
+                return True
+            seen[1] += 1
+            if seen[1] <= self.limit:
+                return True
+
+        LOG_RECORDS_SUPPRESSED.labels(record.name).inc()
+        return False
+
+    def _prune(self, now):
+        for key in [key for key, seen in self._seen.items() if now - seen[0] >= self.window]:
+            del self._seen[key]
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that does the least possible work in the calling thread and
+    drops records instead of blocking when the queue is full.
+    """
+
+    def prepare(self, record):
+        # Formatting happens in the listener thread. Only the message is
+        # resolved here, so later changes to the arguments cannot alter it.
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class _OutputHandler(logging.StreamHandler):
+    """
+    Writes to whatever sys.stdout is at the time (it is replaced in tests).
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+_listeners = []
+
+
+def _start(handler, output, queue_size):
+    handler.queue = queue.Queue(maxsize=queue_size)
+    handler.listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    handler.listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork; give the child its own
+    for handler, output, queue_size in _listeners:
+        _start(handler, output, queue_size)
+
+
+def _stop_all():
+    for handler, _, _ in _listeners:
+        handler.listener.stop()
+
+
+atexit.register(_stop_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def queue_handler(fmt='text', queue_size=10000, repeat_limit=5, repeat_window=60):
+    """
+    Build a queue handler whose listener thread writes to stdout.
+
+    Args:
+        fmt (str): 'text' or 'json'
+        queue_size (int): Records buffered before new ones are dropped
+        repeat_limit (int): Copies of one warning/error let through per window (0 = no limit)
+        repeat_window (float): Suppression window in seconds
+
+    Returns:
+        AsyncQueueHandler: Handler for settings.LOGGING
+    """
+    output = _OutputHandler()
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    handler = AsyncQueueHandler(None)
+    handler.addFilter(RepeatFilter(repeat_limit, repeat_window))
+    _start(handler, output, queue_size)
+    _listeners.append((handler, output, queue_size))
+    return handler
+
+
+def flush(timeout=1.0):
+    """
+    Wait until the listeners have written everything queued so far.
+    """
+    deadline = time.monotonic() + timeout
+    for handler, _, _ in _listeners:
+        while handler.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
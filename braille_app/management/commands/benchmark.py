@@ -0,0 +1,164 @@
+"""
+Micro-benchmarks for the device pipeline.
+
+Usage:
+    python manage.py benchmark                          # every suite
+    python manage.py benchmark --suite chunking --width 4
+    python manage.py benchmark --suite locks --iterations 5000
+    python manage.py benchmark --suite metrics
+"""
+
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from braille_app.device_lock import DeviceLock
+from braille_app.firebase_service import FirebaseService
+from braille_app.library import get_library_book, list_library
+from braille_app.line_breaking import count_split_words
+from braille_app import metrics
+from braille_app.popular_books import POPULAR_BOOKS
+
+
+def _corpus():
+    """
+    Documents to break: the popular books and every library book.
+    """
+    documents = [(book['id'], book['content']) for book in POPULAR_BOOKS]
+    for meta in list_library():
+        book = get_library_book(meta['id'])
+        if book is not None:
+            text = '\n\n'.join(book.chapter_text(i) for i in range(len(book.chapters)))
+            documents.append((book.id, text))
+    return documents
+
+
+class Command(BaseCommand):
+    help = 'Benchmark device pipeline stages'
+
+    suites = ('chunking', 'locks', 'metrics')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=self.suites, action='append',
+                            help='Suite to run (repeatable, defaults to all)')
+        parser.add_argument('--width', type=int, default=None,
+                            help='Cells per window for chunking (defaults to DEVICE_CHAR_LIMIT)')
+        parser.add_argument('--hyphenate', action='store_true', help='Let optimal chunking hyphenate words')
+        parser.add_argument('--repeat', type=int, default=3, help='Timing runs per measurement (best is kept)')
+        parser.add_argument('--iterations', type=int, default=2000, help='Operations per lock and metrics measurement')
+
+    def handle(self, *args, **options):
+        for suite in options['suite'] or self.suites:
+            getattr(self, f'bench_{suite}')(options)
+
+    def _best_time(self, func, repeat):
+        best = None
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    def bench_chunking(self, options):
+        width = options['width'] or settings.DEVICE_CHAR_LIMIT
+        modes = (
+            ('greedy', dict(mode='greedy')),
+            ('optimal', dict(mode='optimal', hyphenate=options['hyphenate'])),
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Chunking ({width} cells per window)"))
+        # 'screens' counts what the device shows: a window longer than the
+        # display is scrolled through in several screens
+        self.stdout.write(
+            f"{'document':<28}{'mode':<10}{'windows':>9}{'screens':>9}{'split':>8}{'too long':>10}{'breaks/s':>12}"
+        )
+
+        totals = {name: [0, 0, 0, 0, 0.0] for name, _ in modes}
+        for document_id, text in _corpus():
+            for name, kwargs in modes:
+                chunks, elapsed = self._best_time(
+                    lambda: FirebaseService.chunk_text(text, width, **kwargs), options['repeat']
+                )
+                splits = count_split_words(chunks, text)
+                too_long = sum(1 for chunk in chunks if len(chunk) > width)
+                screens = sum(-(-len(chunk) // width) for chunk in chunks)
+                rate = len(chunks) / elapsed if elapsed else 0
+
+                total = totals[name]
+                total[0] += len(chunks)
+                total[1] += screens
+                total[2] += splits
+                total[3] += too_long
+                total[4] += elapsed
+                self.stdout.write(
+                    f"{document_id[:27]:<28}{name:<10}{len(chunks):>9}{screens:>9}{splits:>8}{too_long:>10}{rate:>12.0f}"
+                )
+
+        for name, (windows, screens, splits, too_long, elapsed) in totals.items():
+            rate = windows / elapsed if elapsed else 0
+            self.stdout.write(self.style.SUCCESS(
+                f"{'total':<28}{name:<10}{windows:>9}{screens:>9}{splits:>8}{too_long:>10}{rate:>12.0f}"
+            ))
+
+    def bench_locks(self, options):
+        iterations = max(1, options['iterations'])
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Device locks (uncontended, {iterations} iterations)"))
+
+        lock = DeviceLock('benchmark', timeout=1)
+        lock.acquire()
+        lock.release()  # create the table outside the timed loop
+
+        timings = {'acquire': [], 'renew': [], 'release': []}
+        for _ in range(iterations):
+            for name, step in (('acquire', lock.acquire), ('renew', lock.renew), ('release', lock.release)):
+                start = time.perf_counter()
+                step()
+                timings[name].append(time.perf_counter() - start)
+
+        self.stdout.write(f"{'operation':<12}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+        for name, samples in timings.items():
+            samples.sort()
+            mean = statistics.mean(samples) * 1e6
+            p50 = samples[len(samples) // 2] * 1e6
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+            style = self.style.SUCCESS if p99 < 1000 else self.style.WARNING
+            self.stdout.write(style(f"{name:<12}{mean:>10.1f}{p50:>10.1f}{p99:>10.1f}"))
+
+    def bench_metrics(self, options):
+        # Measure against a scratch directory so the benchmark series do not
+        # end up in the exported metrics
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.reset()
+            try:
+                self._bench_metrics(options)
+            finally:
+                metrics.reset()
+
+    def _bench_metrics(self, options):
+        iterations = max(1000, options['iterations'] * 50)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Metrics (per observation, {iterations} iterations)"))
+
+        counter = metrics.counter('braille_benchmark_total', 'Benchmark counter', ['label'])
+        histogram = metrics.histogram('braille_benchmark_seconds', 'Benchmark histogram', ['label'])
+        operations = (
+            ('counter.inc', lambda: counter.labels('x').inc()),
+            ('histogram.observe', lambda: histogram.labels('x').observe(0.02)),
+        )
+
+        self.stdout.write(f"{'operation':<20}{'ns/op':>10}")
+        for name, step in operations:
+            step()  # allocate the slots outside the timed loop
+
+            def run():
+                for _ in range(iterations):
+                    step()
+
+            _, elapsed = self._best_time(run, options['repeat'])
+            per_op = elapsed / iterations * 1e9
+            style = self.style.SUCCESS if per_op < 1000 else self.style.WARNING
+            self.stdout.write(style(f"{name:<20}{per_op:>10.0f}"))
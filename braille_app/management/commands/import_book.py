@@ -0,0 +1,37 @@
+"""
+Import a public-domain book into the local library.
+
+Usage:
+    python manage.py import_book pride_and_prejudice.txt
+    python manage.py import_book moby_dick.epub --id moby_dick --title "Moby Dick"
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from braille_app.library import LibraryError, import_book
+
+
+class Command(BaseCommand):
+    help = 'Import a plain-text or EPUB book into the local library'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .txt or .epub file')
+        parser.add_argument('--id', dest='book_id', default=None, help='Library id (defaults to the file name)')
+        parser.add_argument('--title', default=None, help='Title override')
+        parser.add_argument('--author', default=None, help='Author override')
+
+    def handle(self, *args, **options):
+        try:
+            meta = import_book(
+                options['path'],
+                book_id=options['book_id'],
+                title=options['title'],
+                author=options['author'],
+            )
+        except (LibraryError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported '{meta['title']}' as {meta['id']}: {len(meta['chapters'])} chapter(s), "
+            f"{meta['window_count']} device window(s), {meta['size']} bytes"
+        ))
@@ -0,0 +1,36 @@
+"""
+Refresh prefetched news digests for every category.
+
+Usage:
+    python manage.py prefetch_news          # one round
+    python manage.py prefetch_news --loop   # keep refreshing on NEWS_PREFETCH_INTERVAL
+"""
+
+from django.core.management.base import BaseCommand
+
+from braille_app.news_prefetch import NewsPrefetcher
+
+
+class Command(BaseCommand):
+    help = 'Prefetch news headlines and device payloads for every category'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running on the prefetch interval')
+        parser.add_argument('--interval', type=int, default=None, help='Seconds between rounds')
+        parser.add_argument('--workers', type=int, default=None, help='Concurrent category refreshes')
+
+    def handle(self, *args, **options):
+        prefetcher = NewsPrefetcher(interval=options['interval'], workers=options['workers'])
+
+        if options['loop']:
+            self.stdout.write(f"Prefetching news every {prefetcher.interval}s (Ctrl+C to stop)")
+            try:
+                prefetcher.run_forever()
+            except KeyboardInterrupt:
+                prefetcher.stop()
+            return
+
+        results = prefetcher.run_once()
+        for category, refreshed in results.items():
+            status = self.style.SUCCESS('refreshed') if refreshed else self.style.ERROR('failed')
+            self.stdout.write(f"{category}: {status}")
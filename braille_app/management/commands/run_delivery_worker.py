@@ -0,0 +1,44 @@
+"""
+Deliver queued DeliveryJobs to the braille devices.
+
+Usage:
+    python manage.py run_delivery_worker                   # run until stopped
+    python manage.py run_delivery_worker --concurrency 8
+    python manage.py run_delivery_worker --once            # drain the queue, prune old jobs and exit
+
+Run several of these processes for more throughput; they share the queue.
+"""
+
+import signal
+
+from django.core.management.base import BaseCommand
+
+from braille_app.delivery_queue import DeliveryWorker, prune_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run a delivery worker for queued device sends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None, help='Jobs run at once')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds between queue checks')
+        parser.add_argument('--once', action='store_true', help='Run every runnable job, then exit')
+
+    def handle(self, *args, **options):
+        worker = DeliveryWorker(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+
+        if options['once']:
+            ran = worker.run_once()
+            pruned = prune_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} job(s), deleted {pruned} old job(s)"))
+            return
+
+        # Render and gunicorn stop processes with SIGTERM: hand running jobs
+        # back at their current chunk so another worker resumes them at once
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+
+        self.stdout.write(f"Delivery worker {worker.owner} running {worker.concurrency} job(s) at a time (Ctrl+C to stop)")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            worker.stop()
@@ -0,0 +1,520 @@
+"""
+Metrics Module for Braille Display Website
+
+A small Prometheus-style metrics registry: counters, gauges and fixed-bucket
+histograms with labels, exported in the Prometheus text format at /metrics.
+
+Every process keeps its values in a memory-mapped file of doubles under
+settings.METRICS_DIR (`<pid>-<start>.values`, with the sample names in
+`<pid>-<start>.keys`), so recording a value is an in-memory update and any
+gunicorn worker can serve /metrics by summing the files of all workers.
+When a process starts it folds the counters and histograms of exited
+processes into `archive.json` and deletes their files; gauges only count
+live processes. With METRICS_DIR set to None values stay in process memory.
+
+Usage:
+    DELIVERIES = counter('braille_deliveries_total', 'Deliveries by status', ['status'])
+    DELIVERIES.labels('success').inc()
+
+    LATENCY = histogram('braille_write_seconds', 'Write latency', ['operation'])
+    with LATENCY.labels('set').time():
+        ...
+"""
+
+import bisect
+import contextlib
+import functools
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: files of exited processes are not compacted
+    fcntl = None
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_INITIAL_SLOTS = 4096
+_DOUBLE = struct.Struct('d')
+
+
+class _Store:
+    """
+    This process's sample values: an array of doubles plus a key index.
+    """
+
+    def __init__(self, directory):
+        self.lock = threading.Lock()
+        self.index = {}
+        self.directory = str(directory) if directory else None
+        self.values = None
+        self._mmap = None
+        self._keys = None
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            _compact(self.directory)
+            # Keyed by start time too: a recycled pid must not truncate the
+            # files of the exited process that had it
+            base = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}')
+            self._values_path = f'{base}.values'
+            open(self._values_path, 'xb').close()
+            self._keys = open(f'{base}.keys', 'x', encoding='utf-8')
+        self._resize(_INITIAL_SLOTS)
+
+    def _resize(self, slots):
+        if self.directory:
+            if self.values is not None:
+                self.values.release()
+                self._mmap.close()
+            with open(self._values_path, 'r+b') as f:
+                f.truncate(slots * _DOUBLE.size)
+                self._mmap = mmap.mmap(f.fileno(), slots * _DOUBLE.size)
+            self.values = memoryview(self._mmap).cast('d')
+        else:
+            values = memoryview(bytearray(slots * _DOUBLE.size)).cast('d')
+            if self.values is not None:
+                values[:len(self.values)] = self.values
+            self.values = values
+
+    def slot(self, key):
+        """
+        Slot of a sample, allocated on first use.
+        """
+        with self.lock:
+            slot = self.index.get(key)
+            if slot is None:
+                slot = len(self.index)
+                if slot >= len(self.values):
+                    self._resize(len(self.values) * 2)
+                self.values[slot] = 0.0
+                self.index[key] = slot
+                if self._keys is not None:
+                    self._keys.write(json.dumps([key, slot]) + '\n')
+                    self._keys.flush()
+            return slot
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _Store(settings.METRICS_DIR)
+        return _store
+
+
+def reset():
+    """
+    Start a new, empty store for this process (after a fork, or in tests).
+    """
+    global _store, _store_lock
+    _store = None
+    _store_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset)
+
+
+class _Sample:
+    """
+    One time series. Resolves its slot lazily so it follows forks.
+    """
+
+    __slots__ = ('key', 'store', 'slot')
+
+    def __init__(self, key):
+        self.key = key
+        self.store = None
+        self.slot = 0
+
+    def _resolve(self):
+        store = _store or _get_store()
+        if self.store is not store:
+            self.slot = store.slot(self.key)
+            self.store = store
+        return store
+
+    def inc(self, amount=1):
+        store = _store
+        if self.store is not store or store is None:
+            store = self._resolve()
+        # acquire/release rather than `with`: this is the hot path
+        lock = store.lock
+        lock.acquire()
+        store.values[self.slot] += amount
+        lock.release()
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        store = self._resolve()
+        with store.lock:
+            store.values[self.slot] = value
+
+    def get(self):
+        store = self._resolve()
+        return store.values[self.slot]
+
+
+class _HistogramSample:
+    """
+    Bucket counts, sum and count of one labelled histogram.
+    """
+
+    __slots__ = ('bounds', 'keys', 'store', 'slots')
+
+    def __init__(self, name, labels, bounds):
+        self.bounds = bounds
+        self.keys = [_key(f'{name}_bucket', labels, _format_float(le)) for le in bounds + (float('inf'),)]
+        self.keys += [_key(f'{name}_sum', labels), _key(f'{name}_count', labels)]
+        self.store = None
+        self.slots = None
+
+    def observe(self, value):
+        store = _store or _get_store()
+        if self.store is not store:
+            self.slots = [store.slot(key) for key in self.keys]
+            self.store = store
+        slots = self.slots
+        bucket = slots[bisect.bisect_left(self.bounds, value)]
+        lock = store.lock
+        lock.acquire()
+        values = store.values
+        values[bucket] += 1
+        values[slots[-2]] += value
+        values[slots[-1]] += 1
+        lock.release()
+
+    def time(self):
+        return _Timer(self.observe)
+
+
+class _Timer:
+    """
+    Context manager and decorator that records elapsed seconds.
+    """
+
+    def __init__(self, record):
+        self._record = record
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._record(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._record):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _key(sample_name, labels, le=None):
+    return json.dumps([sample_name, list(labels), le])
+
+
+def _format_float(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return f'{value:.1f}'
+    return repr(value)
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def labels(self, *values):
+        """
+        Get the time series for a set of label values (positional, in
+        labelnames order).
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._make_child(tuple(str(value) for value in values))
+                    self._children[values] = child
+        return child
+
+    def _make_child(self, labels):
+        return _Sample(_key(self.name, labels))
+
+    # Unlabelled metrics can be used directly
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != float('inf')))
+        super().__init__(name, documentation, labelnames)
+
+    def _make_child(self, labels):
+        return _HistogramSample(self.name, labels, self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+_registry = {}
+
+
+def counter(name, documentation, labelnames=()):
+    """Get or create a counter."""
+    return _registry.get(name) or Counter(name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    """Get or create a gauge (summed over live processes)."""
+    return _registry.get(name) or Gauge(name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """Get or create a histogram with fixed buckets (upper bounds in seconds)."""
+    return _registry.get(name) or Histogram(name, documentation, labelnames, buckets)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _read_files(directory):
+    """
+    Sample values per process from the metrics directory.
+
+    Yields:
+        tuple: (pid, file name without extension, {key: value})
+    """
+    for keys_path in glob.glob(os.path.join(directory, '*.keys')):
+        base = keys_path[:-len('.keys')]
+        name = os.path.basename(base)
+        try:
+            pid = int(name.split('-')[0])
+            with open(keys_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            with open(f'{base}.values', 'rb') as f:
+                data = f.read()
+        except (ValueError, OSError):
+            continue
+
+        values = {}
+        for line in lines:
+            try:
+                key, slot = json.loads(line)
+            except ValueError:
+                continue  # line still being written
+            if (slot + 1) * _DOUBLE.size <= len(data):
+                values[key] = _DOUBLE.unpack_from(data, slot * _DOUBLE.size)[0]
+        yield pid, name, values
+
+
+@contextlib.contextmanager
+def _directory_lock(directory, exclusive):
+    """
+    Lock the metrics directory: exclusive to compact it, shared to read it.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, 'metrics.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_archive(directory):
+    """
+    Summed samples of exited processes, and the files already folded in.
+    """
+    try:
+        with open(os.path.join(directory, 'archive.json'), 'r', encoding='utf-8') as f:
+            archive = json.load(f)
+        return archive['values'], archive['folded']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}, []
+
+
+def _compact(directory):
+    """
+    Fold the files of exited processes into the archive and delete them.
+
+    The archive lists the files it folded in, so files left behind by a
+    crash between writing it and deleting them are not counted twice.
+    """
+    if fcntl is None:
+        return
+
+    with _directory_lock(directory, exclusive=True):
+        values, folded = _read_archive(directory)
+        for name in folded:
+            _remove_files(directory, name)
+
+        folded = []
+        for pid, name, process_values in _read_files(directory):
+            if _pid_alive(pid):
+                continue
+            for key, value in process_values.items():
+                values[key] = values.get(key, 0.0) + value
+            folded.append(name)
+        if not folded:
+            return
+
+        path = os.path.join(directory, 'archive.json')
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'values': values, 'folded': folded}, f)
+        os.replace(f'{path}.tmp', path)
+        for name in folded:
+            _remove_files(directory, name)
+
+
+def _remove_files(directory, name):
+    for extension in ('keys', 'values'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(directory, f'{name}.{extension}'))
+
+
+def collect():
+    """
+    Current value of every sample, summed over processes.
+
+    Returns:
+        dict: key -> value
+    """
+    store = _store or _get_store()
+    if not store.directory:
+        with store.lock:
+            return {key: store.values[slot] for key, slot in store.index.items()}
+
+    gauges = {name for name, metric in _registry.items() if metric.type == 'gauge'}
+    with _directory_lock(store.directory, exclusive=False):
+        archived, folded = _read_archive(store.directory)
+        totals = {key: value for key, value in archived.items() if json.loads(key)[0] not in gauges}
+        folded = set(folded)
+        for pid, name, values in _read_files(store.directory):
+            if name in folded:
+                continue
+            alive = None
+            for key, value in values.items():
+                if json.loads(key)[0] in gauges:
+                    if alive is None:
+                        alive = _pid_alive(pid)
+                    if not alive:
+                        continue
+                totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels_text(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def generate_latest():
+    """
+    Render every registered metric in the Prometheus text format (0.0.4).
+
+    Returns:
+        str: Exposition text
+    """
+    samples = {}
+    for key, value in collect().items():
+        sample_name, labels, le = json.loads(key)
+        samples.setdefault(sample_name, []).append((tuple(labels), le, value))
+
+    lines = []
+    for name in sorted(_registry):
+        metric = _registry[name]
+        lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+        lines.append(f'# TYPE {name} {metric.type}')
+
+        if metric.type != 'histogram':
+            for labels, _, value in sorted(samples.get(name, [])):
+                lines.append(f'{name}{_labels_text(metric.labelnames, labels)} {_format_value(value)}')
+            continue
+
+        buckets = {}
+        for labels, le, value in samples.get(f'{name}_bucket', []):
+            buckets.setdefault(labels, {})[le] = value
+        sums = {labels: value for labels, _, value in samples.get(f'{name}_sum', [])}
+        counts = {labels: value for labels, _, value in samples.get(f'{name}_count', [])}
+
+        for labels in sorted(counts):
+            cumulative = 0.0
+            for bound in metric.buckets + (float('inf'),):
+                le = _format_float(bound)
+                cumulative += buckets.get(labels, {}).get(le, 0.0)
+                lines.append(f'{name}_bucket{_labels_text(metric.labelnames, labels, le)} {_format_value(cumulative)}')
+            lines.append(f'{name}_sum{_labels_text(metric.labelnames, labels)} {_format_value(sums.get(labels, 0.0))}')
+            lines.append(f'{name}_count{_labels_text(metric.labelnames, labels)} {_format_value(counts[labels])}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _format_value(value):
+    if value.is_integer():
+        return str(int(value))
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
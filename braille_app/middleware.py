@@ -0,0 +1,162 @@
+"""
+Middleware for Braille Display Website
+"""
+
+import logging
+import math
+import sqlite3
+import time
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import tracing
+from .metrics import counter, histogram
+from .rate_limiter import take_client_tokens
+
+logger = logging.getLogger(__name__)
+
+
+HTTP_REQUESTS = counter(
+    'braille_http_requests_total', 'HTTP requests by view, method and status', ['view', 'method', 'status']
+)
+HTTP_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+HTTP_LATENCY = histogram(
+    'braille_http_request_seconds', 'Time spent handling a request, by view', ['view']
+)
+
+CLIENT_REJECTIONS = counter(
+    'braille_client_rate_limited_total', 'Requests refused by the per-client rate limit', ['group']
+)
+
+
+class MetricsMiddleware:
+    """
+    Count and time every request, labelled by the URL name of its view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        # Arbitrary methods would make one time series each
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        HTTP_REQUESTS.labels(view, method, response.status_code).inc()
+        HTTP_LATENCY.labels(view).observe(elapsed)
+        return response
+
+
+class TracingMiddleware:
+    """
+    Trace a sample of requests (see tracing.py): write the spans to the trace
+    file and break the request down in a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not tracing.should_sample():
+            return self.get_response(request)
+
+        with tracing.start_trace('request', method=request.method, path=request.path) as root:
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            root.set('view', match.url_name if match else None)
+            root.set('status', response.status_code)
+
+        if settings.TRACE_SERVER_TIMING:
+            response['Server-Timing'] = tracing.server_timing(root.trace)
+        response['X-Trace-Id'] = root.trace.trace_id
+        tracing.export(root.trace)
+        return response
+
+
+class ClientRateLimitMiddleware:
+    """
+    Per-client token buckets for the expensive endpoints, configured per
+    route group in settings.CLIENT_RATE_LIMITS:
+
+        'send': {
+            'views': ['helper_custom_text', 'voice_command'],   # URL names
+            'methods': ['POST'],                                # default: POST only
+            'requests_per_minute': 20,
+            'burst': 5,
+        }
+
+    Every request is charged to its IP address: REMOTE_ADDR, or with
+    RATE_LIMIT_TRUST_FORWARDED_FOR the X-Forwarded-For hop added by our own
+    proxy (the rightmost one, which the client cannot forge). A session the
+    server knows is charged as well, so it cannot outrun its own limit from
+    several addresses; fresh sessions do not buy a new bucket. A request is
+    let through only if every bucket of every group of its view has a token.
+    Buckets live in the shared state database, so a limit holds across all
+    workers. Over-limit requests get a 429 with Retry-After before the view
+    (or CSRF checking) runs.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.groups = {}
+        for group, config in getattr(settings, 'CLIENT_RATE_LIMITS', {}).items():
+            for view in config['views']:
+                self.groups.setdefault(view, []).append((group, config))
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    @staticmethod
+    def client_ids(request):
+        address = request.META.get('REMOTE_ADDR', '')
+        if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+            forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[-1].strip()
+            if forwarded:
+                address = forwarded
+        clients = [f'ip:{address}']
+
+        session = getattr(request, 'session', None)
+        session_key = session.session_key if session is not None else None
+        if session_key and session.exists(session_key):
+            clients.append(f'session:{session_key}')
+        return clients
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        groups = self.groups.get(match.url_name) if match else None
+        if not groups:
+            return None
+
+        groups = [(group, config) for group, config in groups
+                  if request.method in config.get('methods', ('POST',))]
+        if not groups:
+            return None
+
+        clients = self.client_ids(request)
+        buckets = [
+            (f'{group}:{client}', config['requests_per_minute'], config['burst'])
+            for group, config in groups for client in clients
+        ]
+        try:
+            wait, empty = take_client_tokens(buckets)
+        except sqlite3.Error as e:
+            # A limiter that cannot reach its state lets traffic through
+            logger.warning("Client rate limit unavailable: %s", e)
+            return None
+        if not wait:
+            return None
+
+        for group in {bucket.split(':', 1)[0] for bucket in empty}:
+            CLIENT_REJECTIONS.labels(group).inc()
+        retry_after = max(1, math.ceil(wait))
+        response = JsonResponse({
+            'status': 'error',
+            'message': f"Too many requests - please wait {retry_after} seconds and try again",
+        }, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
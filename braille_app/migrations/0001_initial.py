@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookVolume',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('volume_id', models.CharField(max_length=64, unique=True)),
+                ('title', models.CharField(max_length=500)),
+                ('authors', models.JSONField(default=list)),
+                ('description', models.TextField(blank=True)),
+                ('publisher', models.CharField(blank=True, max_length=255)),
+                ('published_date', models.CharField(blank=True, max_length=32)),
+                ('page_count', models.IntegerField(default=0)),
+                ('preview_link', models.URLField(blank=True, max_length=1000)),
+                ('thumbnail', models.URLField(blank=True, max_length=1000)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'braille_app_bookvolume_fts'
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, authors, description,
+        content='braille_app_bookvolume', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS braille_app_bookvolume_ai AFTER INSERT ON braille_app_bookvolume BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, description)
+        VALUES (new.id, new.title, new.authors, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS braille_app_bookvolume_ad AFTER DELETE ON braille_app_bookvolume BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, description)
+        VALUES ('delete', old.id, old.title, old.authors, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS braille_app_bookvolume_au AFTER UPDATE ON braille_app_bookvolume BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, authors, description)
+        VALUES ('delete', old.id, old.title, old.authors, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, authors, description)
+        VALUES (new.id, new.title, new.authors, new.description);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS braille_app_bookvolume_au',
+    'DROP TRIGGER IF EXISTS braille_app_bookvolume_ad',
+    'DROP TRIGGER IF EXISTS braille_app_bookvolume_ai',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 is SQLite only; other databases fall back to LIKE queries
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0002_bookvolume_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64)),
+                ('document_id', models.CharField(max_length=128)),
+                ('window_offset', models.IntegerField(default=0)),
+                ('prefetched_until', models.IntegerField(default=0)),
+                ('windows_per_minute', models.FloatField(default=0)),
+                ('last_advanced_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device_id', 'document_id'), name='unique_reading_session')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0003_readingsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64)),
+                ('text', models.TextField()),
+                ('chunks', models.JSONField(default=list)),
+                ('acked_chunks', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=16)),
+                ('owner', models.CharField(blank=True, max_length=64)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('run_after', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='deliveryjob_status_idx'), models.Index(fields=['device_id', 'status'], name='deliveryjob_device_idx')],
+            },
+        ),
+    ]
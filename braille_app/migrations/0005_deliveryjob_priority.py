@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0004_deliveryjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='preempted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='priority',
+            field=models.SmallIntegerField(choices=[(0, 'Interactive'), (1, 'Notification'), (2, 'Bulk')], default=0),
+        ),
+    ]
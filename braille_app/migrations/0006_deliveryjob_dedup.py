@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0005_deliveryjob_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='generation',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryjob',
+            index=models.Index(fields=['device_id', 'content_hash'], name='deliveryjob_content_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deliveryjob',
+            index=models.Index(fields=['device_id', 'idempotency_key'], name='deliveryjob_idempotency_idx'),
+        ),
+    ]
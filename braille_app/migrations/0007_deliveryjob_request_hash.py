@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('braille_app', '0006_deliveryjob_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliveryjob',
+            name='request_hash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
@@ -1,8 +1,149 @@
 from django.db import models
 
-# No database models needed for this project
-# All text content is static or sent directly to Firebase
-# User data is not stored
+# Most content is static or sent directly to Firebase and user data is not stored.
+# The models below hold local copies of external data so features keep working
+# when the upstream APIs are slow, down or over quota.
 
-# If you need to add models in the future (e.g., user preferences, saved texts),
-# define them here
+
+class BookVolume(models.Model):
+    """
+    Book metadata cached from Google Books search results.
+
+    Searched through the `braille_app_bookvolume_fts` FTS5 table, which
+    triggers keep in sync with this table (see migration 0002).
+    """
+    volume_id = models.CharField(max_length=64, unique=True)
+    title = models.CharField(max_length=500)
+    authors = models.JSONField(default=list)
+    description = models.TextField(blank=True)
+    publisher = models.CharField(max_length=255, blank=True)
+    published_date = models.CharField(max_length=32, blank=True)
+    page_count = models.IntegerField(default=0)
+    preview_link = models.URLField(max_length=1000, blank=True)
+    thumbnail = models.URLField(max_length=1000, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
+
+    def to_dict(self):
+        """Return the volume in the dictionary format used by BooksService."""
+        return {
+            'id': self.volume_id,
+            'title': self.title,
+            'authors': self.authors,
+            'description': self.description,
+            'publisher': self.publisher,
+            'published_date': self.published_date,
+            'page_count': self.page_count,
+            'preview_link': self.preview_link,
+            'thumbnail': self.thumbnail,
+        }
+
+
+class ReadingSession(models.Model):
+    """
+    Where a device stopped reading a library document.
+
+    `window_offset` is the device window the reader is on. Windows up to
+    `prefetched_until` (exclusive) have already been written to Firebase.
+    `windows_per_minute` is a moving average of the reading rate, used to size
+    the lookahead.
+    """
+    device_id = models.CharField(max_length=64)
+    document_id = models.CharField(max_length=128)
+    window_offset = models.IntegerField(default=0)
+    prefetched_until = models.IntegerField(default=0)
+    windows_per_minute = models.FloatField(default=0)
+    last_advanced_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['device_id', 'document_id'], name='unique_reading_session'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id}: {self.document_id} @ {self.window_offset}"
+
+
+class DeliveryJob(models.Model):
+    """
+    Text queued for delivery to a device, with per-chunk progress.
+
+    Web workers only insert jobs; `manage.py run_delivery_worker` (or the
+    in-process worker thread) claims them with a lease that it renews on every
+    acknowledged chunk. `acked_chunks` is how many chunks Firebase has
+    accepted, so a job whose worker died resumes at that chunk once its lease
+    runs out.
+
+    Jobs of a more urgent `priority` lane run first; one queued for a device
+    that is streaming a less urgent job preempts it, and the preempted job
+    resumes at the chunk that was on the display.
+
+    `content_hash` and `idempotency_key` let a repeated send return the job
+    that already carries the content; `request_hash` is the hash of the
+    request the key came with, so a reused key cannot fetch another answer.
+    `generation` is the device's delivery generation when the job finished:
+    while it is still current, nothing else has been written to the device
+    since.
+    """
+    PRIORITY_CHOICES = [
+        (0, 'Interactive'),
+        (1, 'Notification'),
+        (2, 'Bulk'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    device_id = models.CharField(max_length=64)
+    text = models.TextField()
+    chunks = models.JSONField(default=list)
+    acked_chunks = models.IntegerField(default=0)
+    priority = models.SmallIntegerField(choices=PRIORITY_CHOICES, default=0)
+    preempted = models.BooleanField(default=False)
+    content_hash = models.CharField(max_length=16, blank=True)
+    idempotency_key = models.CharField(max_length=128, blank=True)
+    request_hash = models.CharField(max_length=16, blank=True)
+    generation = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued')
+    owner = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    run_after = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='deliveryjob_status_idx'),
+            models.Index(fields=['device_id', 'status'], name='deliveryjob_device_idx'),
+            models.Index(fields=['device_id', 'content_hash'], name='deliveryjob_content_idx'),
+            models.Index(fields=['device_id', 'idempotency_key'], name='deliveryjob_idempotency_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id}: job {self.pk} {self.status} ({self.acked_chunks}/{self.total_chunks})"
+
+    @property
+    def total_chunks(self):
+        return len(self.chunks)
+
+    def to_dict(self):
+        """Return the job in the result format of the send endpoints."""
+        return {
+            'job_id': self.pk,
+            'device_id': self.device_id,
+            'state': self.status,
+            'priority': self.get_priority_display().lower(),
+            'total_chunks': self.total_chunks,
+            'chunks_sent': self.acked_chunks,
+            'error': self.error,
+        }
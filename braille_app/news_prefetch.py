@@ -0,0 +1,242 @@
+"""
+News Prefetch Module for Braille Display Website
+
+Refreshes every news category on a schedule so category pages never wait on
+NewsAPI. Each refresh also prepares the device payload (formatted news text and
+its chunks), stages it in a Firebase content slot and stores the digest in the
+shared state database, where every gunicorn worker can read it.
+
+Run it either in-process (settings.NEWS_PREFETCH_AUTOSTART) or as a separate
+process with `python manage.py prefetch_news --loop`.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+from .shared_state import ensure_table, get_connection, transaction
+from .news_service import NEWS_CATEGORY_MAP, get_news_service
+from .firebase_service import FirebaseService
+from .devices import get_device_profile
+
+logger = logging.getLogger(__name__)
+
+
+DIGESTS_DDL = """
+    CREATE TABLE IF NOT EXISTS news_digests (
+        category TEXT PRIMARY KEY,
+        payload TEXT NOT NULL,
+        prepared_at REAL NOT NULL
+    )
+"""
+
+SCHEDULE_DDL = """
+    CREATE TABLE IF NOT EXISTS scheduled_runs (
+        name TEXT PRIMARY KEY,
+        next_run_at REAL NOT NULL
+    )
+"""
+
+
+def get_news_digest(category, max_age=None):
+    """
+    Get the prefetched digest for a URL category.
+
+    A digest older than `max_age` (settings.NEWS_DIGEST_MAX_AGE) is ignored,
+    so readers fall back to a live fetch when the prefetch stopped or keeps
+    failing instead of getting the same headlines forever.
+
+    Args:
+        category (str): URL category (key of NEWS_CATEGORY_MAP)
+        max_age (float): Oldest digest to serve, in seconds
+
+    Returns:
+        dict: articles, news_text, chunks and prepared_at - or None if not prefetched (or too old)
+    """
+    max_age = settings.NEWS_DIGEST_MAX_AGE if max_age is None else max_age
+    ensure_table('news_digests', DIGESTS_DDL)
+    row = get_connection().execute(
+        'SELECT payload, prepared_at FROM news_digests WHERE category = ?', (category,)
+    ).fetchone()
+
+    if row is None:
+        return None
+    if time.time() - row[1] > max_age:
+        logger.warning("News digest for %s is %d seconds old; fetching live", category, time.time() - row[1])
+        return None
+
+    digest = json.loads(row[0])
+    digest['prepared_at'] = row[1]
+    return digest
+
+
+def build_news_digest(category, articles):
+    """
+    Prepare everything the category view needs to deliver news.
+
+    Args:
+        category (str): URL category
+        articles (list): Article dictionaries from NewsService
+
+    Returns:
+        dict: articles, news_text and chunks (sized for the default device)
+    """
+    news_text = get_news_service().format_news_text(category, articles)
+    profile = get_device_profile()
+    return {
+        'articles': articles[:5],
+        'news_text': news_text,
+        'chunks': FirebaseService.chunk_text(news_text, profile.cells, mode=profile.chunk_mode),
+    }
+
+
+def store_news_digest(category, digest):
+    """
+    Save a digest to the shared state database.
+    """
+    ensure_table('news_digests', DIGESTS_DDL)
+    with transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO news_digests (category, payload, prepared_at) VALUES (?, ?, ?)',
+            (category, json.dumps(digest), time.time())
+        )
+
+
+class NewsPrefetcher:
+    """
+    Periodically refreshes all news categories on a small thread pool.
+
+    Failed categories are retried with jittered exponential backoff; the last
+    good digest stays in place until a refresh succeeds.
+    """
+
+    def __init__(self, interval=None, workers=None):
+        self.interval = interval or settings.NEWS_PREFETCH_INTERVAL
+        self.workers = workers or settings.NEWS_PREFETCH_WORKERS
+        self._failures = {}
+        self._retry_at = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh_category(self, category):
+        """
+        Fetch, format and store one category.
+
+        Returns:
+            bool: True if a new digest was stored
+        """
+        # Spread requests out so all categories do not hit NewsAPI at once
+        jitter = settings.NEWS_PREFETCH_JITTER
+        if jitter:
+            time.sleep(random.uniform(0, jitter))
+
+        articles = None
+        for attempt in range(settings.NEWS_PREFETCH_RETRIES + 1):
+            articles = get_news_service().refresh_headlines(NEWS_CATEGORY_MAP[category])
+            if articles:
+                break
+            if attempt < settings.NEWS_PREFETCH_RETRIES:
+                time.sleep(settings.NEWS_PREFETCH_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.0))
+
+        if not articles:
+            # Skip this category for a growing number of rounds
+            failures = self._failures.get(category, 0) + 1
+            self._failures[category] = failures
+            skip = min(8, 2 ** (failures - 1)) * self.interval
+            self._retry_at[category] = time.time() + skip * random.uniform(0.5, 1.0)
+            logger.warning("News prefetch failed for %s (%d in a row)", category, failures)
+            return False
+
+        digest = build_news_digest(category, articles)
+        try:
+            # Stage the device payload now so a category request is one pointer write
+            digest['slot'] = FirebaseService.stage_slot(f'news_{category}', digest['news_text'], digest['chunks'])
+        except Exception as e:
+            logger.warning("Could not stage news slot for %s: %s", category, e)
+
+        store_news_digest(category, digest)
+        self._failures.pop(category, None)
+        self._retry_at.pop(category, None)
+        return True
+
+    def run_once(self):
+        """
+        Refresh every category concurrently, skipping those still backing off.
+
+        Returns:
+            dict: category -> True/False (refreshed or not), skipped ones omitted
+        """
+        now = time.time()
+        categories = [c for c in NEWS_CATEGORY_MAP if self._retry_at.get(c, 0) <= now]
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='news-prefetch') as pool:
+            results = pool.map(self.refresh_category, categories)
+            return dict(zip(categories, results))
+
+    def claim_run(self):
+        """
+        Claim the next scheduled run across all workers.
+
+        Every web worker may run a scheduler thread; only the one that claims
+        the run slot fetches, so NewsAPI quota use does not grow with workers.
+
+        Returns:
+            bool: True if this process should run now
+        """
+        now = time.time()
+        ensure_table('scheduled_runs', SCHEDULE_DDL)
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT next_run_at FROM scheduled_runs WHERE name = 'news_prefetch'"
+            ).fetchone()
+            if row is not None and row[0] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO scheduled_runs (name, next_run_at) VALUES ('news_prefetch', ?)",
+                (now + self.interval,)
+            )
+        return True
+
+    def run_forever(self):
+        """
+        Run scheduled refreshes until stop() is called.
+        """
+        while not self._stop.is_set():
+            try:
+                if self.claim_run():
+                    self.run_once()
+            except Exception as e:
+                logger.exception("News prefetch error: %s", e)
+            # Check the shared schedule every minute; another worker may own the run
+            self._stop.wait(min(self.interval, 60))
+
+    def start(self):
+        """
+        Start the scheduler in a daemon thread.
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='news-prefetch-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the scheduler thread.
+        """
+        self._stop.set()
+
+
+# Singleton instance
+_news_prefetcher = None
+
+def get_news_prefetcher():
+    """Get or create NewsPrefetcher instance."""
+    global _news_prefetcher
+    if _news_prefetcher is None:
+        _news_prefetcher = NewsPrefetcher()
+    return _news_prefetcher
@@ -6,15 +6,44 @@ This module integrates with NewsAPI to fetch real-time news articles.
 
 from django.conf import settings
 import requests
+import logging
+import threading
+import time
 from datetime import datetime
 
+from .rate_limiter import get_rate_limiter, is_throttle_error
+from .metrics import counter, histogram
+from .tracing import traced
+
+logger = logging.getLogger(__name__)
+
 # Check if newsapi-python is available
 try:
     from newsapi import NewsApiClient
     NEWSAPI_AVAILABLE = True
 except ImportError:
     NEWSAPI_AVAILABLE = False
-    print("Warning: newsapi-python not installed. Install with: pip install newsapi-python")
+    logger.warning("newsapi-python not installed. Install with: pip install newsapi-python")
+
+
+# URL categories shown in the UI mapped to NewsAPI categories
+NEWS_CATEGORY_MAP = {
+    'headlines': 'general',
+    'technology': 'technology',
+    'sports': 'sports',
+    'business': 'business'
+}
+
+
+UPSTREAM_SECONDS = histogram(
+    'braille_upstream_request_seconds', 'External API call latency', ['api', 'operation']
+)
+UPSTREAM_ERRORS = counter(
+    'braille_upstream_errors_total', 'External API calls that failed', ['api', 'operation']
+)
+NEWS_CACHE_EVENTS = counter(
+    'braille_news_cache_events_total', 'Headline cache hits, stale hits, misses and refreshes', ['event']
+)
 
 
 class NewsService:
@@ -28,18 +57,35 @@ class NewsService:
         self.articles_per_category = settings.NEWS_API_ARTICLES_PER_CATEGORY
         self.newsapi = None
         
+        # Stale-while-revalidate headline cache: (category, country) -> (articles, fetched_at)
+        self._headline_cache = {}
+        self._cache_lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+        self._cache_stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+        }
+        
         # Initialize API client if available
         if NEWSAPI_AVAILABLE and self.api_key and self.api_key != 'YOUR_NEWS_API_KEY_HERE':
             try:
                 self.newsapi = NewsApiClient(api_key=self.api_key)
-                print("NewsAPI initialized successfully")
+                logger.info("NewsAPI initialized successfully")
             except Exception as e:
-                print(f"NewsAPI initialization failed: {e}")
+                logger.warning("NewsAPI initialization failed: %s", e)
     
     def get_top_headlines(self, category='general', country='us'):
         """
         Fetch top headlines for a specific category.
         
+        Results are cached per (category, country). A fresh entry is returned
+        as-is; a stale entry is returned immediately while a single background
+        refresh fetches a new copy. Only a cold miss waits on NewsAPI.
+        
         Args:
             category: news category (general, technology, sports, etc.)
             country: country code (us, uk, etc.)
@@ -47,31 +93,170 @@ class NewsService:
         Returns:
             list: List of article dictionaries
         """
-        if self.newsapi:
-            try:
+        if not self.newsapi:
+            return self._get_placeholder_news(category)
+        
+        key = (category, country)
+        entry = self._headline_cache.get(key)
+        
+        if entry:
+            articles, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < settings.NEWS_CACHE_FRESH_TTL:
+                self._count('hits')
+                return articles
+            if age < settings.NEWS_CACHE_STALE_TTL:
+                self._count('stale_hits')
+                self._refresh_in_background(key)
+                return articles
+        
+        self._count('misses')
+        with self._get_key_lock(key):
+            # Another thread may have filled the cache while we waited
+            entry = self._headline_cache.get(key)
+            if entry and time.time() - entry[1] < settings.NEWS_CACHE_FRESH_TTL:
+                return entry[0]
+            
+            articles = self._refresh(key)
+            if articles is not None:
+                return articles
+        
+        # Serve an expired copy rather than placeholders if NewsAPI is failing
+        if entry:
+            return entry[0]
+        
+        # Fallback to placeholder content
+        return self._get_placeholder_news(category)
+    
+    @traced('newsapi.top_headlines')
+    def _fetch_top_headlines(self, category, country):
+        """
+        Call NewsAPI for top headlines.
+        
+        Returns:
+            list: Articles, or None if the request failed
+        """
+        try:
+            get_rate_limiter().acquire('newsapi')
+            with UPSTREAM_SECONDS.labels('newsapi', 'top_headlines').time():
                 response = self.newsapi.get_top_headlines(
                     category=category,
                     country=country,
                     page_size=self.articles_per_category
                 )
-                
-                if response['status'] == 'ok':
-                    articles = []
-                    for article in response['articles']:
-                        articles.append({
-                            'title': article['title'],
-                            'content': article['description'] or article['content'] or 'No content available.',
-                            'source': article['source']['name'],
-                            'url': article['url'],
-                            'published_at': article['publishedAt']
-                        })
-                    return articles
-            except Exception as e:
-                print(f"Error fetching news: {e}")
+            
+            if response['status'] == 'ok':
+                articles = []
+                for article in response['articles']:
+                    articles.append({
+                        'title': article['title'],
+                        'content': article['description'] or article['content'] or 'No content available.',
+                        'source': article['source']['name'],
+                        'url': article['url'],
+                        'published_at': article['publishedAt']
+                    })
+                return articles
+        except Exception as e:
+            logger.warning("Error fetching news: %s", e, extra={'category': category})
+            UPSTREAM_ERRORS.labels('newsapi', 'top_headlines').inc()
+            if is_throttle_error(e):
+                get_rate_limiter().report_throttled('newsapi')
         
-        # Fallback to placeholder content
-        return self._get_placeholder_news(category)
+        return None
+    
+    def refresh_headlines(self, category='general', country='us'):
+        """
+        Fetch headlines from NewsAPI now, bypassing the cache, and store them.
+        
+        Used by the prefetch scheduler. Placeholder content is returned when
+        NewsAPI is not configured.
+        
+        Returns:
+            list: Articles, or None if the request failed
+        """
+        if not self.newsapi:
+            return self._get_placeholder_news(category)
+        
+        with self._get_key_lock((category, country)):
+            return self._refresh((category, country))
+    
+    def format_news_text(self, category, articles):
+        """
+        Format articles as the text sent to the braille device.
+        
+        Args:
+            category: category name as shown to the user
+            articles: list of article dictionaries
+        
+        Returns:
+            str: News text for the device
+        """
+        news_text = f"{category.upper()} NEWS:\n\n"
+        for i, article in enumerate(articles[:5], 1):
+            news_text += f"{i}. {article['title']}\n{article.get('content', '')}\n\n"
+        return news_text
+    
+    def _refresh(self, key):
+        """
+        Fetch headlines for a cache key and store them.
+        
+        Returns:
+            list: Articles, or None if the request failed
+        """
+        self._count('refreshes')
+        articles = self._fetch_top_headlines(*key)
+        
+        if articles is None:
+            self._count('refresh_errors')
+            return None
+        
+        self._headline_cache[key] = (articles, time.time())
+        return articles
+    
+    def _refresh_in_background(self, key):
+        """
+        Start a background refresh for a key unless one is already running.
+        """
+        with self._cache_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def run():
+            try:
+                with self._get_key_lock(key):
+                    self._refresh(key)
+            finally:
+                with self._cache_lock:
+                    self._refreshing.discard(key)
+        
+        threading.Thread(target=run, name=f"news-refresh-{key[0]}", daemon=True).start()
+    
+    def _get_key_lock(self, key):
+        with self._cache_lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+    
+    def _count(self, stat):
+        with self._cache_lock:
+            self._cache_stats[stat] += 1
+        NEWS_CACHE_EVENTS.labels(stat).inc()
     
+    def get_cache_stats(self):
+        """
+        Get headline cache metrics.
+        
+        Returns:
+            dict: hits, stale_hits, misses, refreshes, refresh_errors and entries
+        """
+        with self._cache_lock:
+            stats = dict(self._cache_stats)
+            stats['refreshing'] = len(self._refreshing)
+        stats['entries'] = len(self._headline_cache)
+        return stats
+    
+    @traced('newsapi.search')
     def search_news(self, query, sort_by='relevancy'):
         """
         Search for news articles by keyword.
@@ -85,12 +270,14 @@ class NewsService:
         """
         if self.newsapi:
             try:
-                response = self.newsapi.get_everything(
-                    q=query,
-                    sort_by=sort_by,
-                    page_size=self.articles_per_category,
-                    language='en'
-                )
+                get_rate_limiter().acquire('newsapi')
+                with UPSTREAM_SECONDS.labels('newsapi', 'everything').time():
+                    response = self.newsapi.get_everything(
+                        q=query,
+                        sort_by=sort_by,
+                        page_size=self.articles_per_category,
+                        language='en'
+                    )
                 
                 if response['status'] == 'ok':
                     articles = []
@@ -104,7 +291,10 @@ class NewsService:
                         })
                     return articles
             except Exception as e:
-                print(f"Error searching news: {e}")
+                logger.warning("Error searching news: %s", e)
+                UPSTREAM_ERRORS.labels('newsapi', 'everything').inc()
+                if is_throttle_error(e):
+                    get_rate_limiter().report_throttled('newsapi')
         
         return self._get_placeholder_news('search')
     
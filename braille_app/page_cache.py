@@ -0,0 +1,119 @@
+"""
+Page Cache Module for Braille Display Website
+
+The menu pages and the GET side of the helper pages are the same for every
+visitor until the next deploy. `@cached_page` renders such a page once per
+deploy version and keeps the HTML in the process and in the shared cache
+(settings.CACHES), so other workers and restarted ones do not render it again.
+
+Responses carry an ETag (deploy version + path) and Last-Modified (newest
+template or app source file), with `Cache-Control: no-cache`: browsers revalidate every time, and
+an unchanged page costs a 304 with no body. A deploy changes the version,
+which retires every cached copy and ETag at once.
+
+Cached pages must not embed per-visitor values. Pages that post back read
+the CSRF token from its cookie (csrfToken() in base.html); the decorator makes
+sure the cookie is set.
+"""
+
+import functools
+import hashlib
+import os
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .metrics import counter
+
+
+PAGE_CACHE_EVENTS = counter(
+    'braille_page_cache_events_total', 'Cached page hits, renders and 304 responses', ['event']
+)
+
+_pages = {}
+
+
+@functools.lru_cache(maxsize=None)
+def source_stamp():
+    """
+    Newest modification time of the templates and app code.
+    """
+    newest = 0.0
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    for root in [str(directory) for directory in settings.TEMPLATES[0]['DIRS']] + [app_dir]:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(('.html', '.py')):
+                    newest = max(newest, os.path.getmtime(os.path.join(dirpath, filename)))
+    return newest
+
+
+def deploy_version():
+    """
+    settings.DEPLOY_VERSION, or a stamp of the source files when it is unset.
+    """
+    return settings.DEPLOY_VERSION or f'src{int(source_stamp())}'
+
+
+def _etag(version, path):
+    return '"' + hashlib.sha1(f'{version}:{path}'.encode('utf-8')).hexdigest()[:16] + '"'
+
+
+def _finish(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def cached_page(view):
+    """
+    Decorator: serve GET/HEAD for a view from the page cache, with
+    conditional GET support. Other methods go to the view as usual.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.PAGE_CACHE_ENABLED:
+            return view(request, *args, **kwargs)
+
+        if settings.CSRF_COOKIE_NAME not in request.COOKIES:
+            get_token(request)  # the page reads it from the cookie
+        version = deploy_version()
+        etag = _etag(version, request.path)
+        last_modified = int(source_stamp())
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            PAGE_CACHE_EVENTS.labels('not_modified').inc()
+            return _finish(response, etag, last_modified)
+
+        key = f'page:{version}:{request.path}'
+        page = _pages.get(key)
+        if page is None:
+            page = cache.get(key)
+            if page is not None:
+                _pages[key] = page
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            page = (response.content, response['Content-Type'])
+            cache.set(key, page, settings.PAGE_CACHE_SECONDS)
+            _pages[key] = page
+            PAGE_CACHE_EVENTS.labels('render').inc()
+        else:
+            PAGE_CACHE_EVENTS.labels('hit').inc()
+
+        content, content_type = page
+        return _finish(HttpResponse(content, content_type=content_type), etag, last_modified)
+    return wrapper
+
+
+def clear():
+    """
+    Forget the pages cached in this process (for tests).
+    """
+    _pages.clear()
@@ -0,0 +1,88 @@
+"""
+Popular Books Registry for Braille Display Website
+
+The curated books offered on the visually impaired Books page. The registry is
+built once at import time with O(1) lookup by id, and the device payload for
+every entry (its chunks) is prepared once at startup instead of on every
+selection.
+"""
+
+import threading
+
+from .firebase_service import FirebaseService
+from .devices import get_device_profile
+
+
+# Popular books collection
+POPULAR_BOOKS = (
+    {
+        'id': 'atomic_habits',
+        'title': 'Atomic Habits',
+        'author': 'James Clear',
+        'content': 'Atomic Habits by James Clear. Chapter 1: The Surprising Power of Atomic Habits. Habits are the compound interest of self-improvement. The same way that money multiplies through compound interest, the effects of your habits multiply as you repeat them.'
+    },
+    {
+        'id': 'think_and_grow_rich',
+        'title': 'Think and Grow Rich',
+        'author': 'Napoleon Hill',
+        'content': 'Think and Grow Rich by Napoleon Hill. Introduction: The Man Who Thought His Way into Partnership with Thomas Edison. This book teaches you the thirteen steps to riches. Success comes to those who become success conscious.'
+    },
+    {
+        'id': 'power_of_now',
+        'title': 'The Power of Now',
+        'author': 'Eckhart Tolle',
+        'content': 'The Power of Now by Eckhart Tolle. Chapter 1: You Are Not Your Mind. The greatest obstacle to enlightenment is identification with your mind, which causes thought to become compulsive.'
+    },
+    {
+        'id': 'rich_dad_poor_dad',
+        'title': 'Rich Dad Poor Dad',
+        'author': 'Robert Kiyosaki',
+        'content': "Rich Dad Poor Dad by Robert Kiyosaki. Introduction: The rich don't work for money. The poor and middle class work for money. The rich have money work for them. Learn the difference between assets and liabilities."
+    }
+)
+
+POPULAR_BOOKS_BY_ID = {book['id']: book for book in POPULAR_BOOKS}
+
+_payloads = {}
+_payloads_lock = threading.Lock()
+
+
+def prepare_popular_books():
+    """
+    Chunk every popular book for the default device. Called once at startup.
+    """
+    profile = get_device_profile()
+    payloads = {
+        book['id']: {
+            'text': book['content'],
+            'chunks': FirebaseService.chunk_text(book['content'], profile.cells, mode=profile.chunk_mode),
+        }
+        for book in POPULAR_BOOKS
+    }
+    with _payloads_lock:
+        _payloads.update(payloads)
+
+
+def get_popular_book(book_id):
+    """
+    Get a popular book by id.
+
+    Returns:
+        dict: The book, or None if the id is unknown
+    """
+    return POPULAR_BOOKS_BY_ID.get(book_id)
+
+
+def get_popular_book_payload(book_id):
+    """
+    Get the prepared device payload for a popular book.
+
+    Returns:
+        dict: text and chunks, or None if the id is unknown
+    """
+    payload = _payloads.get(book_id)
+    if payload is None and book_id in POPULAR_BOOKS_BY_ID:
+        # Not prepared yet (e.g. ready() has not run in this process)
+        prepare_popular_books()
+        payload = _payloads.get(book_id)
+    return payload
@@ -0,0 +1,323 @@
+"""
+Rate Limiter Module for Braille Display Website
+
+Client-side rate control for the outbound APIs (Gemini, NewsAPI, Google Books).
+Each API gets two token buckets - one for requests and one for model tokens -
+whose state is kept in the shared SQLite database so the quota holds across
+all gunicorn workers.
+
+Callers that cannot get a slot within their deadline are rejected early
+instead of hitting the upstream API and collecting 429s.
+
+The same kind of bucket, kept per client, backs the inbound admission control
+in ClientRateLimitMiddleware (see take_client_tokens).
+"""
+
+import random
+import time
+import threading
+from django.conf import settings
+
+from .metrics import counter
+from .shared_state import ensure_table, transaction
+
+
+BUCKETS_DDL = """
+    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        api TEXT PRIMARY KEY,
+        request_tokens REAL NOT NULL,
+        model_tokens REAL NOT NULL,
+        blocked_until REAL NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    )
+"""
+
+
+CLIENT_BUCKETS_DDL = """
+    CREATE TABLE IF NOT EXISTS client_rate_buckets (
+        bucket TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+"""
+
+# Idle client buckets are full again long before this; drop them
+CLIENT_BUCKET_TTL = 3600
+
+
+RATE_LIMIT_REJECTIONS = counter(
+    'braille_rate_limit_rejections_total', 'Calls refused by the client-side rate limiter', ['api', 'reason']
+)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when an API call is rejected by the client-side rate limiter."""
+
+    def __init__(self, api, retry_after=None):
+        self.api = api
+        self.retry_after = retry_after
+        message = f"Rate limit reached for {api}"
+        if retry_after is not None:
+            message += f" - retry in {retry_after:.1f}s"
+        super().__init__(message)
+
+
+def estimate_tokens(text):
+    """
+    Rough token estimate for model quotas (about 4 characters per token).
+
+    Args:
+        text (str): Prompt or response text
+
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+def is_throttle_error(error):
+    """
+    Check whether an exception from an upstream client means "too many requests".
+
+    Args:
+        error (Exception): Exception raised by requests, newsapi or google-genai
+
+    Returns:
+        bool: True if the upstream API throttled us
+    """
+    if isinstance(error, RateLimitExceeded):
+        return False
+
+    if getattr(error, 'code', None) == 429 or getattr(error, 'status_code', None) == 429:
+        return True
+
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return True
+
+    message = str(error)
+    return 'rateLimited' in message or 'RESOURCE_EXHAUSTED' in message or '429' in message
+
+
+class RateLimiter:
+    """
+    Shared token-bucket rate limiter with a small per-process wait queue.
+
+    Limits are read from settings.API_RATE_LIMITS:
+
+        'newsapi': {
+            'requests_per_minute': 0.07,   # refill rate of the request bucket
+            'burst': 10,                   # request bucket capacity
+            'tokens_per_minute': None,     # refill rate of the model-token bucket
+            'max_wait': 2,                 # default deadline for a caller (seconds)
+            'max_waiters': 4,              # callers allowed to queue per process
+        }
+
+    APIs without an entry are not limited.
+    """
+
+    def __init__(self):
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+
+    def _get_config(self, api):
+        return getattr(settings, 'API_RATE_LIMITS', {}).get(api)
+
+    def _waiter_slots(self, api, config):
+        with self._waiters_lock:
+            if api not in self._waiters:
+                self._waiters[api] = threading.BoundedSemaphore(config.get('max_waiters', 4))
+            return self._waiters[api]
+
+    def _try_take(self, api, config, tokens):
+        """
+        Refill both buckets and take one request plus `tokens` model tokens.
+
+        Returns:
+            float: 0 if the slot was taken, otherwise seconds until it could be
+        """
+        request_rate = config['requests_per_minute'] / 60.0
+        request_capacity = config.get('burst', config['requests_per_minute'])
+        token_rate = (config.get('tokens_per_minute') or 0) / 60.0
+        token_capacity = config.get('tokens_per_minute') or 0
+        now = time.time()
+
+        ensure_table('rate_limit_buckets', BUCKETS_DDL)
+        with transaction() as conn:
+            row = conn.execute(
+                'SELECT request_tokens, model_tokens, blocked_until, updated_at '
+                'FROM rate_limit_buckets WHERE api = ?', (api,)
+            ).fetchone()
+
+            if row is None:
+                request_tokens, model_tokens, blocked_until = request_capacity, token_capacity, 0
+            else:
+                request_tokens, model_tokens, blocked_until, updated_at = row
+                elapsed = max(0.0, now - updated_at)
+                request_tokens = min(request_capacity, request_tokens + elapsed * request_rate)
+                model_tokens = min(token_capacity, model_tokens + elapsed * token_rate)
+
+            wait = 0.0
+            if blocked_until > now:
+                wait = blocked_until - now
+            if request_tokens < 1:
+                wait = max(wait, (1 - request_tokens) / request_rate if request_rate else float('inf'))
+            if token_capacity and model_tokens < tokens:
+                # A single call larger than the bucket can only wait for a full bucket
+                needed = min(tokens, token_capacity) - model_tokens
+                wait = max(wait, needed / token_rate)
+
+            if wait == 0.0:
+                request_tokens -= 1
+                if token_capacity:
+                    model_tokens -= tokens
+
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limit_buckets '
+                '(api, request_tokens, model_tokens, blocked_until, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (api, request_tokens, model_tokens, blocked_until, now)
+            )
+
+        return wait
+
+    def acquire(self, api, tokens=0, timeout=None):
+        """
+        Wait for a slot for one call to `api`.
+
+        If the slot cannot be available before the deadline, the call is
+        rejected immediately rather than after sleeping out the deadline.
+
+        Args:
+            api (str): API name as used in settings.API_RATE_LIMITS
+            tokens (int): Model tokens this call is expected to use
+            timeout (float): Maximum seconds to wait (defaults to the API's max_wait)
+
+        Raises:
+            RateLimitExceeded: If no slot is available within the deadline
+        """
+        config = self._get_config(api)
+        if not config:
+            return
+
+        if timeout is None:
+            timeout = config.get('max_wait', 0)
+        deadline = time.time() + timeout
+
+        wait = self._try_take(api, config, tokens)
+        if wait == 0.0:
+            return
+        if wait > timeout:
+            RATE_LIMIT_REJECTIONS.labels(api, 'wait_too_long').inc()
+            raise RateLimitExceeded(api, wait)
+
+        slots = self._waiter_slots(api, config)
+        if not slots.acquire(blocking=False):
+            # Wait queue is full - reject instead of piling up blocked workers
+            RATE_LIMIT_REJECTIONS.labels(api, 'queue_full').inc()
+            raise RateLimitExceeded(api, wait)
+
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if wait > remaining:
+                    RATE_LIMIT_REJECTIONS.labels(api, 'deadline').inc()
+                    raise RateLimitExceeded(api, wait)
+                time.sleep(wait)
+                wait = self._try_take(api, config, tokens)
+                if wait == 0.0:
+                    return
+        finally:
+            slots.release()
+
+    def report_throttled(self, api, retry_after=None):
+        """
+        Record an upstream 429 so every worker backs off, not just this one.
+
+        Args:
+            api (str): API name
+            retry_after (float): Seconds to pause (defaults to a 60 second cool-down)
+        """
+        if not self._get_config(api):
+            return
+
+        if retry_after is None:
+            retry_after = 60
+        now = time.time()
+
+        ensure_table('rate_limit_buckets', BUCKETS_DDL)
+        with transaction() as conn:
+            conn.execute(
+                'INSERT INTO rate_limit_buckets (api, request_tokens, model_tokens, blocked_until, updated_at) '
+                'VALUES (?, 0, 0, ?, ?) '
+                'ON CONFLICT(api) DO UPDATE SET request_tokens = 0, blocked_until = excluded.blocked_until, '
+                'updated_at = excluded.updated_at',
+                (api, now + retry_after, now)
+            )
+
+    def reset(self, api=None):
+        """
+        Clear stored bucket state (all APIs if `api` is None).
+        """
+        ensure_table('rate_limit_buckets', BUCKETS_DDL)
+        with transaction() as conn:
+            if api is None:
+                conn.execute('DELETE FROM rate_limit_buckets')
+            else:
+                conn.execute('DELETE FROM rate_limit_buckets WHERE api = ?', (api,))
+
+
+def take_client_tokens(buckets):
+    """
+    Take one request from each of a client's token buckets - from all of
+    them or, if any is empty, from none.
+
+    Args:
+        buckets (list): (bucket key, requests per minute, burst) tuples, e.g.
+            ('send:ip:203.0.113.7', 20, 5)
+
+    Returns:
+        tuple: (0 if the request may proceed, otherwise seconds until it
+            could; keys of the buckets that were empty)
+    """
+    now = time.time()
+
+    ensure_table('client_rate_buckets', CLIENT_BUCKETS_DDL)
+    with transaction() as conn:
+        levels = []
+        empty = []
+        wait = 0.0
+        for bucket, requests_per_minute, burst in buckets:
+            rate = requests_per_minute / 60.0
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM client_rate_buckets WHERE bucket = ?', (bucket,)
+            ).fetchone()
+            if row is None:
+                tokens = burst
+            else:
+                tokens = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate if rate else float('inf'))
+                empty.append(bucket)
+            levels.append((bucket, tokens))
+
+        conn.executemany(
+            'INSERT OR REPLACE INTO client_rate_buckets (bucket, tokens, updated_at) VALUES (?, ?, ?)',
+            [(bucket, tokens if empty else tokens - 1, now) for bucket, tokens in levels]
+        )
+        if random.random() < 0.01:
+            conn.execute('DELETE FROM client_rate_buckets WHERE updated_at < ?', (now - CLIENT_BUCKET_TTL,))
+
+    return wait, empty
+
+
+# Singleton instance
+_rate_limiter = None
+
+def get_rate_limiter():
+    """Get or create the shared RateLimiter instance."""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
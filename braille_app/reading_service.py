@@ -0,0 +1,172 @@
+"""
+Reading Session Service Module for Braille Display Website
+
+Remembers where each device stopped reading a library document and sends only
+the next few windows ahead of the reader. The number of windows sent ahead
+(the lookahead) follows the reader's measured pace, so a fast reader never
+waits and a slow reader does not cause writes that are never read.
+
+Windows are sized for the device's cells and delivered the way the device
+reads everything else: slot devices are switched to a `reading_<document>`
+slot, other devices get a (queued) delivery. A new stretch is only sent when
+the reader gets within half a lookahead of the end of what was sent.
+"""
+
+import math
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ReadingSession
+from .library import get_library_book
+from .devices import DeviceError, get_device_profile
+from .firebase_service import FirebaseService
+from .delivery_queue import deliver_text
+from .tracing import traced
+from .resilience import deadline_scope
+
+
+class ReadingService:
+    """
+    Service class for reading sessions and lookahead prefetching.
+    """
+
+    def lookahead(self, session):
+        """
+        Number of windows to keep ahead of the reader.
+
+        Enough for READING_LOOKAHEAD_SECONDS at the measured pace, within
+        READING_LOOKAHEAD_MIN and READING_LOOKAHEAD_MAX.
+        """
+        wanted = math.ceil(session.windows_per_minute * settings.READING_LOOKAHEAD_SECONDS / 60)
+        return max(settings.READING_LOOKAHEAD_MIN, min(settings.READING_LOOKAHEAD_MAX, wanted))
+
+    def _deliver(self, profile, document_id, book, start, end):
+        """
+        Send windows [start, end) of a document to a device in its own format.
+        """
+        windows = book.windows(start, end - start, profile.cells)
+        text = ' '.join(windows)
+        if profile.format == 'slot':
+            with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+                return FirebaseService.publish(f'reading_{document_id}', text, chunks=windows,
+                                               device_id=profile.device_id)
+        return deliver_text(text, device_id=profile.device_id, chunks=windows)
+
+    def _session_info(self, session, book, cells):
+        window_count = book.window_total(cells)
+        return {
+            'status': 'success',
+            'device_id': session.device_id,
+            'document_id': session.document_id,
+            'title': book.title,
+            'offset': session.window_offset,
+            'window_count': window_count,
+            'prefetched_until': session.prefetched_until,
+            'lookahead': self.lookahead(session),
+            'window': book.window(session.window_offset, cells) if window_count else '',
+            'message': f"Reading {book.title} at window {session.window_offset + 1} of {window_count}",
+        }
+
+    @traced('reading.open')
+    def open_document(self, device_id, document_id):
+        """
+        Start or resume reading a document on a device.
+
+        The device gets the first lookahead windows from the saved position.
+
+        Returns:
+            dict: Session details, or an error result
+        """
+        try:
+            profile = get_device_profile(device_id)
+        except DeviceError as e:
+            return {'status': 'error', 'message': str(e)}
+
+        book = get_library_book(document_id)
+        if book is None:
+            return {'status': 'error', 'message': f'Document not found: {document_id}'}
+
+        window_count = book.window_total(profile.cells)
+        session, _ = ReadingSession.objects.get_or_create(device_id=profile.device_id, document_id=document_id)
+        session.window_offset = min(session.window_offset, max(0, window_count - 1))
+
+        end = min(window_count, session.window_offset + self.lookahead(session))
+        result = self._deliver(profile, document_id, book, session.window_offset, end)
+        if result['status'] != 'success':
+            return result
+
+        session.prefetched_until = end
+        session.last_advanced_at = timezone.now()
+        session.save()
+        return self._session_info(session, book, profile.cells)
+
+    @traced('reading.advance')
+    def advance(self, device_id, document_id, offset):
+        """
+        Move the reader's cursor and top up the lookahead.
+
+        Nothing is sent while more than half a lookahead of the windows
+        already sent is left; then the device gets the next stretch from the
+        cursor.
+
+        Args:
+            device_id (str): Device id
+            document_id (str): Library id
+            offset (int): Window the reader is now on
+
+        Returns:
+            dict: Session details, or an error result
+        """
+        try:
+            profile = get_device_profile(device_id)
+        except DeviceError as e:
+            return {'status': 'error', 'message': str(e)}
+
+        book = get_library_book(document_id)
+        if book is None:
+            return {'status': 'error', 'message': f'Document not found: {document_id}'}
+
+        try:
+            session = ReadingSession.objects.get(device_id=profile.device_id, document_id=document_id)
+        except ReadingSession.DoesNotExist:
+            return self.open_document(profile.device_id, document_id)
+
+        window_count = book.window_total(profile.cells)
+        offset = max(0, min(int(offset), window_count - 1))
+        now = timezone.now()
+
+        # Update the pace from forward moves made without a long pause
+        moved = offset - session.window_offset
+        if moved > 0 and session.last_advanced_at:
+            elapsed = (now - session.last_advanced_at).total_seconds()
+            if 0 < elapsed < settings.READING_PAUSE_SECONDS:
+                rate = moved * 60 / elapsed
+                if session.windows_per_minute:
+                    rate = 0.7 * session.windows_per_minute + 0.3 * rate
+                session.windows_per_minute = rate
+
+        lookahead = self.lookahead(session)
+        left = session.prefetched_until - offset
+        # Jumped backwards, or the windows sent run low: send from the new position
+        if moved < 0 or (left < math.ceil(lookahead / 2) and session.prefetched_until < window_count):
+            end = min(window_count, offset + lookahead)
+            result = self._deliver(profile, document_id, book, offset, end)
+            if result['status'] != 'success':
+                return result
+            session.prefetched_until = end
+
+        session.window_offset = offset
+        session.last_advanced_at = now
+        session.save()
+        return self._session_info(session, book, profile.cells)
+
+
+# Singleton instance
+_reading_service = None
+
+def get_reading_service():
+    """Get or create ReadingService instance."""
+    global _reading_service
+    if _reading_service is None:
+        _reading_service = ReadingService()
+    return _reading_service
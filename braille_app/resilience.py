@@ -0,0 +1,294 @@
+"""
+Resilience Module for Braille Display Website
+
+One retry policy for upstream writes, so a failing dependency costs a bounded
+amount of time and load instead of stacking retry loops:
+
+- Deadline: every call gets an overall deadline; each attempt's timeout is
+  cut to what is left of it. `deadline_scope()` tightens the deadline for
+  everything called inside it (the innermost, earliest deadline wins).
+- Backoff: retries wait a jittered exponential delay ("full jitter").
+- Retry budget: retries may add at most `budget_ratio` extra load on top of
+  first attempts (plus a small floor), so an outage does not multiply traffic.
+- Circuit breaker: after `failure_threshold` consecutive failures an endpoint
+  fails fast for `reset_timeout` seconds, then lets one probe call through.
+
+Budgets and breakers live in each worker process.
+
+Usage:
+    policy = RetryPolicy.from_settings(settings.FIREBASE_RETRY)
+    call_with_retry(lambda timeout: put(url, timeout=timeout), 'firebase', policy)
+"""
+
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import counter
+
+
+RETRIES = counter('braille_retries_total', 'Retry attempts by endpoint', ['endpoint'])
+RETRIES_DENIED = counter(
+    'braille_retries_denied_total', 'Retries skipped because the retry budget was spent', ['endpoint']
+)
+BREAKER_OPENED = counter('braille_circuit_opened_total', 'Times a circuit breaker opened', ['endpoint'])
+BREAKER_REJECTIONS = counter(
+    'braille_circuit_rejections_total', 'Calls failed fast by an open circuit breaker', ['endpoint']
+)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+    def __init__(self, endpoint, retry_after):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        super().__init__(f"{endpoint} is unavailable - retry in {retry_after:.1f}s")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call's deadline passes before it could succeed."""
+
+    def __init__(self, endpoint, last_error=None):
+        self.endpoint = endpoint
+        self.last_error = last_error
+        message = f"Deadline exceeded calling {endpoint}"
+        if last_error is not None:
+            message += f": {last_error}"
+        super().__init__(message)
+
+
+class RetryPolicy:
+    """
+    How a call is retried.
+
+    Args:
+        attempts (int): Maximum attempts, including the first
+        deadline (float): Seconds for the whole call, retries included
+        attempt_timeout (float): Upper bound on one attempt's timeout
+        base_delay (float): Backoff before the first retry (doubles each time)
+        max_delay (float): Backoff cap
+        budget_ratio (float): Retries allowed per first attempt (0.1 = 10% extra load)
+        min_retries_per_second (float): Retries always allowed, regardless of the ratio
+        failure_threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds an open breaker fails fast
+    """
+
+    def __init__(self, attempts=3, deadline=5.0, attempt_timeout=3.0, base_delay=0.1, max_delay=1.0,
+                 budget_ratio=0.1, min_retries_per_second=0.5, failure_threshold=5, reset_timeout=30.0):
+        self.attempts = max(1, attempts)
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @classmethod
+    def from_settings(cls, config):
+        return cls(**config)
+
+    def backoff(self, retry):
+        """
+        Delay before retry number `retry` (1-based), with full jitter.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class RetryBudget:
+    """
+    Token bucket of retries: first attempts deposit `ratio` tokens, retries
+    withdraw one. A trickle of `min_per_second` tokens keeps retries possible
+    when traffic is low.
+    """
+
+    def __init__(self, ratio, min_per_second, cap=10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = cap
+        self.balance = cap
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.balance = min(self.cap, self.balance + (now - self.updated) * self.min_per_second)
+        self.updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self):
+        """
+        Returns:
+            bool: True if a retry may be made
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.balance < 1 - 1e-9:  # ten deposits of 0.1 add up to 0.999...
+                return False
+            self.balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after consecutive failures -> half-open (one probe) ->
+    closed on success, open again on failure.
+    """
+
+    def __init__(self, endpoint, failure_threshold, reset_timeout):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def before_call(self):
+        """
+        Raises:
+            CircuitOpen: If calls should fail fast right now
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+            waited = time.monotonic() - self.opened_at
+            if waited >= self.reset_timeout and not self.probing:
+                self.probing = True  # this call is the probe
+                return
+        BREAKER_REJECTIONS.labels(self.endpoint).inc()
+        raise CircuitOpen(self.endpoint, max(0.0, self.reset_timeout - waited))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    BREAKER_OPENED.labels(self.endpoint).inc()
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+_breakers = {}
+_budgets = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(endpoint, policy):
+    with _registry_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint, policy.failure_threshold, policy.reset_timeout)
+        return breaker
+
+
+def get_budget(endpoint, policy):
+    with _registry_lock:
+        budget = _budgets.get(endpoint)
+        if budget is None:
+            budget = _budgets[endpoint] = RetryBudget(policy.budget_ratio, policy.min_retries_per_second)
+        return budget
+
+
+def reset():
+    """
+    Forget all breaker and budget state (for tests).
+    """
+    with _registry_lock:
+        _breakers.clear()
+        _budgets.clear()
+
+
+_deadline = contextvars.ContextVar('braille_deadline', default=None)
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Give every call made inside the block at most `seconds` in total.
+    """
+    deadline = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def call_with_retry(func, endpoint, policy, retryable=lambda error: True):
+    """
+    Call `func(timeout)` under the retry policy.
+
+    Args:
+        func (callable): Performs one attempt; receives the attempt's timeout in seconds
+        endpoint (str): Breaker and budget key, e.g. the upstream host
+        policy (RetryPolicy): Retry policy
+        retryable (callable): Whether an exception is worth retrying
+
+    Returns:
+        The result of `func`
+
+    Raises:
+        CircuitOpen: If the endpoint's breaker is open
+        DeadlineExceeded: If the deadline ran out
+        Exception: The last error, if it was not retryable or retries ran out
+    """
+    breaker = get_breaker(endpoint, policy)
+    budget = get_budget(endpoint, policy)
+    deadline = time.monotonic() + policy.deadline
+    ambient = _deadline.get()
+    if ambient is not None:
+        deadline = min(deadline, ambient)
+
+    if deadline <= time.monotonic():
+        raise DeadlineExceeded(endpoint)
+    breaker.before_call()
+    budget.deposit()
+
+    attempt = 1
+    while True:
+        remaining = max(0.001, deadline - time.monotonic())
+        try:
+            result = func(min(policy.attempt_timeout, remaining))
+        except Exception as e:
+            if not retryable(e):
+                # The endpoint answered; the request itself was wrong
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt >= policy.attempts or breaker.state != 'closed':
+                raise
+            if not budget.withdraw():
+                RETRIES_DENIED.labels(endpoint).inc()
+                raise
+            pause = policy.backoff(attempt)
+            if time.monotonic() + pause >= deadline:
+                raise DeadlineExceeded(endpoint, e) from e
+            time.sleep(pause)
+            RETRIES.labels(endpoint).inc()
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
@@ -0,0 +1,90 @@
+"""
+Shared State Module for Braille Display Website
+
+Gunicorn runs several worker processes, so anything that has to be counted
+or coordinated across requests (rate limits, locks, ...) cannot live in a
+Python dict. This module provides a small SQLite database for that state.
+"""
+
+import os
+import sqlite3
+import threading
+from django.conf import settings
+
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_created_tables = set()
+
+
+def get_connection():
+    """
+    Get a connection to the shared state database.
+
+    One connection is kept per thread and per process (connections must not
+    be shared across a fork). Connections run in autocommit mode so callers
+    can open their own `BEGIN IMMEDIATE` transactions.
+
+    Returns:
+        sqlite3.Connection: Connection to settings.SHARED_STATE_DB_PATH
+    """
+    path = str(settings.SHARED_STATE_DB_PATH)
+    pid = os.getpid()
+    conn = getattr(_local, 'conn', None)
+
+    if conn is None or _local.path != path or _local.pid != pid:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.path = path
+        _local.pid = pid
+
+    return conn
+
+
+def ensure_table(name, ddl):
+    """
+    Create a table in the shared state database if it does not exist yet.
+
+    Args:
+        name (str): Table name (used to remember which tables were created)
+        ddl (str): CREATE TABLE IF NOT EXISTS statement
+    """
+    key = (str(settings.SHARED_STATE_DB_PATH), name)
+    if key in _created_tables:
+        return
+
+    with _schema_lock:
+        if key not in _created_tables:
+            get_connection().execute(ddl)
+            _created_tables.add(key)
+
+
+class transaction:
+    """
+    Context manager for a write transaction on the shared state database.
+
+    Uses `BEGIN IMMEDIATE` so the write lock is taken up front and concurrent
+    read-modify-write cycles from other workers are serialised.
+
+    Usage:
+        with transaction() as conn:
+            row = conn.execute('SELECT ...').fetchone()
+            conn.execute('UPDATE ...')
+    """
+
+    def __enter__(self):
+        self.conn = get_connection()
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
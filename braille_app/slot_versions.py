@@ -0,0 +1,107 @@
+"""
+Slot Versions Module for Braille Display Website
+
+Bookkeeping for the versioned content slots in Firebase. Every worker stages
+and activates slots, so which versions exist and which version each device
+points at is kept in the shared state database rather than per process.
+
+After a slot gets a new version only the newest versions (current and
+previous) and any version a device still points at are kept; stale_versions()
+hands back the rest so the caller can delete them from Firebase.
+"""
+
+import time
+
+from .shared_state import ensure_table, get_connection, transaction
+
+
+VERSIONS_KEPT = 2
+
+VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS slot_versions (
+        slot_path TEXT NOT NULL,
+        version TEXT NOT NULL,
+        used_at REAL NOT NULL,
+        PRIMARY KEY (slot_path, version)
+    )
+"""
+
+POINTERS_DDL = """
+    CREATE TABLE IF NOT EXISTS slot_pointers (
+        device_id TEXT PRIMARY KEY,
+        slot_path TEXT NOT NULL,
+        version TEXT NOT NULL
+    )
+"""
+
+
+def _ensure_tables():
+    ensure_table('slot_versions', VERSIONS_DDL)
+    ensure_table('slot_pointers', POINTERS_DDL)
+
+
+def is_staged(slot_path, version):
+    """
+    True if a version of a slot was written and not pruned since.
+    """
+    _ensure_tables()
+    row = get_connection().execute(
+        'SELECT 1 FROM slot_versions WHERE slot_path = ? AND version = ?', (slot_path, version)
+    ).fetchone()
+    return row is not None
+
+
+def record_staged(slot_path, version):
+    """
+    Remember that a version of a slot was written.
+    """
+    _ensure_tables()
+    with transaction() as conn:
+        conn.execute(
+            'INSERT INTO slot_versions (slot_path, version, used_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(slot_path, version) DO UPDATE SET used_at = excluded.used_at',
+            (slot_path, version, time.time())
+        )
+
+
+def record_pointer(device_id, slot_path, version):
+    """
+    Remember which slot version a device was switched to.
+    """
+    _ensure_tables()
+    with transaction() as conn:
+        conn.execute(
+            'INSERT INTO slot_pointers (device_id, slot_path, version) VALUES (?, ?, ?) '
+            'ON CONFLICT(device_id) DO UPDATE SET slot_path = excluded.slot_path, version = excluded.version',
+            (device_id, slot_path, version)
+        )
+        conn.execute(
+            'UPDATE slot_versions SET used_at = ? WHERE slot_path = ? AND version = ?',
+            (time.time(), slot_path, version)
+        )
+
+
+def stale_versions(slot_path):
+    """
+    Forget the versions of a slot that are no longer needed.
+
+    Keeps the VERSIONS_KEPT most recently staged or activated versions and
+    every version a device points at.
+
+    Returns:
+        list: Versions the caller should delete from Firebase
+    """
+    _ensure_tables()
+    with transaction() as conn:
+        versions = [version for (version,) in conn.execute(
+            'SELECT version FROM slot_versions WHERE slot_path = ? ORDER BY used_at DESC', (slot_path,)
+        )]
+        pointed = {version for (version,) in conn.execute(
+            'SELECT version FROM slot_pointers WHERE slot_path = ?', (slot_path,)
+        )}
+        stale = [version for version in versions[VERSIONS_KEPT:] if version not in pointed]
+        conn.executemany(
+            'DELETE FROM slot_versions WHERE slot_path = ? AND version = ?',
+            [(slot_path, version) for version in stale]
+        )
+    return stale
@@ -0,0 +1,80 @@
+/**
+ * Live progress of a queued delivery job
+ * Follows /api/deliveries/<id>/events/ (server-sent events) until the job finishes,
+ * and makes Idempotency-Keys for repeated sends
+ */
+
+function watchDelivery(jobId, handlers) {
+    handlers = handlers || {};
+    const source = new EventSource('/api/deliveries/' + jobId + '/events/');
+    let finished = false;
+
+    function finish() {
+        finished = true;
+        source.close();
+    }
+
+    source.addEventListener('acked', (event) => {
+        const data = JSON.parse(event.data);
+        if (handlers.onProgress) {
+            handlers.onProgress(data.chunk, data.total);
+        }
+    });
+
+    source.addEventListener('state', (event) => {
+        const data = JSON.parse(event.data);
+        if (data.status === 'done') {
+            finish();
+            if (handlers.onDone) {
+                handlers.onDone(data.total);
+            }
+        } else if (data.status === 'cancelled') {
+            finish();
+            if (handlers.onCancelled) {
+                handlers.onCancelled();
+            }
+        } else if (data.status === 'failed') {
+            finish();
+            if (handlers.onError) {
+                handlers.onError(data.error || 'Delivery failed', false);
+            }
+        }
+    });
+
+    source.addEventListener('error', (event) => {
+        // Connection drops are retried by EventSource itself; only
+        // job errors carry data. A failed job was already reported by its state
+        if (!event.data || finished) {
+            return;
+        }
+        const data = JSON.parse(event.data);
+        if (!data.retrying) {
+            finish();
+        }
+        if (handlers.onError) {
+            handlers.onError(data.message, data.retrying);
+        }
+    });
+
+    return source;
+}
+
+/**
+ * Idempotency-Key for a send: the same content sent again within a few
+ * seconds (a double click, or voice recognition submitting twice) reuses
+ * the key, so the server answers with the job it already created
+ */
+const REPEAT_WINDOW_MS = 10000;
+let lastSend = null;
+
+function idempotencyKey(content) {
+    const now = Date.now();
+    if (lastSend && lastSend.content === content && now - lastSend.at < REPEAT_WINDOW_MS) {
+        return lastSend.key;
+    }
+    const key = (window.crypto && crypto.randomUUID)
+        ? crypto.randomUUID()
+        : now.toString(36) + Math.random().toString(36).slice(2);
+    lastSend = {content: content, key: key, at: now};
+    return key;
+}
@@ -135,6 +135,12 @@ class VoiceNavigator {
         // Extract numbers (for panel selection)
         const numberMatch = this.extractNumber(cmd);
         
+        // Stop the device first, on every page (before the AI question fallback)
+        if (['stop', 'cancel', 'stop reading', 'stop sending'].includes(cmd)) {
+            this.stopDelivery();
+            return;
+        }
+        
         // Check if we're on AI Helper page - capture as message
         const isAIHelperPage = window.location.pathname.includes('ai-helper');
         if (isAIHelperPage && cmd.length > 0) {
@@ -271,6 +277,17 @@ class VoiceNavigator {
         }
     }
     
+    stopDelivery() {
+        fetch('/api/voice-command/', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ command: 'stop' })
+        })
+            .then(response => response.json())
+            .then(data => this.speak(data.status === 'success' ? 'Stopped sending to the device' : data.message))
+            .catch(() => this.speak('Could not reach the server to stop the device'));
+    }
+    
     navigate(url) {
         this.speak(`Navigating to ${url.split('/').filter(Boolean).join(' ')}`);
         setTimeout(() => {
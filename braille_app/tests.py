@@ -1,7 +1,29 @@
-from django.test import TestCase, Client
+import os
+
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 
 
+def setUpModule():
+    # Keep the metrics the tests record out of settings.METRICS_DIR
+    import tempfile
+    from braille_app import metrics
+    
+    global _metrics_dir, _metrics_override
+    _metrics_dir = tempfile.TemporaryDirectory()
+    _metrics_override = override_settings(METRICS_DIR=_metrics_dir.name)
+    _metrics_override.enable()
+    metrics.reset()
+
+
+def tearDownModule():
+    from braille_app import metrics
+    
+    _metrics_override.disable()
+    metrics.reset()
+    _metrics_dir.cleanup()
+
+
 class LandingPageTests(TestCase):
     """Tests for the landing page"""
     
@@ -88,4 +110,1944 @@ class FirebaseServiceTests(TestCase):
         self.assertEqual(result['status'], 'error')
 
 
+class RateLimiterTests(TestCase):
+    """Tests for the shared outbound API rate limiter"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            API_RATE_LIMITS={
+                'test_api': {
+                    'requests_per_minute': 1,
+                    'burst': 2,
+                    'tokens_per_minute': 100,
+                    'max_wait': 0,
+                    'max_waiters': 1,
+                },
+            },
+        )
+        self.settings_override.enable()
+        
+        from braille_app.rate_limiter import RateLimiter
+        self.limiter = RateLimiter()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_burst_then_reject(self):
+        """Test that calls beyond the burst are rejected early"""
+        from braille_app.rate_limiter import RateLimitExceeded
+        
+        self.limiter.acquire('test_api')
+        self.limiter.acquire('test_api')
+        with self.assertRaises(RateLimitExceeded) as ctx:
+            self.limiter.acquire('test_api')
+        self.assertGreater(ctx.exception.retry_after, 0)
+    
+    def test_token_budget(self):
+        """Test that the model-token bucket is enforced"""
+        from braille_app.rate_limiter import RateLimitExceeded
+        
+        self.limiter.acquire('test_api', tokens=90)
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire('test_api', tokens=50)
+    
+    def test_report_throttled_blocks_all_callers(self):
+        """Test that an upstream 429 pauses the API for every caller"""
+        from braille_app.rate_limiter import RateLimiter, RateLimitExceeded
+        
+        self.limiter.report_throttled('test_api', retry_after=30)
+        with self.assertRaises(RateLimitExceeded):
+            RateLimiter().acquire('test_api')
+    
+    def test_unconfigured_api_is_not_limited(self):
+        """Test that APIs without limits always get a slot"""
+        for _ in range(10):
+            self.limiter.acquire('other_api')
+
+
+class NewsCacheTests(TestCase):
+    """Tests for the stale-while-revalidate headline cache"""
+    
+    class FakeNewsApi:
+        def __init__(self):
+            self.calls = 0
+        
+        def get_top_headlines(self, category, country, page_size):
+            self.calls += 1
+            return {
+                'status': 'ok',
+                'articles': [{
+                    'title': f'{category} story {self.calls}',
+                    'description': 'Description',
+                    'content': None,
+                    'source': {'name': 'Test'},
+                    'url': 'http://example.com',
+                    'publishedAt': '2024-01-01T00:00:00Z',
+                }],
+            }
+    
+    def setUp(self):
+        from braille_app.news_service import NewsService
+        self.service = NewsService()
+        self.service.newsapi = self.FakeNewsApi()
+    
+    def test_fresh_hit_does_not_call_api(self):
+        """Test that repeated requests within the fresh TTL use the cache"""
+        with self.settings(API_RATE_LIMITS={}):
+            first = self.service.get_top_headlines('technology')
+            second = self.service.get_top_headlines('technology')
+        
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.newsapi.calls, 1)
+        stats = self.service.get_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+    
+    def test_stale_entry_served_while_refreshing(self):
+        """Test that a stale entry is returned and refreshed once in the background"""
+        import time
+        
+        with self.settings(API_RATE_LIMITS={}, NEWS_CACHE_FRESH_TTL=0, NEWS_CACHE_STALE_TTL=60):
+            first = self.service.get_top_headlines('sports')
+            stale = self.service.get_top_headlines('sports')
+            self.assertEqual(first, stale)
+            
+            deadline = time.time() + 2
+            while self.service.get_cache_stats()['refreshing'] and time.time() < deadline:
+                time.sleep(0.01)
+        
+        self.assertEqual(self.service.newsapi.calls, 2)
+        self.assertEqual(self.service.get_cache_stats()['stale_hits'], 1)
+    
+    def test_cache_stats_endpoint(self):
+        """Test that cache metrics are exposed as JSON"""
+        response = self.client.get(reverse('news_cache_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hits', response.json())
+
+
+class NewsPrefetchTests(TestCase):
+    """Tests for scheduled news prefetching"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            NEWS_PREFETCH_JITTER=0,
+            FIREBASE_CONFIG={},
+            CHUNK_SEND_DELAY=0,
+        )
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_run_once_prepares_every_category(self):
+        """Test that one round stores a digest with device chunks per category"""
+        from braille_app.news_prefetch import NewsPrefetcher, get_news_digest
+        from braille_app.news_service import NEWS_CATEGORY_MAP
+        
+        results = NewsPrefetcher(interval=60, workers=2).run_once()
+        
+        self.assertEqual(set(results), set(NEWS_CATEGORY_MAP))
+        for category in NEWS_CATEGORY_MAP:
+            digest = get_news_digest(category)
+            self.assertTrue(digest['news_text'].startswith(category.upper()))
+            self.assertGreater(len(digest['chunks']), 0)
+    
+    def test_only_one_worker_claims_a_run(self):
+        """Test that the shared schedule lets a single process run per interval"""
+        from braille_app.news_prefetch import NewsPrefetcher
+        
+        self.assertTrue(NewsPrefetcher(interval=60).claim_run())
+        self.assertFalse(NewsPrefetcher(interval=60).claim_run())
+    
+    @override_settings(DELIVERY_QUEUE=False)
+    def test_category_view_uses_digest(self):
+        """Test that the category page is served from the prefetched digest"""
+        from braille_app.news_prefetch import store_news_digest
+        
+        store_news_digest('technology', {
+            'articles': [{'title': 'Prefetched story', 'content': 'Body', 'source': 'Test', 'url': '#'}],
+            'news_text': 'TECH NEWS: new story',
+            'chunks': ['TECH', 'NEWS', ':', 'new', 'stor', 'y'],
+        })
+        response = self.client.get(reverse('vi_news_category', args=['technology']))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['articles'][0]['title'], 'Prefetched story')
+        self.assertEqual(response.context['send_result']['total_chunks'], 6)
+    
+    def test_stale_digest_is_not_served(self):
+        """Test that a digest older than NEWS_DIGEST_MAX_AGE falls back to a live fetch"""
+        from braille_app.news_prefetch import get_news_digest, store_news_digest
+        from braille_app.shared_state import get_connection
+        
+        store_news_digest('technology', {'articles': [], 'news_text': 'TECH NEWS: old story', 'chunks': []})
+        self.assertIsNotNone(get_news_digest('technology'))
+        
+        get_connection().execute('UPDATE news_digests SET prepared_at = prepared_at - 3 * 3600')
+        with self.settings(NEWS_DIGEST_MAX_AGE=7200):
+            self.assertIsNone(get_news_digest('technology'))
+
+
+class ContentSlotTests(TestCase):
+    """Tests for pre-staged device content slots"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        state_override = self.settings(SHARED_STATE_DB_PATH=os.path.join(tmpdir.name, 'state.sqlite3'))
+        state_override.enable()
+        self.addCleanup(state_override.disable)
+        self.writes = []
+        patcher = mock.patch.object(
+            FirebaseService, '_write', side_effect=lambda path, data: self.writes.append((path, data))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_stage_is_idempotent(self):
+        """Test that staging the same content twice writes it once"""
+        from braille_app.firebase_service import FirebaseService
+        
+        first = FirebaseService.stage_slot('news_technology', 'Some technology news')
+        second = FirebaseService.stage_slot('news_technology', 'Some technology news')
+        
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.writes), 1)
+        self.assertTrue(first['path'].endswith(f"/news_technology/v{first['version']}"))
+    
+    def test_activate_is_one_small_write(self):
+        """Test that switching content only writes the pointer"""
+        from django.conf import settings
+        from braille_app.firebase_service import FirebaseService
+        
+        slot = FirebaseService.stage_slot('news_sports', 'Some sports news')
+        self.writes.clear()
+        result = FirebaseService.activate_slot(slot)
+        
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(len(self.writes), 1)
+        path, pointer = self.writes[0]
+        self.assertEqual(path, settings.FIREBASE_CURRENT_PATH)
+        self.assertEqual(pointer['version'], slot['version'])
+        self.assertNotIn('text', pointer)
+    
+    def test_old_versions_are_deleted(self):
+        """Test that activating a version deletes all but the current and previous one"""
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        updates = []
+        with mock.patch.object(FirebaseService, '_update', side_effect=lambda path, data: updates.append((path, data))):
+            slots = []
+            for text in ('Monday news', 'Tuesday news', 'Wednesday news'):
+                slots.append(FirebaseService.stage_slot('news_world', text))
+                FirebaseService.activate_slot(slots[-1])
+        
+        base = slots[0]['path'].rsplit('/', 1)[0]
+        self.assertEqual(updates, [(base, {f"v{slots[0]['version']}": None})])
+        
+        # Deleted content is written again when it comes back
+        self.writes.clear()
+        with mock.patch.object(FirebaseService, '_update'):
+            FirebaseService.publish('news_world', 'Monday news')
+        self.assertEqual([path for path, _ in self.writes][0], slots[0]['path'])
+
+
+class NearDuplicateTests(TestCase):
+    """Tests for MinHash/LSH near-duplicate article suppression"""
+    
+    STORY = {
+        'title': 'Tech giant unveils new braille display for visually impaired readers',
+        'content': 'The company said the refreshable display will ship next year at half the price of current models.',
+    }
+    REWORDED = {
+        'title': 'Tech giant unveils new braille display for visually impaired readers - Business',
+        'content': 'The company said the refreshable display will ship next year at half the price of existing models.',
+    }
+    OTHER = {
+        'title': 'Paralympic swimmer breaks world record in Paris',
+        'content': 'The athlete finished the 100m butterfly almost a second ahead of the field.',
+    }
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+        )
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_reworded_story_is_detected(self):
+        """Test that a lightly edited copy of a delivered story matches"""
+        from braille_app.dedup import DeliveredIndex, article_text
+        
+        index = DeliveredIndex(window=10)
+        index.add(article_text(self.STORY))
+        
+        self.assertTrue(index.contains(article_text(self.REWORDED)))
+        self.assertFalse(index.contains(article_text(self.OTHER)))
+    
+    def test_window_evicts_oldest(self):
+        """Test that the index only remembers the most recent articles"""
+        from braille_app.dedup import DeliveredIndex, article_text
+        
+        index = DeliveredIndex(window=1)
+        index.add(article_text(self.STORY))
+        index.add(article_text(self.OTHER))
+        
+        self.assertEqual(len(index), 1)
+        self.assertFalse(index.contains(article_text(self.STORY)))
+    
+    def test_filter_delivered_records_cells_saved(self):
+        """Test that skipped articles are removed and counted"""
+        from braille_app.dedup import filter_delivered, get_dedup_stats, mark_delivered
+        
+        session = {}
+        delivered = filter_delivered(session, [self.STORY, self.OTHER])
+        self.assertEqual(len(delivered), 2)
+        mark_delivered(session, delivered)
+        fresh = filter_delivered(session, [self.REWORDED])
+        
+        self.assertEqual(fresh, [])
+        stats = get_dedup_stats()
+        self.assertEqual(stats[0]['articles_skipped'], 1)
+        self.assertGreater(stats[0]['cells_saved'], 0)
+    
+    def test_failed_send_is_not_recorded(self):
+        """Test that articles count as delivered only after a successful send"""
+        from braille_app.dedup import filter_delivered, mark_delivered
+        
+        session = {}
+        self.assertEqual(filter_delivered(session, [self.STORY, self.REWORDED]), [self.STORY])
+        # The send failed: the same story is offered again
+        self.assertEqual(filter_delivered(session, [self.STORY]), [self.STORY])
+        mark_delivered(session, [self.STORY])
+        self.assertEqual(filter_delivered(session, [self.REWORDED]), [])
+
+
+class BookCatalogTests(TestCase):
+    """Tests for the offline FTS5 book catalog"""
+    
+    BOOKS = [
+        {'id': 'vol1', 'title': 'Braille Basics', 'authors': ['Ann Reader'],
+         'description': 'An introduction to reading braille.'},
+        {'id': 'vol2', 'title': 'Cooking Without Sight', 'authors': ['Bo Chef'],
+         'description': 'Kitchen skills for blind cooks, with a chapter on braille labels.'},
+        {'id': 'vol3', 'title': 'Gardening', 'authors': ['Cy Green'],
+         'description': 'Growing vegetables at home.'},
+    ]
+    
+    def setUp(self):
+        from braille_app.book_catalog import save_volumes
+        save_volumes(self.BOOKS)
+    
+    def test_bm25_ranks_title_matches_first(self):
+        """Test that a title match outranks a description match"""
+        from braille_app.book_catalog import search_catalog
+        
+        results = search_catalog('braille')
+        self.assertEqual([book['id'] for book in results], ['vol1', 'vol2'])
+    
+    def test_prefix_and_author_search(self):
+        """Test prefix matching on the last word and author search"""
+        from braille_app.book_catalog import search_catalog
+        
+        self.assertEqual(search_catalog('garden')[0]['id'], 'vol3')
+        self.assertEqual(search_catalog('bo chef')[0]['id'], 'vol2')
+    
+    def test_update_keeps_index_in_sync(self):
+        """Test that updated volumes are re-indexed"""
+        from braille_app.book_catalog import save_volumes, search_catalog
+        
+        save_volumes([dict(self.BOOKS[2], title='Orchids')])
+        self.assertEqual(search_catalog('gardening'), [])
+        self.assertEqual(search_catalog('orchids')[0]['id'], 'vol3')
+    
+    def test_search_books_works_without_api(self):
+        """Test that BooksService serves catalog matches when the API is unavailable"""
+        from braille_app.books_service import BooksService
+        
+        service = BooksService()
+        service.api_available = False
+        self.assertEqual(service.search_books('braille')[0]['id'], 'vol1')
+
+
+class VolumeCacheTests(TestCase):
+    """Tests for the read-through Google Books volume cache"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fetches = []
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def fetch(self, etag):
+        self.fetches.append(etag)
+        if etag == '"v1"':
+            return 304, None, etag
+        return 200, {'id': 'vol1', 'volumeInfo': {'title': 'Cached Book'}}, '"v1"'
+    
+    def test_hit_within_ttl_does_not_fetch(self):
+        """Test that a second lookup is served from memory"""
+        from braille_app.volume_cache import VolumeCache
+        
+        cache = VolumeCache(self.tmpdir.name, max_entries=10, ttl=60)
+        cache.get('vol1', self.fetch)
+        data = cache.get('vol1', self.fetch)
+        
+        self.assertEqual(data['volumeInfo']['title'], 'Cached Book')
+        self.assertEqual(self.fetches, [None])
+    
+    def test_disk_entry_survives_new_instance(self):
+        """Test that entries are read back from disk"""
+        from braille_app.volume_cache import VolumeCache
+        
+        VolumeCache(self.tmpdir.name, max_entries=10, ttl=60).get('vol1', self.fetch)
+        data = VolumeCache(self.tmpdir.name, max_entries=10, ttl=60).get('vol1', self.fetch)
+        
+        self.assertEqual(data['id'], 'vol1')
+        self.assertEqual(len(self.fetches), 1)
+    
+    def test_expired_entry_is_revalidated_with_etag(self):
+        """Test that expired entries send If-None-Match and keep data on 304"""
+        from braille_app.volume_cache import VolumeCache
+        
+        cache = VolumeCache(self.tmpdir.name, max_entries=10, ttl=0)
+        cache.get('vol1', self.fetch)
+        data = cache.get('vol1', self.fetch)
+        
+        self.assertEqual(self.fetches, [None, '"v1"'])
+        self.assertEqual(data['volumeInfo']['title'], 'Cached Book')
+    
+    def test_books_details_fetched_concurrently(self):
+        """Test that a list of volumes is looked up in parallel"""
+        import time
+        from unittest import mock
+        from braille_app.books_service import BooksService
+        from braille_app.volume_cache import VolumeCache
+        
+        def slow_fetch(book_id, etag=None):
+            time.sleep(0.2)
+            return 200, {'id': book_id, 'volumeInfo': {'title': book_id}}, None
+        
+        service = BooksService()
+        service.api_available = True
+        service.volume_cache = VolumeCache(self.tmpdir.name, max_entries=10, ttl=60)
+        
+        with mock.patch.object(service, '_fetch_volume', side_effect=slow_fetch):
+            start = time.time()
+            books = service.get_books_details([f'vol{i}' for i in range(5)])
+            elapsed = time.time() - start
+        
+        self.assertEqual([book['id'] for book in books], [f'vol{i}' for i in range(5)])
+        self.assertLess(elapsed, 0.6)
+
+
+class LibraryTests(TestCase):
+    """Tests for the memory-mapped local book library"""
+    
+    BOOK_TEXT = """*** START OF THE PROJECT GUTENBERG EBOOK TEST ***
+
+CHAPTER I. The Start
+
+It was a bright cold day in April, and the clocks were striking thirteen.
+
+The hallway smelt of boiled cabbage and old rag mats.
+
+CHAPTER II. The Middle
+
+Outside, even through the shut window-pane, the world looked cold.
+
+*** END OF THE PROJECT GUTENBERG EBOOK TEST ***
+"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(BOOK_LIBRARY_DIR=os.path.join(self.tmpdir.name, 'library'))
+        self.settings_override.enable()
+        
+        self.source = os.path.join(self.tmpdir.name, 'test_novel.txt')
+        with open(self.source, 'w', encoding='utf-8') as f:
+            f.write(self.BOOK_TEXT)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_import_builds_chapter_and_window_index(self):
+        """Test that chapters, paragraphs and windows are indexed"""
+        from braille_app.library import import_book, get_library_book
+        
+        meta = import_book(self.source, title='Test Novel', window_size=20)
+        book = get_library_book('test_novel')
+        
+        self.assertEqual([c['title'] for c in meta['chapters']], ['CHAPTER I. The Start', 'CHAPTER II. The Middle'])
+        self.assertEqual(book.paragraph(1), 'It was a bright cold day in April, and the clocks were striking thirteen.')
+        self.assertTrue(book.chapter_text(1).startswith('CHAPTER II. The Middle'))
+        self.assertNotIn('GUTENBERG', book.chapter_text(0))
+        for i in range(book.window_count):
+            self.assertLessEqual(len(book.window(i)), 20)
+    
+    def test_windows_cover_text_in_order(self):
+        """Test that joined windows reproduce the paragraph text"""
+        from braille_app.library import import_book, get_library_book
+        
+        meta = import_book(self.source, window_size=20)
+        book = get_library_book('test_novel')
+        first = meta['chapters'][1]['first_window']
+        
+        self.assertEqual(book.window(first), 'CHAPTER II. The')
+        self.assertEqual(len(book.windows(book.window_count - 2, 5)), 2)
+    
+    def test_epub_import(self):
+        """Test importing an EPUB in spine order"""
+        import zipfile
+        from braille_app.library import import_book
+        
+        path = os.path.join(self.tmpdir.name, 'tiny.epub')
+        with zipfile.ZipFile(path, 'w') as epub:
+            epub.writestr('META-INF/container.xml',
+                '<container><rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles></container>')
+            epub.writestr('OEBPS/content.opf',
+                '<package xmlns:dc="http://purl.org/dc/elements/1.1/"><metadata><dc:title>Tiny</dc:title>'
+                '<dc:creator>A. Writer</dc:creator></metadata>'
+                '<manifest><item id="c1" href="c1.xhtml"/><item id="c2" href="c2.xhtml"/></manifest>'
+                '<spine><itemref idref="c2"/><itemref idref="c1"/></spine></package>')
+            epub.writestr('OEBPS/c1.xhtml', '<html><body><h1>One</h1><p>First text.</p></body></html>')
+            epub.writestr('OEBPS/c2.xhtml', '<html><body><h1>Two</h1><p>Second text.</p></body></html>')
+        
+        meta = import_book(path)
+        
+        self.assertEqual(meta['title'], 'Tiny')
+        self.assertEqual(meta['author'], 'A. Writer')
+        self.assertEqual([c['title'] for c in meta['chapters']], ['Two', 'One'])
+    
+    def test_reading_content_from_library(self):
+        """Test that BooksService serves library books for reading"""
+        from braille_app.library import import_book
+        from braille_app.books_service import BooksService
+        
+        import_book(self.source, title='Test Novel')
+        content = BooksService().get_book_content_for_reading('test_novel')
+        
+        self.assertEqual(content['title'], 'Test Novel')
+        self.assertEqual(len(content['chapters']), 2)
+        self.assertEqual(content['chapters'][1]['content'], 'CHAP')
+    
+    def test_windows_sized_at_read_time(self):
+        """Test that windows for another device width are sliced from the stored text"""
+        from braille_app.library import import_book, get_library_book
+        
+        import_book(self.source, window_size=20)
+        book = get_library_book('test_novel')
+        
+        windows = book.windows(0, book.window_total(10), cells=10)
+        self.assertTrue(all(len(window) <= 10 for window in windows))
+        self.assertGreater(len(windows), book.window_count)
+        self.assertEqual(windows[:2], ['CHAPTER I.', 'The Start'])
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'library', 'test_novel.w10')))
+        
+        # Importing again drops the windows built for the old text
+        import_book(self.source, window_size=20)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'library', 'test_novel.w10')))
+
+
+class ReadingSessionTests(TestCase):
+    """Tests for persistent reading positions and lookahead prefetch"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        from braille_app.library import import_text
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            BOOK_LIBRARY_DIR=self.tmpdir.name,
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            BRAILLE_DEVICES={
+                'dev1': {'cells': 20, 'format': 'slot', 'path': '/dev1/current'},
+                'narrow': {'cells': 10, 'format': 'text', 'path': '/narrow/text'},
+            },
+            DELIVERY_QUEUE=False,
+            READING_LOOKAHEAD_MIN=3,
+            READING_LOOKAHEAD_MAX=10,
+            READING_LOOKAHEAD_SECONDS=60,
+        )
+        self.settings_override.enable()
+        
+        words = ' '.join(f'word{i}' for i in range(400))
+        import_text(words, 'doc', title='Document', window_size=20)
+        
+        self.writes = []
+        self.updates = []
+        for name, calls in (('_write', self.writes), ('_update', self.updates)):
+            patcher = mock.patch.object(
+                FirebaseService, name, side_effect=lambda path, data, calls=calls: calls.append(data)
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_open_sends_only_lookahead(self):
+        """Test that opening a document writes only the first few windows"""
+        from braille_app.reading_service import get_reading_service
+        
+        from braille_app.library import get_library_book
+        
+        result = get_reading_service().open_document('dev1', 'doc')
+        
+        self.assertEqual(result['offset'], 0)
+        slot, pointer = self.writes
+        self.assertEqual(slot['chunks'], get_library_book('doc').windows(0, 3, cells=20))
+        self.assertEqual(pointer['version'], slot['version'])
+    
+    def test_advance_sends_when_lookahead_runs_low_and_resumes(self):
+        """Test that advancing sends the next stretch only when needed and the position is kept"""
+        from braille_app.reading_service import get_reading_service
+        from braille_app.library import get_library_book
+        from braille_app.models import ReadingSession
+        
+        service = get_reading_service()
+        service.open_document('dev1', 'doc')
+        ReadingSession.objects.filter(device_id='dev1').update(last_advanced_at=None)
+        self.writes.clear()
+        
+        service.advance('dev1', 'doc', 1)
+        self.assertEqual(self.writes, [])
+        result = service.advance('dev1', 'doc', 2)
+        self.assertEqual(self.writes[0]['chunks'], get_library_book('doc').windows(2, result['lookahead'], cells=20))
+        
+        resumed = service.open_document('dev1', 'doc')
+        self.assertEqual(resumed['offset'], 2)
+    
+    def test_windows_sized_for_device(self):
+        """Test that windows follow the device's cells, not the import size"""
+        from braille_app.reading_service import get_reading_service
+        from braille_app.library import get_library_book
+        
+        result = get_reading_service().open_document('narrow', 'doc')
+        windows = get_library_book('doc').windows(0, 3, cells=10)
+        
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['window'], 'word0')
+        self.assertTrue(all(len(window) <= 10 for window in windows))
+        self.assertEqual(self.writes, [' '.join(windows)])
+    
+    def test_unknown_device_is_rejected(self):
+        """Test that the reading API only accepts configured devices"""
+        response = self.client.post(reverse('reading_open'), data='{"device_id": "other", "document_id": "doc"}',
+                                    content_type='application/json')
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.writes, [])
+    
+    def test_lookahead_follows_reading_pace(self):
+        """Test that a fast reader gets a longer lookahead"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from braille_app.models import ReadingSession
+        from braille_app.reading_service import get_reading_service
+        
+        service = get_reading_service()
+        service.open_document('dev1', 'doc')
+        ReadingSession.objects.filter(device_id='dev1').update(
+            last_advanced_at=timezone.now() - timedelta(seconds=10)
+        )
+        result = service.advance('dev1', 'doc', 2)
+        
+        self.assertEqual(result['lookahead'], 10)
+        self.assertEqual(result['prefetched_until'], 12)
+
+
+class PopularBooksTests(TestCase):
+    """Tests for the precompiled popular books registry"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        state_override = self.settings(SHARED_STATE_DB_PATH=os.path.join(tmpdir.name, 'state.sqlite3'))
+        state_override.enable()
+        self.addCleanup(state_override.disable)
+        self.writes = []
+        patcher = mock.patch.object(
+            FirebaseService, '_write', side_effect=lambda path, data: self.writes.append(path)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_payloads_prepared_for_every_book(self):
+        """Test that every catalog entry has precomputed chunks"""
+        from braille_app.popular_books import POPULAR_BOOKS, get_popular_book_payload
+        
+        for book in POPULAR_BOOKS:
+            payload = get_popular_book_payload(book['id'])
+            self.assertEqual(''.join(''.join(payload['chunks']).split()), ''.join(book['content'].split()))
+        self.assertIsNone(get_popular_book_payload('missing'))
+    
+    def test_repeat_selection_is_one_pointer_write(self):
+        """Test that selecting a staged book only switches the pointer"""
+        from django.conf import settings
+        
+        response = self.client.post(reverse('vi_books'), {'book_id': 'atomic_habits'})
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(len(self.writes), 2)
+        
+        self.writes.clear()
+        self.client.post(reverse('vi_books'), {'book_id': 'atomic_habits'})
+        self.assertEqual(self.writes, [settings.FIREBASE_CURRENT_PATH])
+
+
+class PdfUploadTests(TestCase):
+    """Test cases for the PDF upload view"""
+    
+    def setUp(self):
+        import sys
+        import tempfile
+        from types import SimpleNamespace
+        from unittest import mock
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = self.settings(
+            MEDIA_ROOT=os.path.join(self.tmpdir.name, 'media'),
+            BOOK_LIBRARY_DIR=os.path.join(self.tmpdir.name, 'library'),
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            DELIVERY_QUEUE=False,
+            FIREBASE_CONFIG={},
+            CHUNK_SEND_DELAY=0,
+            CLIENT_RATE_LIMITS={},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.pages = ['Hello braille reader']
+        reader = lambda file: SimpleNamespace(pages=[SimpleNamespace(extract_text=lambda page=page: page)
+                                                     for page in self.pages])
+        patcher = mock.patch.dict(sys.modules, {'PyPDF2': SimpleNamespace(PdfReader=reader)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def upload(self, **data):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        
+        pdf = SimpleUploadedFile('notes.pdf', b'%PDF-1.4', content_type='application/pdf')
+        return self.client.post(reverse('helper_pdf_to_braille'), {'pdf_file': pdf, **data}).json()
+    
+    def test_library_copy_only_on_request(self):
+        """Test that an upload is kept in the library only when asked to"""
+        from braille_app.library import list_library
+        
+        self.assertIsNone(self.upload()['document_id'])
+        self.assertEqual(list_library(), [])
+        
+        data = self.upload(keep_for_reading='1')
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual([book['id'] for book in list_library()], [data['document_id']])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'media')), [])
+    
+    def test_pdf_without_text_is_still_sent_and_removed(self):
+        """Test that a PDF with no text layer does not fail the upload or leave the file behind"""
+        self.pages = ['', '']
+        data = self.upload(keep_for_reading='1')
+        
+        self.assertEqual(data['status'], 'success')
+        self.assertIsNone(data['document_id'])
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, 'media')), [])
+
+
+class LineBreakingTests(TestCase):
+    """Test cases for optimal line breaking"""
+    
+    def test_long_word_fills_previous_window(self):
+        """Test that an unavoidable split starts in the free cells"""
+        from braille_app.line_breaking import optimal_chunks
+        
+        self.assertEqual(optimal_chunks('a reads', 4), ['a re', 'ads'])
+        self.assertEqual(optimal_chunks('the braille', 4), ['the', 'brai', 'lle'])
+    
+    def test_optimal_never_exceeds_width(self):
+        """Test that optimal windows fit and keep short words whole"""
+        from braille_app.firebase_service import FirebaseService
+        from braille_app.line_breaking import count_split_words
+        
+        text = "This is a longer sentence that needs careful breaking for tiny displays."
+        greedy = FirebaseService.chunk_text(text, 4, mode='greedy')
+        optimal = FirebaseService.chunk_text(text, 4, mode='optimal')
+        
+        self.assertTrue(all(len(chunk) <= 4 for chunk in optimal))
+        self.assertTrue(all(len(chunk) <= 4 for chunk in greedy))
+        self.assertLess(len(optimal), len(greedy))
+        self.assertEqual(''.join(''.join(optimal).split()), ''.join(text.split()))
+        self.assertEqual(count_split_words(FirebaseService.chunk_text('one two six', 4, mode='optimal'), 'one two six'), 0)
+    
+    def test_hyphenation_saves_windows(self):
+        """Test that hyphenation is only used when it saves a window"""
+        from braille_app.line_breaking import optimal_chunks, count_split_words
+        
+        text = 'reading braille is quite wonderful'
+        plain = optimal_chunks(text, 12)
+        hyphenated = optimal_chunks(text, 12, hyphenate=True)
+        
+        self.assertLess(len(hyphenated), len(plain))
+        self.assertTrue(any(chunk.endswith('-') for chunk in hyphenated))
+        self.assertEqual(count_split_words(plain, text), 0)
+        self.assertEqual(optimal_chunks('hello world', 12, hyphenate=True), ['hello world'])
+    
+    def test_optimal_splits_no_more_words_than_greedy(self):
+        """Test that optimal breaking of the benchmark corpus splits at most as many words as greedy"""
+        from django.conf import settings
+        from braille_app.firebase_service import FirebaseService
+        from braille_app.line_breaking import count_split_words
+        from braille_app.management.commands.benchmark import _corpus
+        
+        for width in (4, 10, 20, settings.DEVICE_CHAR_LIMIT):
+            greedy = optimal = 0
+            for _, text in _corpus():
+                greedy += count_split_words(FirebaseService.chunk_text(text, width, mode='greedy'), text)
+                optimal += count_split_words(FirebaseService.chunk_text(text, width, mode='optimal'), text)
+            self.assertLessEqual(optimal, greedy, f"{width} cells")
+    
+    def test_device_can_opt_in_to_optimal(self):
+        """Test that a profile's chunk_mode overrides CHUNK_MODE"""
+        from braille_app.devices import DeviceProfile
+        from braille_app.firebase_service import FirebaseService
+        
+        profile = DeviceProfile('narrow', cells=4, chunk_mode='optimal')
+        chunks = FirebaseService._chunks_for(profile, 'the braille display')
+        self.assertTrue(all(len(chunk) <= 4 for chunk in chunks))
+        self.assertEqual(DeviceProfile('plain').chunk_mode, 'greedy')
+
+
+class DeviceProfileTests(TestCase):
+    """Test cases for per-device payloads"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        state_override = self.settings(SHARED_STATE_DB_PATH=os.path.join(tmpdir.name, 'state.sqlite3'))
+        state_override.enable()
+        self.addCleanup(state_override.disable)
+        self.writes = []
+        patcher = mock.patch.object(
+            FirebaseService, '_write', side_effect=lambda path, data: self.writes.append((path, data))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_slot_device_gets_windows_of_its_width(self):
+        """Test that slot chunks are sized to the device's cells"""
+        from django.conf import settings
+        from braille_app.firebase_service import send_text_to_braille_device
+        
+        result = send_text_to_braille_device('Braille display windows', chunks=['Braille display windows'])
+        
+        self.assertEqual(result['status'], 'success')
+        (slot_path, slot), (pointer_path, pointer) = self.writes
+        self.assertEqual(pointer_path, settings.BRAILLE_DEVICES['default']['path'])
+        self.assertEqual(pointer['path'], slot_path)
+        cells = settings.BRAILLE_DEVICES['default']['cells']
+        self.assertTrue(all(len(chunk) <= cells for chunk in slot['chunks']))
+    
+    def test_routing_per_format(self):
+        """Test that text and stream devices are written at their own paths"""
+        from braille_app.firebase_service import send_text_to_braille_device
+        
+        devices = {
+            'simulator': {'cells': 1, 'format': 'text', 'path': '/brailleText'},
+            'panel': {'cells': 10, 'refresh_seconds': 0, 'format': 'stream', 'path': '/panel/text'},
+        }
+        with self.settings(BRAILLE_DEVICES=devices):
+            send_text_to_braille_device('hello braille world', device_id='simulator')
+            result = send_text_to_braille_device('hello braille world', device_id='panel')
+            missing = send_text_to_braille_device('hello', device_id='missing')
+        
+        self.assertEqual(self.writes[0], ('/brailleText', 'hello braille world'))
+        self.assertEqual([path for path, _ in self.writes[1:]], ['/panel/text'] * 3)
+        self.assertEqual(result['total_chunks'], 3)
+        self.assertEqual(missing['status'], 'error')
+
+
+class FanOutTests(TestCase):
+    """Test cases for sending to groups of devices"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        state_override = self.settings(SHARED_STATE_DB_PATH=os.path.join(tmpdir.name, 'state.sqlite3'))
+        state_override.enable()
+        self.addCleanup(state_override.disable)
+        self.updates = []
+        self.writes = []
+        for name, calls in (('_update', self.updates), ('_write', self.writes)):
+            patcher = mock.patch.object(
+                FirebaseService, name, side_effect=lambda path, data, calls=calls: calls.append((path, data))
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        devices = {
+            f'reader{i}': {'cells': 4, 'format': 'slot', 'path': f'/classroom/reader{i}/current',
+                           'slots_path': '/classroom/slots'}
+            for i in range(30)
+        }
+        devices['screen'] = {'cells': 1, 'format': 'text', 'path': '/classroom/screen'}
+        devices['panel'] = {'cells': 20, 'refresh_seconds': 0, 'format': 'stream', 'path': '/panel/text'}
+        self.settings_override = self.settings(
+            BRAILLE_DEVICES=devices,
+            BRAILLE_DEVICE_GROUPS={'classroom': list(devices)},
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+    
+    def test_group_is_one_multi_path_update(self):
+        """Test that slot and text devices share one PATCH at their common root"""
+        from braille_app.firebase_service import send_text_to_device_group
+        
+        result = send_text_to_device_group('Chapter one of the handout', 'classroom')
+        
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['devices_sent'], 32)
+        self.assertEqual(len(self.updates), 1)
+        root, update = self.updates[0]
+        self.assertEqual(root, '/classroom')
+        slot_paths = [path for path in update if path.startswith('slots/')]
+        self.assertEqual(len(slot_paths), 1)
+        self.assertEqual(update['reader7/current']['path'], '/' + 'classroom/' + slot_paths[0])
+        self.assertEqual(update['screen'], 'Chapter one of the handout')
+        self.assertTrue(all(path == '/panel/text' for path, _ in self.writes))
+    
+    def test_per_device_failures_are_reported(self):
+        """Test that unknown devices fail without stopping the others"""
+        from braille_app.firebase_service import FirebaseService
+        
+        result = FirebaseService.send_to_devices('Hello', ['reader0', 'missing'])
+        
+        self.assertEqual(result['status'], 'partial')
+        self.assertEqual(result['devices']['reader0']['status'], 'success')
+        self.assertEqual(result['devices']['missing']['status'], 'error')
+
+
+class DeviceLockTests(TestCase):
+    """Test cases for the cross-worker device lock"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+        )
+        self.settings_override.enable()
+    
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+    
+    def test_tokens_increase_and_busy_times_out(self):
+        """Test fencing tokens and waiting for a held device"""
+        from braille_app.device_lock import DeviceBusy, DeviceLock
+        
+        with DeviceLock('reader', timeout=0) as first:
+            first_token = first.token
+            with self.assertRaises(DeviceBusy):
+                DeviceLock('reader', timeout=0.05).acquire()
+            self.assertTrue(DeviceLock('other', timeout=0).acquire())
+        
+        self.assertGreater(DeviceLock('reader', timeout=0).acquire(), first_token)
+    
+    def test_expired_lease_is_fenced_off(self):
+        """Test that a holder whose lease was taken over stops writing"""
+        from braille_app.device_lock import DeviceLock
+        
+        stale = DeviceLock('reader', ttl=0, timeout=0)
+        stale.acquire()
+        newer = DeviceLock('reader', timeout=0)
+        newer.acquire()
+        
+        self.assertGreater(newer.token, stale.token)
+        self.assertFalse(stale.renew())
+        stale.release()
+        self.assertTrue(newer.renew())
+    
+    def test_concurrent_streams_do_not_interleave(self):
+        """Test that two queued sends to one stream device run one after the other"""
+        import threading
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        writes = []
+        devices = {'panel': {'cells': 5, 'refresh_seconds': 0.01, 'format': 'stream', 'path': '/panel/text'}}
+        with self.settings(BRAILLE_DEVICES=devices), \
+                mock.patch.object(FirebaseService, '_write', side_effect=lambda path, data: writes.append(data)):
+            threads = [
+                threading.Thread(target=FirebaseService.send_text_to_device,
+                                 args=(text,), kwargs={'device_id': 'panel', 'wait': True})
+                for text in ('aaaa aaaa aaaa', 'bbbb bbbb bbbb')
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        letters = [data['text'][0] for data in writes]
+        self.assertEqual(len(letters), 6)
+        self.assertIn(letters, (list('aaabbb'), list('bbbaaa')))
+        self.assertEqual(len({data['fence'] for data in writes}), 2)
+
+
+class CancellationTests(TestCase):
+    """Test cases for latest-wins delivery"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        devices = {'panel': {'cells': 5, 'refresh_seconds': 0.05, 'format': 'stream', 'path': '/panel/text'}}
+        settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            BRAILLE_DEVICES=devices,
+            DEFAULT_DEVICE_ID='panel',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.writes = []
+        patcher = mock.patch.object(FirebaseService, '_write', side_effect=lambda path, data: self.writes.append(data))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _send_in_background(self, text):
+        import threading
+        from braille_app.firebase_service import FirebaseService
+        
+        results = []
+        thread = threading.Thread(target=lambda: results.append(FirebaseService.send_text_to_device(text)))
+        thread.start()
+        return thread, results
+    
+    def test_new_send_supersedes_old(self):
+        """Test that a newer send cancels the stream in progress"""
+        import time
+        
+        first, first_results = self._send_in_background('news ' * 40)
+        time.sleep(0.08)
+        second, second_results = self._send_in_background('books books')
+        first.join()
+        second.join()
+        
+        self.assertEqual(first_results[0]['status'], 'cancelled')
+        self.assertLess(first_results[0]['chunks_sent'], 10)
+        self.assertEqual(second_results[0]['status'], 'success')
+        self.assertEqual([data['text'] for data in self.writes[-2:]], ['books', 'books'])
+    
+    def test_voice_stop_cancels_delivery(self):
+        """Test that the stop command ends a delivery with no further writes"""
+        import json
+        import time
+        
+        thread, results = self._send_in_background('news ' * 40)
+        time.sleep(0.08)
+        response = self.client.post(reverse('voice_command'), json.dumps({'command': 'stop'}),
+                                    content_type='application/json')
+        thread.join()
+        written = len(self.writes)
+        time.sleep(0.1)
+        
+        self.assertEqual(response.json()['action'], 'stopped')
+        self.assertEqual(results[0]['status'], 'cancelled')
+        self.assertEqual(len(self.writes), written)
+
+
+
+class MetricsTests(TestCase):
+    """Test cases for the Prometheus metrics registry"""
+    
+    def setUp(self):
+        import tempfile
+        from braille_app import metrics
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = self.settings(METRICS_DIR=self.tmpdir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+    
+    def test_counter_and_histogram_export(self):
+        """Test that labelled samples render in the text format"""
+        from braille_app import metrics
+        
+        deliveries = metrics.counter('test_deliveries_total', 'Deliveries', ['status'])
+        latency = metrics.histogram('test_write_seconds', 'Writes', ['operation'], buckets=(0.1, 1.0))
+        deliveries.labels('success').inc()
+        deliveries.labels('success').inc(2)
+        latency.labels('set').observe(0.05)
+        latency.labels('set').observe(0.5)
+        latency.labels('set').observe(5)
+        
+        text = metrics.generate_latest()
+        
+        self.assertIn('# TYPE test_deliveries_total counter', text)
+        self.assertIn('test_deliveries_total{status="success"} 3', text)
+        self.assertIn('test_write_seconds_bucket{operation="set",le="0.1"} 1', text)
+        self.assertIn('test_write_seconds_bucket{operation="set",le="1.0"} 2', text)
+        self.assertIn('test_write_seconds_bucket{operation="set",le="+Inf"} 3', text)
+        self.assertIn('test_write_seconds_count{operation="set"} 3', text)
+        self.assertIn('test_write_seconds_sum{operation="set"} 5.55', text)
+    
+    def test_values_summed_across_processes(self):
+        """Test that files of other workers are added in"""
+        import json
+        import struct
+        from braille_app import metrics
+        
+        jobs = metrics.counter('test_jobs_total', 'Jobs')
+        jobs.inc(2)
+        
+        # Another (exited) worker's files
+        key = json.dumps(['test_jobs_total', [], None])
+        base = os.path.join(self.tmpdir.name, '999999999')
+        with open(f'{base}.keys', 'w') as f:
+            f.write(json.dumps([key, 0]) + '\n')
+        with open(f'{base}.values', 'wb') as f:
+            f.write(struct.pack('d', 5))
+        
+        self.assertEqual(metrics.collect()[key], 7)
+    
+    def test_exited_processes_folded_into_archive(self):
+        """Test that a new store archives counters of exited workers and drops their gauges"""
+        import json
+        import struct
+        from braille_app import metrics
+        
+        metrics.gauge('test_busy', 'Busy')
+        jobs_key = json.dumps(['test_archived_total', [], None])
+        busy_key = json.dumps(['test_busy', [], None])
+        for name, count in (('999999998-1', 5), ('999999999-1', 3)):
+            base = os.path.join(self.tmpdir.name, name)
+            with open(f'{base}.keys', 'w') as f:
+                f.write(json.dumps([jobs_key, 0]) + '\n' + json.dumps([busy_key, 1]) + '\n')
+            with open(f'{base}.values', 'wb') as f:
+                f.write(struct.pack('dd', count, 1))
+        
+        metrics.reset()
+        metrics.counter('test_archived_total', 'Archived').inc()
+        
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, '999999998-1.values')))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, 'archive.json')))
+        totals = metrics.collect()
+        self.assertEqual(totals[jobs_key], 9)
+        self.assertNotIn(busy_key, totals)
+        
+        # Archived once: a second store does not add them again
+        metrics.reset()
+        metrics.counter('test_archived_total', 'Archived').inc()
+        self.assertEqual(metrics.collect()[jobs_key], 10)
+    
+    def test_metrics_endpoint(self):
+        """Test that /metrics serves the registry and counts requests"""
+        self.client.get(reverse('landing'))
+        response = self.client.get(reverse('metrics'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(
+            'braille_http_requests_total{view="landing",method="GET",status="200"} 1',
+            response.content.decode()
+        )
+    
+    def test_observation_overhead(self):
+        """Test that recording a sample stays around a microsecond"""
+        import time
+        from braille_app import metrics
+        
+        sample = metrics.histogram('test_overhead_seconds', 'Overhead').labels()
+        sample.observe(0.01)
+        
+        iterations = 20000
+        start = time.perf_counter()
+        for _ in range(iterations):
+            sample.observe(0.01)
+        per_call = (time.perf_counter() - start) / iterations
+        
+        # Generous bound so slow CI machines do not flake
+        self.assertLess(per_call, 10e-6)
+
+
+class TracingTests(TestCase):
+    """Test cases for request tracing"""
+    
+    def setUp(self):
+        import tempfile
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.trace_file = os.path.join(self.tmpdir.name, 'traces.jsonl')
+        settings_override = self.settings(TRACE_SAMPLE_RATE=1.0, TRACE_FILE=self.trace_file)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+    
+    def test_spans_nest(self):
+        """Test that decorated calls become child spans of the open span"""
+        from braille_app import tracing
+        
+        @tracing.traced('inner')
+        def inner():
+            with tracing.span('leaf', size=3):
+                pass
+        
+        with tracing.start_trace('request') as root:
+            inner()
+            inner()
+        
+        names = [(recorded.name, recorded.parent_id) for recorded in root.trace.spans]
+        self.assertEqual(names, [('request', None), ('inner', 1), ('leaf', 2), ('inner', 1), ('leaf', 4)])
+        self.assertEqual(root.trace.spans[2].attrs, {'size': 3})
+        self.assertIn('inner;dur=', tracing.server_timing(root.trace))
+        self.assertIn(';desc="2 calls"', tracing.server_timing(root.trace))
+    
+    def test_span_ids_are_unique(self):
+        """Test that spans created before entering or from several threads get distinct ids"""
+        from concurrent.futures import ThreadPoolExecutor
+        from braille_app import tracing
+        
+        def child(parent):
+            with tracing.Span(parent.trace, 'child', parent.span_id):
+                pass
+        
+        with tracing.start_trace('request') as root:
+            first, second = tracing.span('first'), tracing.span('second')
+            with first, second:
+                pass
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(child, [root] * 200))
+        
+        ids = [recorded.span_id for recorded in root.trace.spans]
+        self.assertEqual(len(ids), 203)
+        self.assertEqual(len(set(ids)), 203)
+    
+    def test_traced_request_has_header_and_file_entry(self):
+        """Test that a sampled request gets Server-Timing and a trace line"""
+        import json
+        
+        response = self.client.get(reverse('landing'))
+        
+        self.assertIn('total;dur=', response['Server-Timing'])
+        with open(self.trace_file) as f:
+            trace = json.loads(f.readline())
+        self.assertEqual(trace['trace_id'], response['X-Trace-Id'])
+        self.assertEqual(trace['spans'][0]['attrs']['view'], 'landing')
+    
+    def test_unsampled_request_is_not_traced(self):
+        """Test that requests outside the sample skip tracing entirely"""
+        from braille_app import tracing
+        
+        with self.settings(TRACE_SAMPLE_RATE=0):
+            response = self.client.get(reverse('landing'))
+        
+        self.assertNotIn('Server-Timing', response)
+        self.assertFalse(os.path.exists(self.trace_file))
+        self.assertIs(tracing.span('outside'), tracing._NOOP)
+
+
+class LoggingTests(TestCase):
+    """Test cases for the queued structured logging"""
+    
+    def _record(self, msg, *args, level=None, **extra):
+        import logging
+        record = logging.makeLogRecord({
+            'name': 'braille_app.test', 'levelno': level or logging.WARNING,
+            'levelname': logging.getLevelName(level or logging.WARNING), 'msg': msg, 'args': args,
+        })
+        record.__dict__.update(extra)
+        return record
+    
+    def test_repeat_filter_suppresses_storms(self):
+        """Test that repeats beyond the limit are dropped and then reported"""
+        from unittest import mock
+        from braille_app.log import RepeatFilter
+        
+        repeat_filter = RepeatFilter(limit=2, window=60)
+        with mock.patch('braille_app.log.time.monotonic', return_value=100):
+            passed = [repeat_filter.filter(self._record("Error fetching %s", n)) for n in range(5)]
+        with mock.patch('braille_app.log.time.monotonic', return_value=161):
+            later = self._record("Error fetching %s", 'x')
+            self.assertTrue(repeat_filter.filter(later))
+        
+        self.assertEqual(passed, [True, True, False, False, False])
+        self.assertEqual(later.suppressed, 3)
+    
+    def test_json_output_includes_extra_fields(self):
+        """Test that JSON lines carry the message and extra fields"""
+        import json
+        from braille_app.log import JsonFormatter
+        
+        entry = json.loads(JsonFormatter().format(self._record("Error fetching %s", 'news', category='sports')))
+        
+        self.assertEqual(entry['message'], 'Error fetching news')
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['category'], 'sports')
+    
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test that logging never waits on a full queue"""
+        import queue
+        from braille_app.log import AsyncQueueHandler
+        
+        handler = AsyncQueueHandler(queue.Queue(maxsize=1))
+        handler.emit(self._record("first"))
+        handler.emit(self._record("second"))
+        
+        self.assertEqual(handler.queue.qsize(), 1)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), 'first')
+    
+    def test_records_reach_output(self):
+        """Test that the listener thread writes queued records"""
+        import io
+        import logging
+        from unittest import mock
+        from braille_app import log
+        
+        output = io.StringIO()
+        with mock.patch('sys.stdout', output):
+            logging.getLogger('braille_app.test').warning("Device %s unreachable", 'panel')
+            log.flush()
+        
+        self.assertIn('WARNING braille_app.test: Device panel unreachable', output.getvalue())
+
+
+class ResilienceTests(TestCase):
+    """Test cases for the retry policy and circuit breaker"""
+    
+    def setUp(self):
+        from braille_app import resilience
+        
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        self.policy = resilience.RetryPolicy(
+            attempts=3, deadline=2.0, attempt_timeout=1.0, base_delay=0.001, max_delay=0.01,
+            failure_threshold=3, reset_timeout=0.2
+        )
+    
+    def _flaky(self, failures, error=ConnectionError):
+        calls = []
+        
+        def attempt(timeout):
+            calls.append(timeout)
+            if len(calls) <= failures:
+                raise error('down')
+            return 'ok'
+        return attempt, calls
+    
+    def test_transient_errors_are_retried(self):
+        """Test that a call succeeds after retryable failures"""
+        from braille_app.resilience import call_with_retry
+        
+        attempt, calls = self._flaky(2)
+        
+        self.assertEqual(call_with_retry(attempt, 'test', self.policy), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertLessEqual(max(calls), 1.0)
+    
+    def test_permanent_errors_are_not_retried(self):
+        """Test that non-retryable errors fail on the first attempt"""
+        from braille_app.resilience import call_with_retry
+        
+        attempt, calls = self._flaky(5, error=ValueError)
+        
+        with self.assertRaises(ValueError):
+            call_with_retry(attempt, 'test', self.policy, retryable=lambda e: not isinstance(e, ValueError))
+        self.assertEqual(len(calls), 1)
+    
+    def test_breaker_fails_fast_then_probes(self):
+        """Test that an open breaker skips calls until the reset timeout"""
+        import time
+        from braille_app.resilience import CircuitOpen, call_with_retry
+        
+        attempt, calls = self._flaky(100)
+        with self.assertRaises(ConnectionError):
+            call_with_retry(attempt, 'test', self.policy)
+        self.assertEqual(len(calls), 3)
+        
+        with self.assertRaises(CircuitOpen):
+            call_with_retry(attempt, 'test', self.policy)
+        self.assertEqual(len(calls), 3)
+        
+        time.sleep(0.25)
+        healthy, healthy_calls = self._flaky(0)
+        self.assertEqual(call_with_retry(healthy, 'test', self.policy), 'ok')
+        self.assertEqual(call_with_retry(healthy, 'test', self.policy), 'ok')
+        self.assertEqual(len(healthy_calls), 2)
+    
+    def test_deadline_bounds_the_call(self):
+        """Test that slow failures stop at the deadline"""
+        import time
+        from braille_app.resilience import DeadlineExceeded, RetryPolicy, call_with_retry, deadline_scope
+        
+        policy = RetryPolicy(attempts=10, deadline=5.0, base_delay=0.05, max_delay=0.05, failure_threshold=100)
+        
+        def slow(timeout):
+            time.sleep(min(timeout, 0.05))
+            raise ConnectionError('timeout')
+        
+        start = time.monotonic()
+        with deadline_scope(0.2), self.assertRaises((DeadlineExceeded, ConnectionError)):
+            call_with_retry(slow, 'test', policy)
+        
+        self.assertLess(time.monotonic() - start, 0.4)
+    
+    def test_retry_budget_limits_extra_load(self):
+        """Test that retries stop once the budget is spent"""
+        from braille_app.resilience import RetryBudget
+        
+        budget = RetryBudget(ratio=0.1, min_per_second=0, cap=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        
+        for _ in range(10):
+            budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+    
+    def test_firebase_write_fails_fast_during_outage(self):
+        """Test that Firebase writes stop hitting the network once the breaker opens"""
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        from braille_app.resilience import CircuitOpen
+        
+        retry = dict(attempts=2, deadline=1.0, attempt_timeout=0.5, base_delay=0.001, max_delay=0.001,
+                     failure_threshold=2, reset_timeout=60)
+        config = {'databaseURL': 'https://example.invalid', 'authToken': 'token'}
+        with self.settings(FIREBASE_CONFIG=config, FIREBASE_RETRY=retry), \
+                mock.patch('braille_app.firebase_service.requests.put', side_effect=ConnectionError('down')) as put:
+            with self.assertRaises(ConnectionError):
+                FirebaseService._write('/panel/text', 'hello')
+            with self.assertRaises(CircuitOpen):
+                FirebaseService._write('/panel/text', 'hello')
+        
+        self.assertEqual(put.call_count, 2)
+
+
+class DeliveryQueueTests(TransactionTestCase):
+    """Test cases for durable delivery jobs and the delivery worker"""
+    
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        from braille_app.firebase_service import FirebaseService
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        devices = {
+            'panel': {'cells': 5, 'refresh_seconds': 0, 'format': 'stream', 'path': '/panel/text'},
+            'desk': {'cells': 5, 'refresh_seconds': 0, 'format': 'stream', 'path': '/desk/text'},
+        }
+        settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            BRAILLE_DEVICES=devices,
+            DEFAULT_DEVICE_ID='panel',
+            DELIVERY_QUEUE=True,
+            DELIVERY_WORKER_AUTOSTART=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.writes = []
+        patcher = mock.patch.object(
+            FirebaseService, '_write', side_effect=lambda path, data: self.writes.append((path, data['text']))
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_send_endpoint_only_inserts_a_job(self):
+        """Test that the web request queues the job without writing to Firebase"""
+        from braille_app.models import DeliveryJob
+        
+        response = self.client.post(reverse('helper_custom_text'), {'text': 'hello braille world'})
+        data = response.json()
+        
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['state'], 'queued')
+        self.assertEqual(self.writes, [])
+        self.assertEqual(DeliveryJob.objects.get(pk=data['job_id']).status, 'queued')
+    
+    def test_worker_delivers_every_chunk(self):
+        """Test that a worker writes and acknowledges each chunk"""
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        
+        job, _ = enqueue_delivery('hello braille world')
+        DeliveryWorker(concurrency=2).run_once()
+        job.refresh_from_db()
+        
+        self.assertEqual(job.status, 'done', job.error)
+        self.assertEqual(job.acked_chunks, job.total_chunks)
+        self.assertEqual([text for _, text in self.writes], job.chunks)
+    
+    def test_chunk_writes_end_with_the_lease(self):
+        """Test that each chunk write gets a deadline no later than the lease"""
+        import time
+        from unittest import mock
+        from braille_app import resilience
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        from braille_app.firebase_service import FirebaseService
+        
+        deadlines = []
+        enqueue_delivery('hello braille world')
+        with mock.patch.object(FirebaseService, '_write',
+                               side_effect=lambda path, data: deadlines.append(resilience._deadline.get() - time.monotonic())):
+            DeliveryWorker(lease_seconds=20).run_once()
+        
+        self.assertTrue(deadlines)
+        self.assertTrue(all(0 < remaining <= 20 for remaining in deadlines))
+    
+    def test_job_resumes_after_worker_dies(self):
+        """Test that an expired lease is taken over at the last acked chunk"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from braille_app.delivery_queue import DeliveryWorker, claim_job, enqueue_delivery
+        from braille_app.models import DeliveryJob
+        
+        job, _ = enqueue_delivery('one two three four five six')
+        claim_job('crashed-worker')
+        DeliveryJob.objects.filter(pk=job.pk).update(
+            acked_chunks=2, lease_expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        
+        DeliveryWorker().run_once()
+        job.refresh_from_db()
+        
+        self.assertEqual(job.status, 'done')
+        self.assertEqual([text for _, text in self.writes], job.chunks[2:])
+    
+    def test_claims_are_exclusive_per_device(self):
+        """Test that a device never has two running jobs"""
+        from braille_app.delivery_queue import claim_job, enqueue_delivery
+        
+        enqueue_delivery('first text', device_id='panel')
+        enqueue_delivery('other text', device_id='desk')
+        
+        first = claim_job('worker-a')
+        second = claim_job('worker-b')
+        
+        self.assertEqual({first.device_id, second.device_id}, {'panel', 'desk'})
+        self.assertIsNone(claim_job('worker-c'))
+    
+    def test_new_send_cancels_queued_job(self):
+        """Test that the latest send replaces an undelivered one"""
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        
+        old, _ = enqueue_delivery('old text')
+        new, _ = enqueue_delivery('new text')
+        DeliveryWorker().run_once()
+        old.refresh_from_db()
+        new.refresh_from_db()
+        
+        self.assertEqual(old.status, 'cancelled')
+        self.assertEqual(new.status, 'done')
+        self.assertEqual([text for _, text in self.writes], ['new', 'text'])
+    
+    def test_urgent_lane_is_claimed_first(self):
+        """Test that an interactive job is claimed before an older bulk job"""
+        from braille_app.delivery_queue import claim_job, enqueue_delivery
+        
+        enqueue_delivery('long digest', device_id='panel', priority='bulk')
+        answer, _ = enqueue_delivery('answer', device_id='desk')
+        
+        self.assertEqual(claim_job('worker-a').pk, answer.pk)
+    
+    def test_interactive_job_preempts_bulk_stream(self):
+        """Test that a bulk stream gives way and resumes at the interrupted chunk"""
+        from unittest import mock
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        from braille_app.firebase_service import FirebaseService
+        
+        bulk, _ = enqueue_delivery('one two three four', priority='bulk')
+        
+        def write(path, data):
+            self.writes.append((path, data['text']))
+            if data['text'] == 'two' and len(self.writes) == 2:
+                enqueue_delivery('hi', priority='interactive')
+        
+        with mock.patch.object(FirebaseService, '_write', side_effect=write):
+            DeliveryWorker().run_once()
+        bulk.refresh_from_db()
+        
+        self.assertEqual(bulk.status, 'done')
+        self.assertEqual([text for _, text in self.writes], ['one', 'two', 'hi', 'two', 'three', 'four'])
+    
+    def test_worker_started_when_none_checked_in(self):
+        """Test that a send starts a worker thread only while no worker is alive"""
+        from unittest import mock
+        from braille_app import delivery_queue
+        
+        worker = mock.Mock()
+        with self.settings(DELIVERY_WORKER_AUTOSTART=None), \
+                mock.patch.object(delivery_queue, 'get_delivery_worker', return_value=worker):
+            delivery_queue.enqueue_delivery('first text')
+            self.assertEqual(worker.start.call_count, 1)
+            
+            delivery_queue._check_in('worker-process')
+            delivery_queue.enqueue_delivery('second text')
+            self.assertEqual(worker.start.call_count, 1)
+    
+    def test_old_finished_jobs_are_pruned(self):
+        """Test that finished jobs past the retention are deleted and pending ones kept"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from braille_app.delivery_queue import prune_jobs
+        from braille_app.models import DeliveryJob
+        
+        old = timezone.now() - timedelta(days=30)
+        DeliveryJob.objects.create(device_id='panel', text='old', status='done', finished_at=old)
+        DeliveryJob.objects.create(device_id='panel', text='recent', status='failed', finished_at=timezone.now())
+        DeliveryJob.objects.create(device_id='panel', text='waiting', status='queued')
+        
+        self.assertEqual(prune_jobs(), 1)
+        self.assertEqual(sorted(DeliveryJob.objects.values_list('text', flat=True)), ['recent', 'waiting'])
+    
+    def test_stop_cancels_preempted_job(self):
+        """Test that "stop" also drops a preempted stream instead of resuming it"""
+        from unittest import mock
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        from braille_app.firebase_service import FirebaseService
+        from braille_app.models import DeliveryJob
+        
+        enqueue_delivery('one two three four', priority='bulk')
+        
+        def write(path, data):
+            self.writes.append((path, data['text']))
+            if data['text'] == 'two' and len(self.writes) == 2:
+                enqueue_delivery('hi there', priority='interactive')
+            elif data['text'] == 'hi':
+                FirebaseService.stop_delivery()
+        
+        with mock.patch.object(FirebaseService, '_write', side_effect=write):
+            DeliveryWorker().run_once()
+        
+        self.assertEqual([text for _, text in self.writes], ['one', 'two', 'hi'])
+        self.assertEqual(set(DeliveryJob.objects.values_list('status', flat=True)), {'cancelled'})
+    
+    def test_bulk_send_does_not_interrupt_interactive_job(self):
+        """Test that a less urgent send waits for the running job"""
+        from braille_app.cancellation import current_generation
+        from braille_app.delivery_queue import claim_job, enqueue_delivery
+        
+        enqueue_delivery('answer')
+        claim_job('worker-a')
+        generation = current_generation('panel')
+        enqueue_delivery('long digest', priority='bulk')
+        
+        self.assertEqual(current_generation('panel'), generation)
+    
+    def test_duplicate_send_returns_job_in_flight(self):
+        """Test that resending queued content does not create a second job"""
+        from braille_app.delivery_queue import enqueue_delivery
+        from braille_app.models import DeliveryJob
+        
+        first, created = enqueue_delivery('hello braille world')
+        again, created_again = enqueue_delivery('hello braille world')
+        
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(DeliveryJob.objects.count(), 1)
+    
+    def test_duplicate_of_delivered_content_until_device_changes(self):
+        """Test that content still on the device is not rewritten"""
+        from braille_app.cancellation import cancel_delivery
+        from braille_app.delivery_queue import DeliveryWorker, enqueue_delivery
+        
+        job, _ = enqueue_delivery('hello braille world')
+        DeliveryWorker().run_once()
+        
+        self.assertEqual(enqueue_delivery('hello braille world'), (job, False))
+        
+        cancel_delivery('panel')  # something else was written to the device
+        _, created = enqueue_delivery('hello braille world')
+        self.assertTrue(created)
+    
+    def test_idempotency_key_returns_original_job(self):
+        """Test that a retried request with the same key gets the same job"""
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'send-1'}
+        first = self.client.post(reverse('helper_custom_text'), {'text': 'first text'}, **headers).json()
+        retry = self.client.post(reverse('helper_custom_text'), {'text': 'first text'}, **headers).json()
+        reused = self.client.post(reverse('helper_custom_text'), {'text': 'other text'}, **headers)
+        
+        self.assertEqual(retry['job_id'], first['job_id'])
+        self.assertTrue(retry['duplicate'])
+        self.assertFalse(first['duplicate'])
+        self.assertEqual(reused.status_code, 409)
+    
+    def test_ai_helper_key_matches_question_and_device(self):
+        """Test that a reused key only returns the stored answer for the same question and device"""
+        from unittest import mock
+        
+        gemini = mock.Mock()
+        gemini.chat.side_effect = lambda message: {'response': f'Answer to {message}'}
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'ask-1'}
+        url = reverse('vi_ai_helper')
+        with mock.patch('braille_app.views.get_gemini_service', return_value=gemini), \
+                self.settings(CLIENT_RATE_LIMITS={}):
+            first = self.client.post(url, {'message': 'what time is it'}, **headers).json()
+            retry = self.client.post(url, {'message': 'what time is it'}, **headers).json()
+            other = self.client.post(url, {'message': 'what day is it'}, **headers)
+            desk = self.client.post(url, {'message': 'what day is it', 'device_id': 'desk'}, **headers).json()
+        
+        self.assertTrue(retry['duplicate'])
+        self.assertEqual(retry['ai_response'], first['ai_response'])
+        self.assertEqual(other.status_code, 409)
+        self.assertEqual(desk['ai_response'], 'Answer to what day is it')
+        self.assertEqual(gemini.chat.call_count, 2)
+
+
+class ClientRateLimitTests(TestCase):
+    """Test cases for the per-client rate limit middleware"""
+    
+    def setUp(self):
+        import tempfile
+        
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = self.settings(
+            SHARED_STATE_DB_PATH=os.path.join(self.tmpdir.name, 'state.sqlite3'),
+            CLIENT_RATE_LIMITS={'send': {'views': ['voice_command'], 'requests_per_minute': 1, 'burst': 2}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = Client()
+    
+    def command(self, client=None, **extra):
+        import json
+        
+        return (client or self.client).post(reverse('voice_command'), json.dumps({'command': 'hello'}),
+                                            content_type='application/json', **extra)
+    
+    def test_over_limit_gets_429_with_retry_after(self):
+        """Test that requests beyond the burst are refused with a retry hint"""
+        self.assertEqual(self.command().status_code, 200)
+        self.assertEqual(self.command().status_code, 200)
+        response = self.command()
+        
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertTrue(response.json()['message'].startswith('Too many requests'))
+    
+    def test_clients_have_separate_buckets(self):
+        """Test that one client's flood does not limit another"""
+        with self.settings(RATE_LIMIT_TRUST_FORWARDED_FOR=True):
+            for _ in range(3):
+                self.command(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+            
+            response = self.command(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.2')
+        self.assertEqual(response.status_code, 200)
+    
+    def test_client_cannot_pick_its_own_bucket(self):
+        """Test that invented session cookies and forwarded-for hops do not reset the limit"""
+        from django.conf import settings
+        
+        for _ in range(2):
+            self.command(REMOTE_ADDR='10.0.0.1')
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'made-up-session'
+        self.assertEqual(self.command(REMOTE_ADDR='10.0.0.1').status_code, 429)
+        self.assertEqual(self.command(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.2').status_code, 429)
+        
+        with self.settings(RATE_LIMIT_TRUST_FORWARDED_FOR=True):
+            for _ in range(2):
+                self.command(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.7')
+            forged = self.command(REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='198.51.100.2, 203.0.113.7')
+        self.assertEqual(forged.status_code, 429)
+    
+    def test_session_does_not_replace_ip_bucket(self):
+        """Test that a fresh server-side session still pays from the IP bucket"""
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.conf import settings
+        
+        for _ in range(2):
+            self.command(REMOTE_ADDR='10.0.0.1')
+        session = SessionStore()
+        session['minted'] = True
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        
+        self.assertEqual(self.command(REMOTE_ADDR='10.0.0.1').status_code, 429)
+    
+    def test_rejected_group_takes_no_token_from_others(self):
+        """Test that a view in several groups is charged only when every group allows it"""
+        limits = {
+            'wide': {'views': ['voice_command'], 'requests_per_minute': 1, 'burst': 3},
+            'narrow': {'views': ['voice_command'], 'requests_per_minute': 1, 'burst': 1},
+        }
+        with self.settings(CLIENT_RATE_LIMITS=limits):
+            client = Client()
+            self.assertEqual(self.command(client, REMOTE_ADDR='10.0.0.2').status_code, 200)
+            for _ in range(3):
+                self.assertEqual(self.command(client, REMOTE_ADDR='10.0.0.2').status_code, 429)
+        
+        # The rejected requests left the two remaining 'wide' tokens alone
+        from braille_app.rate_limiter import take_client_tokens
+        self.assertEqual(take_client_tokens([('wide:ip:10.0.0.2', 1, 3)])[0], 0)
+        self.assertEqual(take_client_tokens([('wide:ip:10.0.0.2', 1, 3)])[0], 0)
+        self.assertGreater(take_client_tokens([('wide:ip:10.0.0.2', 1, 3)])[0], 0)
+    
+    def test_unlimited_methods_pass(self):
+        """Test that only the configured methods count"""
+        for _ in range(3):
+            response = self.client.get(reverse('voice_command'))
+        self.assertNotEqual(response.status_code, 429)
+
+
+class DeliveryEventsTests(TestCase):
+    """Test cases for the delivery progress event stream"""
+    
+    def setUp(self):
+        from braille_app.models import DeliveryJob
+        
+        self.client = Client()
+        self.job = DeliveryJob.objects.create(
+            device_id='panel', text='one two', chunks=['one', 'two'], acked_chunks=2, status='done'
+        )
+    
+    def events(self, job_id, **headers):
+        response = self.client.get(reverse('delivery_events', args=[job_id]), **headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return b''.join(response.streaming_content).decode()
+    
+    def test_stream_reports_acked_chunks_and_finishes(self):
+        """A finished job streams each acknowledged chunk, then its state"""
+        body = self.events(self.job.pk)
+        self.assertIn('id: 1\nevent: acked\ndata: {"chunk": 1, "total": 2}', body)
+        self.assertIn('id: 2\nevent: acked', body)
+        self.assertIn('event: state\ndata: {"status": "done"', body)
+    
+    def test_stream_resumes_after_last_event_id(self):
+        """A reconnecting browser only gets the chunks it has not seen"""
+        body = self.events(self.job.pk, HTTP_LAST_EVENT_ID='1')
+        self.assertNotIn('id: 1\n', body)
+        self.assertIn('id: 2\nevent: acked', body)
+    
+    def test_failed_job_reports_error(self):
+        """A failed job ends with its error"""
+        self.job.status = 'failed'
+        self.job.error = 'Device unreachable'
+        self.job.save()
+        body = self.events(self.job.pk)
+        self.assertIn('event: error\ndata: {"message": "Device unreachable", "retrying": false}', body)
+    
+    def test_wsgi_answers_at_once_for_running_job(self):
+        """Under WSGI a running job gets one short answer instead of a held stream"""
+        self.job.status = 'running'
+        self.job.acked_chunks = 1
+        self.job.save()
+        body = self.events(self.job.pk)
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn('event: state\ndata: {"status": "running"', body)
+        self.assertNotIn('id: 2\n', body)
+    
+    def test_unknown_job(self):
+        """An unknown job id ends the stream with an error"""
+        body = self.events(self.job.pk + 100)
+        self.assertIn('Unknown delivery job', body)
+    
+    async def test_async_stream(self):
+        """The ASGI stream emits the same events"""
+        from braille_app.delivery_events import ajob_events
+        
+        body = ''.join([event async for event in ajob_events(self.job.pk)])
+        self.assertIn('id: 2\nevent: acked', body)
+        self.assertIn('"status": "done"', body)
+
+
+class PageCacheTests(TestCase):
+    """Test cases for cached menu pages and conditional GET"""
+    
+    def setUp(self):
+        from braille_app import page_cache
+        
+        settings_override = self.settings(
+            PAGE_CACHE_ENABLED=True,
+            DEPLOY_VERSION='v1',
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+        self.client = Client()
+    
+    def test_page_is_rendered_once(self):
+        """Test that later requests are served without rendering the template"""
+        from unittest import mock
+        
+        first = self.client.get(reverse('visually_impaired_menu'))
+        with mock.patch('braille_app.views.render') as render:
+            second = self.client.get(reverse('visually_impaired_menu'))
+        
+        render.assert_not_called()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+    
+    def test_conditional_get_returns_304(self):
+        """Test that a revalidation with the current ETag gets an empty 304"""
+        first = self.client.get(reverse('landing'))
+        self.assertIn('no-cache', first['Cache-Control'])
+        
+        response = self.client.get(reverse('landing'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+    
+    def test_deploy_version_retires_etags(self):
+        """Test that a new deploy version serves the page again"""
+        etag = self.client.get(reverse('helper_menu'))['ETag']
+        
+        with self.settings(DEPLOY_VERSION='v2'):
+            response = self.client.get(reverse('helper_menu'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_helper_page_sets_csrf_cookie_without_embedding_token(self):
+        """Test that a cached helper page works for every visitor's CSRF token"""
+        self.client.get(reverse('helper_custom_text'))
+        response = Client().get(reverse('helper_custom_text'))
+        
+        self.assertIn('csrftoken', response.cookies)
+        self.assertNotContains(response, response.cookies['csrftoken'].value)
+
 # Add more tests as needed
@@ -0,0 +1,238 @@
+"""
+Request Tracing Module for Braille Display Website
+
+Lightweight spans from a view down to the upstream calls it makes. The
+TracingMiddleware starts a trace for a sample of requests (TRACE_SAMPLE_RATE);
+code underneath opens spans with `span()` or the `@traced` decorator, and the
+spans nest through a context variable. When the request ends the trace is
+appended to TRACE_FILE as one JSON line and summarised in a Server-Timing
+header, so browser dev tools show where the time went.
+
+For requests that are not sampled there is no trace in the context, and a
+span costs one context-variable lookup.
+
+Usage:
+    @traced('gemini.describe_image')
+    def describe_image(self, ...):
+        ...
+
+    with span('upload.save', size=image_file.size):
+        fs.save(...)
+"""
+
+import contextvars
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('braille_trace_span', default=None)
+
+
+class Trace:
+    """
+    Spans recorded for one request.
+    """
+
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started_at = time.time()
+        self.spans = []
+        # Span ids are drawn here, not from len(spans): spans are appended
+        # only when entered and may be created in several threads
+        self.span_ids = itertools.count(1)
+
+
+class Span:
+    """
+    One timed operation inside a trace.
+    """
+
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attrs', 'start', 'duration', '_token')
+
+    def __init__(self, trace, name, parent_id=None, attrs=None):
+        self.trace = trace
+        self.span_id = next(trace.span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = None
+        self.duration = None
+        self._token = None
+
+    def set(self, key, value):
+        """
+        Attach an attribute to the span.
+        """
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self.trace.spans.append(self)
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        _current.reset(self._token)
+        return False
+
+
+class _NoopSpan:
+    """
+    Stand-in for spans outside a sampled trace.
+    """
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """
+    Open a span under the current one (a no-op when the request is not traced).
+
+    Args:
+        name (str): Operation name, e.g. 'firebase.set'
+        **attrs: Attributes recorded with the span
+
+    Returns:
+        Context manager yielding the span
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent.trace, name, parent.span_id, attrs)
+
+
+def traced(name=None):
+    """
+    Decorator that runs a function inside a span (named after it by default).
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current.get()
+            if parent is None:
+                return func(*args, **kwargs)
+            with Span(parent.trace, span_name, parent.span_id):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name, **attrs):
+    """
+    Start a new trace; use the returned root span as a context manager.
+    """
+    return Span(Trace(name), name, attrs=attrs)
+
+
+def current_trace_id():
+    """
+    Id of the trace the caller is running in, or None.
+    """
+    current = _current.get()
+    return current.trace.trace_id if current is not None else None
+
+
+def should_sample():
+    """
+    Decide whether to trace a request, per TRACE_SAMPLE_RATE.
+    """
+    rate = settings.TRACE_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def _timing_name(name):
+    # Server-Timing metric names are HTTP tokens
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def server_timing(trace):
+    """
+    Server-Timing header value: total time per span name, in milliseconds.
+    """
+    totals = {}
+    for recorded in trace.spans:
+        if recorded.duration is None:
+            continue  # still running in another thread
+        name = 'total' if recorded.parent_id is None else _timing_name(recorded.name)
+        duration, count = totals.get(name, (0.0, 0))
+        totals[name] = (duration + recorded.duration, count + 1)
+
+    entries = []
+    for name, (duration, count) in totals.items():
+        entry = f'{name};dur={duration * 1000:.1f}'
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    return ', '.join(entries)
+
+
+def to_dict(trace):
+    """
+    JSON-ready form of a trace, spans in start order.
+    """
+    root_start = trace.spans[0].start if trace.spans else 0
+    return {
+        'trace_id': trace.trace_id,
+        'name': trace.name,
+        'timestamp': trace.started_at,
+        'spans': [
+            {
+                'id': recorded.span_id,
+                'parent': recorded.parent_id,
+                'name': recorded.name,
+                'offset_ms': round((recorded.start - root_start) * 1000, 3),
+                'duration_ms': None if recorded.duration is None else round(recorded.duration * 1000, 3),
+                'attrs': recorded.attrs,
+            }
+            for recorded in trace.spans
+        ],
+    }
+
+
+_file_lock = threading.Lock()
+
+
+def export(trace):
+    """
+    Append a trace to TRACE_FILE as one JSON line.
+    """
+    path = settings.TRACE_FILE
+    if not path:
+        return
+    line = (json.dumps(to_dict(trace), default=str) + '\n').encode('utf-8')
+    try:
+        with _file_lock:
+            # O_APPEND with a single write keeps lines from different workers whole
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+    except OSError as e:
+        logger.warning("Could not write trace: %s", e)
@@ -25,4 +25,12 @@ urlpatterns = [
     
     # API Endpoints
     path('api/voice-command/', views.voice_command, name='voice_command'),
+    path('api/news/cache-stats/', views.news_cache_stats, name='news_cache_stats'),
+    path('api/news/dedup-stats/', views.news_dedup_stats, name='news_dedup_stats'),
+    path('api/reading/open/', views.reading_open, name='reading_open'),
+    path('api/reading/advance/', views.reading_advance, name='reading_advance'),
+    path('api/deliveries/<int:job_id>/events/', views.delivery_events, name='delivery_events'),
+
+    # Monitoring
+    path('metrics', views.metrics, name='metrics'),
 ]
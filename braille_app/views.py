@@ -4,23 +4,52 @@ Restructured workflow with Helper and Visually Impaired paths
 """
 
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
+import json
 import os
 
 # Import services
-from .firebase_service import send_text_to_braille_device
+from .firebase_service import FirebaseService, send_text_to_device_group
 from .gemini_service import get_gemini_service
-from .news_service import get_news_service
+from .news_service import get_news_service, NEWS_CATEGORY_MAP
+from .news_prefetch import get_news_digest, build_news_digest
+from .dedup import filter_delivered, get_dedup_stats, mark_delivered
+from .library import LibraryError, import_text
+from .reading_service import get_reading_service
+from .popular_books import POPULAR_BOOKS, get_popular_book_payload
 from .books_service import get_books_service
+from .delivery_queue import IdempotencyConflict, deliver_text, idempotent_job, request_hash
+from .delivery_events import ajob_events, job_events
+from .page_cache import cached_page
+from .metrics import generate_latest
+from .devices import get_device_profile
+from .tracing import span
+from .resilience import deadline_scope
+
+
+def _unknown_device(device_id):
+    """
+    Error response for a device id that is not in settings.BRAILLE_DEVICES.
+    """
+    return JsonResponse({'status': 'error', 'message': f'Unknown device: {device_id}'}, status=400)
+
+
+def _send_response(result):
+    """
+    JSON response for a deliver_text() result; a reused Idempotency-Key is a 409.
+    """
+    return JsonResponse(result, status=409 if result['status'] == 'conflict' else 200)
 
 
 # ============================================
 # LANDING PAGE - Choose Helper or Visually Impaired
 # ============================================
 
+@cached_page
 def landing(request):
     """
     Landing page with 2 options: Helper or Visually Impaired
@@ -36,6 +65,7 @@ def landing(request):
 # VISUALLY IMPAIRED PATH
 # ============================================
 
+@cached_page
 def visually_impaired_menu(request):
     """
     Menu for visually impaired users: Books, News, AI Helper
@@ -52,50 +82,25 @@ def vi_books(request):
     Popular books selection for visually impaired users.
     Shows 3-4 popular books (Atomic Habits, etc.)
     """
-    # Popular books collection
-    books = [
-        {
-            'id': 'atomic_habits',
-            'title': 'Atomic Habits',
-            'author': 'James Clear',
-            'content': 'Atomic Habits by James Clear. Chapter 1: The Surprising Power of Atomic Habits. Habits are the compound interest of self-improvement. The same way that money multiplies through compound interest, the effects of your habits multiply as you repeat them.'
-        },
-        {
-            'id': 'think_and_grow_rich',
-            'title': 'Think and Grow Rich',
-            'author': 'Napoleon Hill',
-            'content': 'Think and Grow Rich by Napoleon Hill. Introduction: The Man Who Thought His Way into Partnership with Thomas Edison. This book teaches you the thirteen steps to riches. Success comes to those who become success conscious.'
-        },
-        {
-            'id': 'power_of_now',
-            'title': 'The Power of Now',
-            'author': 'Eckhart Tolle',
-            'content': 'The Power of Now by Eckhart Tolle. Chapter 1: You Are Not Your Mind. The greatest obstacle to enlightenment is identification with your mind, which causes thought to become compulsive.'
-        },
-        {
-            'id': 'rich_dad_poor_dad',
-            'title': 'Rich Dad Poor Dad',
-            'author': 'Robert Kiyosaki',
-            'content': "Rich Dad Poor Dad by Robert Kiyosaki. Introduction: The rich don't work for money. The poor and middle class work for money. The rich have money work for them. Learn the difference between assets and liabilities."
-        }
-    ]
-    
     if request.method == 'POST':
         book_id = request.POST.get('book_id')
-        selected_book = next((b for b in books if b['id'] == book_id), None)
+        payload = get_popular_book_payload(book_id)
         
-        if selected_book:
-            result = send_text_to_braille_device(selected_book['content'])
+        if payload:
+            # Chunks were prepared at startup; the slot is only staged once
+            with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+                result = FirebaseService.publish(f'book_{book_id}', payload['text'], payload['chunks'])
             return JsonResponse(result)
     
     context = {
         'page_title': 'Popular Books',
         'instruction': 'Select a book to read',
-        'books': books
+        'books': POPULAR_BOOKS
     }
     return render(request, 'vi_books.html', context)
 
 
+@cached_page
 def vi_news(request):
     """
     News category selection for visually impaired users
@@ -111,29 +116,45 @@ def vi_news_category(request, category):
     """
     Fetch and send real-time news to Firebase/hardware
     """
-    news_service = get_news_service()
-    
-    # Map URL categories to NewsAPI categories
-    category_map = {
-        'headlines': 'general',
-        'technology': 'technology',
-        'sports': 'sports',
-        'business': 'business'
-    }
+    # Prefetched digests are refreshed in the background (see news_prefetch.py);
+    # a stale one is ignored and the news is fetched live
+    digest = get_news_digest(category) if category in NEWS_CATEGORY_MAP else None
     
-    api_category = category_map.get(category, 'general')
-    articles = news_service.get_top_headlines(category=api_category)
+    if digest is None:
+        news_service = get_news_service()
+        api_category = NEWS_CATEGORY_MAP.get(category, 'general')
+        articles = news_service.get_top_headlines(category=api_category)
+        
+        if not articles:
+            return redirect('/visually-impaired/news/')
+        
+        digest = build_news_digest(category, articles)
     
-    if not articles:
-        return redirect('/visually-impaired/news/')
+    articles = digest['articles']
     
-    # Format news for sending to device
-    news_text = f"{category.upper()} NEWS:\n\n"
-    for i, article in enumerate(articles[:5], 1):
-        news_text += f"{i}. {article['title']}\n{article.get('description', '')}\n\n"
+    # Skip stories this reader already received under another category
+    if settings.NEWS_DEDUP_ENABLED:
+        articles = filter_delivered(request.session, articles)
     
     # Auto-send to Firebase
-    result = send_text_to_braille_device(news_text)
+    if not articles:
+        with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+            result = FirebaseService.publish('notice', f"No new {category} news since you last read it.")
+    elif len(articles) < len(digest['articles']):
+        # Some stories were dropped, so the prestaged slot no longer matches
+        news_text = get_news_service().format_news_text(category, articles)
+        with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+            result = FirebaseService.publish(f'news_{category}', news_text)
+    elif digest.get('slot'):
+        # A prestaged slot only needs its pointer switched
+        with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+            result = FirebaseService.activate_slot(digest['slot'])
+    else:
+        # Long digest: interactive sends and notifications go ahead of it
+        result = deliver_text(digest['news_text'], chunks=digest['chunks'], priority='bulk')
+    
+    if settings.NEWS_DEDUP_ENABLED and articles and result.get('status') == 'success':
+        mark_delivered(request.session, articles)
     
     context = {
         'page_title': f'{category.title()} News',
@@ -154,13 +175,33 @@ def vi_ai_helper(request):
     
     if request.method == 'POST':
         user_message = request.POST.get('message', '').strip()
+        idempotency_key = request.headers.get('Idempotency-Key', '')[:128]
+        device_id = request.POST.get('device_id') or settings.DEFAULT_DEVICE_ID
+        if device_id not in settings.BRAILLE_DEVICES:
+            return _unknown_device(device_id)
+        fingerprint = request_hash(user_message)
+        
+        # A retried request gets the answer it already produced
+        try:
+            job = idempotent_job(idempotency_key, device_id, fingerprint) if settings.DELIVERY_QUEUE else None
+        except IdempotencyConflict as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=409)
+        if user_message and job is not None:
+            return JsonResponse({
+                'status': 'success',
+                'user_message': user_message,
+                'ai_response': job.text,
+                'firebase_sent': True,
+                'duplicate': True
+            })
         
         if user_message:
             # Get AI response
             ai_response = gemini_service.chat(user_message)
             
             # Send response to braille device
-            firebase_result = send_text_to_braille_device(ai_response['response'])
+            firebase_result = deliver_text(ai_response['response'], device_id=device_id,
+                                           idempotency_key=idempotency_key, fingerprint=fingerprint)
             
             return JsonResponse({
                 'status': 'success',
@@ -180,6 +221,7 @@ def vi_ai_helper(request):
 # HELPER PATH
 # ============================================
 
+@cached_page
 def helper_menu(request):
     """
     Menu for helpers: Send Custom Text, PDF to Braille, Image Transcription
@@ -191,55 +233,74 @@ def helper_menu(request):
     return render(request, 'helper_menu.html', context)
 
 
+@cached_page
 def helper_custom_text(request):
     """
     Send custom text to braille device (voice or typing)
     """
     if request.method == 'POST':
         text = request.POST.get('text', '').strip()
+        group = request.POST.get('group', '').strip()
         
         if text:
-            result = send_text_to_braille_device(text)
-            return JsonResponse(result)
+            if group:
+                result = send_text_to_device_group(text, group)
+            else:
+                result = deliver_text(text, idempotency_key=request.headers.get('Idempotency-Key', '')[:128])
+            return _send_response(result)
     
     context = {
         'page_title': 'Send Custom Text',
-        'instruction': 'Type or speak text to send to braille device'
+        'instruction': 'Type or speak text to send to braille device',
+        'device_groups': list(settings.BRAILLE_DEVICE_GROUPS),
     }
     return render(request, 'helper_custom_text.html', context)
 
 
+@cached_page
 def helper_pdf_to_braille(request):
     """
     Upload PDF and extract text to send to braille device
     """
     if request.method == 'POST' and request.FILES.get('pdf_file'):
         pdf_file = request.FILES['pdf_file']
+        device_id = request.POST.get('device_id') or settings.DEFAULT_DEVICE_ID
+        if device_id not in settings.BRAILLE_DEVICES:
+            return _unknown_device(device_id)
         
         # Save file
         fs = FileSystemStorage()
-        filename = fs.save(pdf_file.name, pdf_file)
+        with span('upload.save', size=pdf_file.size):
+            filename = fs.save(pdf_file.name, pdf_file)
         file_path = fs.path(filename)
         
         try:
             # Extract text from PDF
             import PyPDF2
             
-            with open(file_path, 'rb') as file:
+            with span('pdf.extract'), open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
+                pages = [page.extract_text() or '' for page in pdf_reader.pages]
+            text = "".join(pages)
             
-            # Send to Firebase
-            result = send_text_to_braille_device(text)
+            # On request, keep a copy in the library, windowed for the device,
+            # so reading can later resume by window through /api/reading/open/
+            document_id = None
+            if request.POST.get('keep_for_reading'):
+                try:
+                    document_id = 'pdf_' + FirebaseService.content_version(text)
+                    import_text(pages, document_id, title=pdf_file.name,
+                                window_size=get_device_profile(device_id).cells)
+                except LibraryError:
+                    document_id = None  # e.g. a scanned PDF without a text layer
             
-            # Clean up file
-            fs.delete(filename)
+            # Send to the device in its own format (slot or queued delivery)
+            result = deliver_text(text, device_id=device_id)
             
             return JsonResponse({
                 'status': 'success',
                 'message': f'Extracted {len(text)} characters from PDF',
+                'document_id': document_id,
                 'firebase_result': result
             })
         except Exception as e:
@@ -247,6 +308,9 @@ def helper_pdf_to_braille(request):
                 'status': 'error',
                 'message': f'Error processing PDF: {str(e)}'
             })
+        finally:
+            # Clean up file
+            fs.delete(filename)
     
     context = {
         'page_title': 'PDF to Braille',
@@ -255,6 +319,7 @@ def helper_pdf_to_braille(request):
     return render(request, 'helper_pdf_to_braille.html', context)
 
 
+@cached_page
 def helper_image_transcription(request):
     """
     Upload image and get description using Gemini Vision API
@@ -263,6 +328,24 @@ def helper_image_transcription(request):
     
     if request.method == 'POST' and request.FILES.get('image_file'):
         image_file = request.FILES['image_file']
+        idempotency_key = request.headers.get('Idempotency-Key', '')[:128]
+        device_id = request.POST.get('device_id') or settings.DEFAULT_DEVICE_ID
+        if device_id not in settings.BRAILLE_DEVICES:
+            return _unknown_device(device_id)
+        fingerprint = request_hash(image_file.chunks()) if idempotency_key else ''
+        
+        # A retried upload gets the description it already produced
+        try:
+            job = idempotent_job(idempotency_key, device_id, fingerprint) if settings.DELIVERY_QUEUE else None
+        except IdempotencyConflict as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=409)
+        if job is not None:
+            return JsonResponse({
+                'status': 'success',
+                'description': job.text,
+                'firebase_result': deliver_text(job.text, device_id=device_id, idempotency_key=idempotency_key,
+                                                fingerprint=fingerprint)
+            })
         
         # Validate file type
         valid_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
@@ -294,7 +377,8 @@ def helper_image_transcription(request):
         # Save file
         fs = FileSystemStorage()
         try:
-            filename = fs.save(image_file.name, image_file)
+            with span('upload.save', size=image_file.size):
+                filename = fs.save(image_file.name, image_file)
             file_path = fs.path(filename)
         except Exception as e:
             return JsonResponse({
@@ -311,13 +395,15 @@ def helper_image_transcription(request):
             
             if result['status'] == 'success':
                 # Send description to Firebase
-                firebase_result = send_text_to_braille_device(result['description'])
+                firebase_result = deliver_text(result['description'], device_id=device_id,
+                                               idempotency_key=idempotency_key, fingerprint=fingerprint)
                 
                 # Clean up file - use try/except for Windows file locks
                 try:
                     import time
-                    time.sleep(0.5)  # Brief delay for file handle release
-                    fs.delete(filename)
+                    with span('upload.cleanup'):
+                        time.sleep(0.5)  # Brief delay for file handle release
+                        fs.delete(filename)
                 except:
                     pass  # Ignore deletion errors
                 
@@ -366,8 +452,14 @@ def voice_command(request):
             
             response = {'status': 'success'}
             
+            # Stop whatever the device is receiving ("stop listening" is handled in the browser)
+            if command.strip() in ('stop', 'cancel', 'stop reading', 'stop sending'):
+                with deadline_scope(settings.FIREBASE_REQUEST_DEADLINE):
+                    result = FirebaseService.stop_delivery(data.get('device_id') or settings.DEFAULT_DEVICE_ID)
+                response.update(result)
+                response['action'] = 'stopped'
             # Navigation commands
-            if 'helper' in command:
+            elif 'helper' in command:
                 response['action'] = 'navigate'
                 response['url'] = '/helper/'
             elif 'visually impaired' in command or 'blind' in command:
@@ -405,3 +497,80 @@ def voice_command(request):
             return JsonResponse({'status': 'error', 'message': str(e)})
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+
+
+def news_cache_stats(request):
+    """
+    Headline cache hit/miss/refresh counters for this worker
+    """
+    return JsonResponse(get_news_service().get_cache_stats())
+
+
+def news_dedup_stats(request):
+    """
+    Duplicate articles skipped and braille cells saved per day
+    """
+    return JsonResponse({'days': get_dedup_stats()})
+
+
+def delivery_events(request, job_id):
+    """
+    Live progress of a delivery job as server-sent events
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    if isinstance(request, ASGIRequest):
+        # Streamed from the event loop; no thread is held while it is open
+        stream = ajob_events(job_id, last_event_id)
+    else:
+        # One short answer; the browser polls by reconnecting
+        stream = job_events(job_id, last_event_id)
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # let proxies pass events through at once
+    return response
+
+
+def metrics(request):
+    """
+    Prometheus metrics of all workers, in the text exposition format
+    """
+    return HttpResponse(generate_latest(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@csrf_exempt
+def reading_open(request):
+    """
+    Start or resume reading a library document on a device
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+    
+    try:
+        data = json.loads(request.body)
+        device_id = data.get('device_id') or settings.DEFAULT_DEVICE_ID
+        if device_id not in settings.BRAILLE_DEVICES:
+            return _unknown_device(device_id)
+        result = get_reading_service().open_document(device_id, data['document_id'])
+        return JsonResponse(result)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+
+@csrf_exempt
+def reading_advance(request):
+    """
+    Report the reader's new window so the lookahead can be topped up
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+    
+    try:
+        data = json.loads(request.body)
+        device_id = data.get('device_id') or settings.DEFAULT_DEVICE_ID
+        if device_id not in settings.BRAILLE_DEVICES:
+            return _unknown_device(device_id)
+        result = get_reading_service().advance(device_id, data['document_id'], data['offset'])
+        return JsonResponse(result)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
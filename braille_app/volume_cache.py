@@ -0,0 +1,132 @@
+"""
+Volume Cache Module for Braille Display Website
+
+Read-through cache for Google Books volume lookups. Volume JSON is kept on
+disk (shared by all workers and kept across restarts) with an in-memory LRU in
+front. After the TTL an entry is revalidated with If-None-Match, so unchanged
+volumes cost a 304 instead of a full download.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+from .metrics import counter
+
+logger = logging.getLogger(__name__)
+
+
+VOLUME_CACHE_EVENTS = counter(
+    'braille_volume_cache_events_total', 'Volume cache hits, fetches, revalidations and stale serves', ['event']
+)
+
+
+class VolumeCache:
+    """
+    Two-level (memory LRU + disk) cache with ETag revalidation.
+    """
+
+    def __init__(self, directory=None, max_entries=None, ttl=None):
+        self.directory = str(directory or settings.BOOKS_VOLUME_CACHE_DIR)
+        self.max_entries = max_entries or settings.BOOKS_VOLUME_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.BOOKS_VOLUME_CACHE_TTL
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{name}.json')
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, entry):
+        self._remember(key, entry)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write volume cache entry: %s", e)
+
+    def _get_key_lock(self, key):
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def get(self, key, fetch):
+        """
+        Get a value, fetching or revalidating it when needed.
+
+        Args:
+            key (str): Cache key (volume id)
+            fetch (callable): fetch(etag) -> (status, data, etag). A status of
+                304 means the cached copy is still valid.
+
+        Returns:
+            The cached or fetched data, or None if nothing could be fetched
+        """
+        entry = self._load(key)
+        if entry and time.time() - entry['fetched_at'] < self.ttl:
+            VOLUME_CACHE_EVENTS.labels('hit').inc()
+            return entry['data']
+
+        # One fetch per key; concurrent callers wait and reuse its result
+        with self._get_key_lock(key):
+            entry = self._load(key)
+            if entry and time.time() - entry['fetched_at'] < self.ttl:
+                return entry['data']
+
+            try:
+                status, data, etag = fetch(entry['etag'] if entry else None)
+            except Exception as e:
+                logger.warning("Error fetching %s: %s", key, e)
+                VOLUME_CACHE_EVENTS.labels('stale' if entry else 'error').inc()
+                # Serve the expired copy rather than nothing
+                return entry['data'] if entry else None
+
+            if status == 304 and entry:
+                VOLUME_CACHE_EVENTS.labels('revalidated').inc()
+                entry = dict(entry, fetched_at=time.time())
+            else:
+                VOLUME_CACHE_EVENTS.labels('fetched').inc()
+                entry = {'data': data, 'etag': etag, 'fetched_at': time.time()}
+            self._store(key, entry)
+            return entry['data']
+
+    def clear(self):
+        """
+        Drop the in-memory entries (disk entries are kept).
+        """
+        with self._lock:
+            self._memory.clear()
@@ -31,9 +31,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'braille_app.middleware.MetricsMiddleware',
+    'braille_app.middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'braille_app.middleware.ClientRateLimitMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -69,6 +72,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Web and delivery worker processes share this database: WAL lets
+            # readers run during writes, and IMMEDIATE takes the write lock at
+            # the start of each transaction so job claims are serialised
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file (not the in-memory default) so tests see the same locking
+        # as the web and delivery worker processes
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -133,19 +147,97 @@ FIREBASE_CONFIG = {
 # Path to Firebase service account JSON (optional, for admin SDK)
 FIREBASE_CREDENTIALS_PATH = os.path.join(BASE_DIR, 'firebase-credentials.json')
 
+# Retry policy for every Firebase write (see braille_app/resilience.py)
+FIREBASE_RETRY = {
+    'attempts': 3,                  # Tries per write, the first included
+    'deadline': 5.0,                # Seconds per write, retries included
+    'attempt_timeout': 3.0,         # Longest single HTTP request
+    'base_delay': 0.1,              # Backoff before the first retry (doubles, jittered)
+    'max_delay': 1.0,
+    'budget_ratio': 0.1,            # Retries add at most 10% to write traffic...
+    'min_retries_per_second': 0.5,  # ...beyond this trickle
+    'failure_threshold': 5,         # Consecutive failures before failing fast
+    'reset_timeout': 30.0,          # Seconds to fail fast before probing again
+}
+
+# Seconds a page request may spend on Firebase writes in total: publishing a
+# slot is several writes, each with its own FIREBASE_RETRY deadline
+FIREBASE_REQUEST_DEADLINE = 8.0
+
 
 # ========================================
 # BRAILLE DEVICE CONFIGURATION
 # ========================================
-# Maximum characters the braille device can display at once
+# Default characters per chunk (for devices that do not set `cells`)
 DEVICE_CHAR_LIMIT = 80
 
-# Delay between sending chunks (in seconds) - adjust based on device needs
+# How text is broken into device windows: 'greedy' packs words in order,
+# 'optimal' minimises windows and split words over the whole text at several
+# times the CPU cost. Device profiles can opt in with 'chunk_mode'.
+CHUNK_MODE = 'greedy'
+
+# Allow 'optimal' mode to hyphenate words that would fit on a window
+CHUNK_HYPHENATE = False
+
+# Default delay between streamed chunks (for devices that do not set `refresh_seconds`)
 CHUNK_SEND_DELAY = 2
 
-# Firebase Realtime Database path where text is sent
+# Default path for devices with the 'stream' payload format
 FIREBASE_TEXT_PATH = '/braille_display/text'
 
+# Pre-rendered content slots and the pointer the device polls for the active one
+FIREBASE_SLOTS_PATH = '/braille_display/slots'
+FIREBASE_CURRENT_PATH = '/braille_display/current'
+
+# Reading sessions: windows sent ahead of the reader, enough for this many
+# seconds at the measured reading pace, within the min/max bounds
+READING_LOOKAHEAD_SECONDS = 120
+READING_LOOKAHEAD_MIN = 3
+READING_LOOKAHEAD_MAX = 40
+
+# Gaps longer than this (seconds) are treated as a break, not slow reading
+READING_PAUSE_SECONDS = 600
+
+# Device used when a request does not name one
+DEFAULT_DEVICE_ID = 'default'
+
+# Device registry (see braille_app/devices.py). Each profile sets:
+#   cells            characters shown at once (windows are chunked to this)
+#   refresh_seconds  time the device needs per window (paces 'stream' sends)
+#   format           'slot' (staged slot + pointer), 'text' (whole string) or 'stream'
+#   path             Firebase path the device reads (the pointer for 'slot')
+# 'slot' devices with different cell counts need their own `slots_path`.
+BRAILLE_DEVICES = {
+    'default': {
+        'name': 'ESP32 braille display',
+        'cells': 4,
+        'refresh_seconds': 1,
+        'format': 'slot',
+        'path': FIREBASE_CURRENT_PATH,
+    },
+    'simulator': {
+        'name': 'Web simulator (public/index.html)',
+        'cells': 1,
+        'refresh_seconds': 0.5,
+        'format': 'text',
+        'path': '/brailleText',
+    },
+}
+
+# Named groups of devices that receive the same content (e.g. a classroom)
+BRAILLE_DEVICE_GROUPS = {
+    'all': list(BRAILLE_DEVICES),
+}
+
+# Concurrent senders when fanning out to devices that need paced ('stream') writes
+FANOUT_WORKERS = 16
+
+# Per-device delivery lock (shared across workers): a lease lasts this many
+# seconds unless renewed by the next chunk, and a second sender waits up to the
+# timeout before giving up
+DEVICE_LOCK_TTL = 30
+DEVICE_LOCK_TIMEOUT = 10
+
 
 # ========================================
 # EXTERNAL API CONFIGURATIONS
@@ -171,3 +263,196 @@ BOOKS_SEARCH_MAX_RESULTS = 10
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 MAX_UPLOAD_SIZE = 10485760  # 10MB
+
+
+# ========================================
+# OUTBOUND API RATE LIMITS
+# ========================================
+# SQLite file for state shared between gunicorn workers (rate-limit counters, ...)
+SHARED_STATE_DB_PATH = BASE_DIR / 'shared_state.sqlite3'
+
+# Client-side token buckets per API. 'burst' is the request bucket capacity,
+# 'tokens_per_minute' limits model tokens (None = not limited), 'max_wait' is how
+# long a caller may queue for a slot and 'max_waiters' how many may queue per worker.
+API_RATE_LIMITS = {
+    'gemini': {
+        'requests_per_minute': 15,
+        'burst': 15,
+        'tokens_per_minute': 1000000,
+        'max_wait': 10,
+        'max_waiters': 4,
+    },
+    'newsapi': {
+        'requests_per_minute': 100 / (24 * 60),  # free tier: 100 requests per day
+        'burst': 10,
+        'tokens_per_minute': None,
+        'max_wait': 0,
+        'max_waiters': 0,
+    },
+    'google_books': {
+        'requests_per_minute': 60,
+        'burst': 10,
+        'tokens_per_minute': None,
+        'max_wait': 2,
+        'max_waiters': 8,
+    },
+}
+
+
+# ========================================
+# PAGE CACHE
+# ========================================
+# Shared by all gunicorn workers on the instance
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'django',
+        'KEY_PREFIX': 'braille',
+    }
+}
+
+# Static pages are rendered once per deploy version (Render sets
+# RENDER_GIT_COMMIT); unset falls back to a stamp of the source files
+DEPLOY_VERSION = os.environ.get('DEPLOY_VERSION') or os.environ.get('RENDER_GIT_COMMIT', '')[:12]
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', str(not DEBUG)) == 'True'
+PAGE_CACHE_SECONDS = 24 * 60 * 60
+
+
+# ========================================
+# INBOUND RATE LIMITS
+# ========================================
+# Per-client token buckets (per session, or per IP without one) for route
+# groups, keyed by URL name. Only the listed methods count (default POST).
+CLIENT_RATE_LIMITS = {
+    'send': {
+        'views': ['helper_custom_text', 'voice_command'],
+        'requests_per_minute': 30,
+        'burst': 10,
+    },
+    'ai': {
+        # Each request spends Gemini quota
+        'views': ['vi_ai_helper', 'helper_image_transcription'],
+        'requests_per_minute': 6,
+        'burst': 3,
+    },
+    'upload': {
+        'views': ['helper_pdf_to_braille', 'helper_image_transcription'],
+        'requests_per_minute': 10,
+        'burst': 3,
+    },
+}
+
+# Take the client address from the last X-Forwarded-For hop. Only turn this on
+# behind exactly one proxy that appends it (Render's; see render.yaml)
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', 'False') == 'True'
+
+
+# ========================================
+# NEWS CACHE
+# ========================================
+# Headlines younger than the fresh TTL are served from cache; up to the stale TTL
+# they are still served while one background refresh fetches a new copy (seconds)
+NEWS_CACHE_FRESH_TTL = 300
+NEWS_CACHE_STALE_TTL = 3600
+
+# Scheduled prefetch of every news category (see braille_app/news_prefetch.py).
+# Four categories once an hour stays within the NewsAPI free tier.
+NEWS_PREFETCH_AUTOSTART = os.environ.get('NEWS_PREFETCH_AUTOSTART', 'False') == 'True'
+NEWS_PREFETCH_INTERVAL = 3600   # seconds between refresh rounds
+NEWS_PREFETCH_WORKERS = 4       # concurrent category refreshes
+NEWS_PREFETCH_JITTER = 5        # max random delay before each fetch (seconds)
+NEWS_PREFETCH_RETRIES = 2       # quick retries per category within a round
+NEWS_PREFETCH_BACKOFF = 2       # base retry delay (seconds), doubled per attempt
+# Digests older than this (two missed rounds) are ignored and news is fetched live
+NEWS_DIGEST_MAX_AGE = 2 * NEWS_PREFETCH_INTERVAL
+
+# Skip news articles the reader already received under another category.
+# The window is how many recently delivered articles are remembered per session.
+NEWS_DEDUP_ENABLED = True
+NEWS_DEDUP_WINDOW = 50
+
+# Read-through cache for Google Books volume lookups (disk + in-memory LRU).
+# Entries older than the TTL are revalidated with If-None-Match.
+BOOKS_VOLUME_CACHE_DIR = BASE_DIR / 'cache' / 'volumes'
+BOOKS_VOLUME_CACHE_SIZE = 256
+BOOKS_VOLUME_CACHE_TTL = 24 * 60 * 60
+BOOKS_FETCH_WORKERS = 8
+
+# Imported public-domain books (see `python manage.py import_book`)
+BOOK_LIBRARY_DIR = BASE_DIR / 'library'
+
+
+# ========================================
+# METRICS
+# ========================================
+# Per-process metric files (see braille_app/metrics.py), exported at /metrics.
+# Files of exited processes are folded into archive.json; set to None to keep
+# metrics in process memory.
+METRICS_DIR = os.environ.get('METRICS_DIR') or BASE_DIR / 'metrics'
+
+
+# ========================================
+# TRACING
+# ========================================
+# Share of requests traced (0 to 1); untraced requests pay almost nothing
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.05'))
+# JSONL file the traces are appended to (None to only send the header)
+TRACE_FILE = os.environ.get('TRACE_FILE') or BASE_DIR / 'traces.jsonl'
+# Add a Server-Timing breakdown to traced responses
+TRACE_SERVER_TIMING = True
+
+
+# ========================================
+# LOGGING
+# ========================================
+# App logs go through an in-memory queue to a background writer thread
+# (see braille_app/log.py), so request threads never block on stdout.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {
+            '()': 'braille_app.log.queue_handler',
+            'fmt': LOG_FORMAT,
+            'queue_size': 10000,  # records buffered before new ones are dropped
+            'repeat_limit': 5,  # copies of one warning/error per window...
+            'repeat_window': 60,  # ...of this many seconds
+        },
+    },
+    'loggers': {
+        'braille_app': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+
+# ========================================
+# DELIVERY QUEUE
+# ========================================
+# Send endpoints queue DeliveryJob rows for delivery workers instead of
+# writing to Firebase inside the request (see braille_app/delivery_queue.py).
+# Run workers with `python manage.py run_delivery_worker`.
+DELIVERY_QUEUE = os.environ.get('DELIVERY_QUEUE', 'True') == 'True'
+# Worker thread inside the web process: unset (None) starts one only when no
+# worker has checked in recently, so runserver and single-process deploys
+# deliver on their own while the Procfile `worker` process takes over where it
+# runs. 'True' always starts one, 'False' never does.
+DELIVERY_WORKER_AUTOSTART = {'True': True, 'False': False}.get(os.environ.get('DELIVERY_WORKER_AUTOSTART', ''))
+DELIVERY_WORKER_CONCURRENCY = 4  # jobs run at once per worker
+DELIVERY_LEASE_SECONDS = 30      # a job whose worker stops renewing is resumed after this
+DELIVERY_POLL_INTERVAL = 0.5     # seconds between checks for new jobs
+DELIVERY_MAX_ATTEMPTS = 5        # failed attempts before a job is given up
+DELIVERY_JOB_RETENTION_DAYS = 7  # finished jobs are deleted after this
+DELIVERY_PRUNE_INTERVAL = 3600   # seconds between sweeps for old jobs
+
+# Live progress streams (server-sent events) for delivery jobs
+DELIVERY_EVENTS_POLL_INTERVAL = 0.25  # seconds between progress checks
+DELIVERY_EVENTS_MAX_SECONDS = 600     # streams end after this; browsers reconnect and resume
+DELIVERY_EVENTS_RETRY_MS = 2000       # reconnect delay suggested to the browser
+DELIVERY_EVENTS_WSGI_RETRY_MS = 1000  # poll interval under WSGI, where each request answers at once
@@ -25,9 +25,19 @@ Adafruit_PWMServoDriver pca1 = Adafruit_PWMServoDriver(0x40);
 Adafruit_PWMServoDriver pca2 = Adafruit_PWMServoDriver(0x41);
 
 uint16_t pwmSpeed = 2000;
-int currentPos = 0;          
+int currentChunk = 0;        // window of the slot currently shown
+int totalChunks = 0;
 int lastButtonState = LOW;   
-String fullText = "";        
+String windowText = "";      // letters of the current window
+String slotPath = "";        
+String currentVersion = "";  // version of the slot currently shown
+
+// The server flips this small pointer to a pre-staged content slot.
+// Only the version string is polled; the slot is read one window at a time.
+// The server sizes windows for this device's 4 cells (BRAILLE_DEVICES['default']),
+// so a window never cuts a word that could have fitted.
+#define CURRENT_POINTER_PATH "/braille_display/current"
+#define CELL_COUNT 4
 
 struct BrailleChar { bool dots[6]; };
 
@@ -90,11 +100,17 @@ String filterText(String input) {
   return filtered;
 }
 
+bool loadWindow(int index) {
+  if (!Firebase.getString(fbdo, slotPath + "/chunks/" + String(index))) return false;
+  currentChunk = index;
+  windowText = filterText(fbdo.stringData());
+  return true;
+}
+
 void displayCurrentWindow() {
-  Serial.printf("\n--- Window: %d to %d ---\n", currentPos, currentPos + 3);
-  for (int i = 0; i < 4; i++) {
-    int charIdx = currentPos + i;
-    char c = (charIdx < fullText.length()) ? fullText[charIdx] : ' ';
+  Serial.printf("\n--- Window: %d of %d ---\n", currentChunk + 1, totalChunks);
+  for (int i = 0; i < CELL_COUNT; i++) {
+    char c = (i < windowText.length()) ? windowText[i] : ' ';
     driveBrailleCell(i, c, pwmSpeed);
     Serial.print(c);
   }
@@ -123,20 +139,23 @@ void setup() {
 }
 
 void loop() {
-  if (Firebase.getString(fbdo, "/brailleText")) {
-    String cleaned = filterText(fbdo.stringData());
-    if (cleaned != fullText) {
-      fullText = cleaned;
-      currentPos = 0; 
-      displayCurrentWindow();
+  if (Firebase.getString(fbdo, CURRENT_POINTER_PATH "/version")) {
+    String version = fbdo.stringData();
+    if (version != currentVersion && Firebase.getString(fbdo, CURRENT_POINTER_PATH "/path")) {
+      slotPath = fbdo.stringData();
+      if (Firebase.getInt(fbdo, CURRENT_POINTER_PATH "/total_chunks")) {
+        totalChunks = fbdo.intData();
+        if (totalChunks > 0 && loadWindow(0)) {
+          currentVersion = version;
+          displayCurrentWindow();
+        }
+      }
     }
   }
 
   int currentButtonState = digitalRead(BUTTON_PIN);
   if (currentButtonState == HIGH && lastButtonState == LOW) {
-    if (fullText.length() > 0) {
-      currentPos += 4;
-      if (currentPos >= fullText.length()) currentPos = 0;
+    if (totalChunks > 0 && loadWindow((currentChunk + 1) % totalChunks)) {
       displayCurrentWindow();
     }
   }